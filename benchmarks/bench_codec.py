@@ -0,0 +1,55 @@
+"""
+Time the wire codec on the request/response hot path.
+
+The string and hex based header decoding that ``devns.dns`` used to ship is
+reproduced here so the two can be compared on the same interpreter::
+
+    PYTHONPATH=. python benchmarks/bench_codec.py
+"""
+from __future__ import print_function
+
+import timeit
+
+from devns.dns import Header, Query, Request, Response
+
+PACKET = (
+    b"\xdb\xab\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+    b"\x04test\x05local\x03dev\x00\x00\x01\x00\x01"
+)
+
+
+def _legacy_bytes_to_int(value):
+    return int("".join("%02x" % x for x in bytearray(value)), 16)
+
+
+def legacy_header(data):
+    flags = format(_legacy_bytes_to_int(data[2:4]), "016b")
+    return (
+        _legacy_bytes_to_int(data[:2]),
+        int(flags[0], 2), int(flags[1:5], 2), int(flags[5], 2),
+        int(flags[6], 2), int(flags[7], 2), int(flags[8], 2),
+        int(flags[9], 2), int(flags[10], 2), int(flags[11], 2),
+        int(flags[12:], 2),
+        _legacy_bytes_to_int(data[4:6]), _legacy_bytes_to_int(data[6:8]),
+        _legacy_bytes_to_int(data[8:10]), _legacy_bytes_to_int(data[10:12]),
+    )
+
+
+def main(number=100000):
+    request = Request.from_bytes(PACKET)
+    response = Response(request.header, request.query, "10.0.0.1")
+    cases = (
+        ("legacy header decode", lambda: legacy_header(PACKET)),
+        ("Header.from_bytes", lambda: Header.from_bytes(PACKET)),
+        ("Header.to_bytes", request.header.to_bytes),
+        ("Query.from_bytes", lambda: Query.from_bytes(PACKET)),
+        ("Request.from_bytes", lambda: Request.from_bytes(PACKET)),
+        ("Response.to_bytes", response.to_bytes),
+    )
+    for name, func in cases:
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print("%-24s %8.3f us/op" % (name, elapsed / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
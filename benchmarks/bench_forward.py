@@ -0,0 +1,51 @@
+"""
+Measure what forwarding a question costs on top of the upstream's own time,
+against a stand-in upstream on loopback that answers straight away::
+
+    PYTHONPATH=. python benchmarks/bench_forward.py
+
+"pooled" reuses the sockets opened up front, "fresh" opens and binds a new
+one to a random port for every question, as a pool of size 0 does.
+"""
+from __future__ import print_function
+
+import socket
+import timeit
+import threading
+
+from devns.dns import Header, Query, Request
+from devns.forward import Forwarder
+
+
+def standin():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            data, client = sock.recvfrom(65535)
+            # Flip QR on and send the question straight back.
+            sock.sendto(data[:2] + b"\x81\x80" + data[4:], client)
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return sock.getsockname()
+
+
+def main(number=5000):
+    upstream = standin()
+    query = Query(1, ("example", "com"))
+    message = Request(Header(0x1234, rd=1, query=1), query).to_bytes()
+    for name, size in (("pooled", 8), ("fresh", 0)):
+        forwarder = Forwarder([upstream], timeout=1, size=size)
+        forwarder.open()
+        timing = min(timeit.repeat(
+            lambda: forwarder.forward(query, message), number=number, repeat=3
+        )) / number
+        forwarder.close()
+        print("%-7s %6.1f us per question" % (name, timing * 1e6))
+
+
+if __name__ == "__main__":
+    main()
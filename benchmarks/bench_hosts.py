@@ -0,0 +1,70 @@
+"""
+Measure what a hosts file costs to load, keep and edit, at the sizes of the
+blocklists people point these at::
+
+    PYTHONPATH=. python benchmarks/bench_hosts.py
+
+Memory is what tracemalloc sees allocated by the index, divided by the
+number of names in it.
+"""
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import timeit
+import tempfile
+import tracemalloc
+
+from devns.hosts import HostsFile
+
+
+def write(path, count, edited=0):
+    with open(path, "w") as hosts:
+        hosts.write("# generated for bench_hosts.py\n")
+        for index in range(count):
+            address = "0.0.0.0" if index >= edited else "10.0.0.1"
+            hosts.write("%s ads%d.tracker%d.example.com\n" % (
+                address, index, index % 1000
+            ))
+    # Make sure the edit shows, however coarse the clock.
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 1))
+
+
+def main(sizes=(10000, 100000, 300000), edits=10):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "hosts")
+    try:
+        for count in sizes:
+            write(path, count)
+            tracemalloc.start()
+            hosts = HostsFile(path)
+            hosts.load()
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            hosts = HostsFile(path)
+            started = time.time()
+            hosts.load()
+            loaded = time.time() - started
+            write(path, count, edited=edits)
+            started = time.time()
+            changes = hosts.reload()
+            reloaded = time.time() - started
+            labels = ("ads5", "tracker5", "example", "com")
+            lookup = min(timeit.repeat(
+                lambda: hosts.lookup(labels), number=100000, repeat=3
+            )) / 100000
+            print(
+                "%7d names  load %7.1f ms  %5.0f bytes/name  "
+                "reload (%d+%d lines) %6.1f ms  lookup %5.2f us" % (
+                    len(hosts), loaded * 1e3, float(memory) / len(hosts),
+                    changes[0], changes[1], reloaded * 1e3, lookup * 1e6
+                )
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Time each way of listing interface addresses against forking ``ifconfig``,
+which is what address discovery used to do on every refresh::
+
+    PYTHONPATH=. python benchmarks/bench_interfaces.py
+"""
+from __future__ import print_function
+
+import socket
+import timeit
+
+from devns import interfaces
+from devns.config import Config
+from devns.server import DevNS
+
+
+def main(number=200):
+    server = DevNS(Config())
+    cases = [
+        ("%s (v4)" % name, lambda backend=backend: backend(socket.AF_INET))
+        for name, backend in interfaces.BACKENDS.items()
+    ] + [
+        ("%s (v6)" % name, lambda backend=backend: backend(socket.AF_INET6))
+        for name, backend in interfaces.BACKENDS.items()
+    ] + [
+        ("ifconfig (v4)", server._get_address_by_ifconfig),
+    ]
+    for name, func in cases:
+        try:
+            func()
+        except Exception as e:
+            print("%-24s unavailable: %s" % (name, e))
+            continue
+        elapsed = min(timeit.repeat(func, number=number, repeat=3))
+        print("%-24s %10.1f us/op" % (name, elapsed / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
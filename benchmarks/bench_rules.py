@@ -0,0 +1,63 @@
+"""
+Time rule lookups against a linear scan over the same rules, as the number
+of rules grows::
+
+    PYTHONPATH=. python benchmarks/bench_rules.py
+"""
+from __future__ import print_function
+
+import timeit
+import fnmatch
+
+from devns.rules import Rules
+
+NAMES = (
+    ("svc", "team0", "api", "dev"),     # wildcard hit
+    ("db", "team1", "local", "co"),     # exact hit
+    ("www", "example", "com"),          # miss
+)
+
+
+def make_rules(count):
+    rules = []
+    for index in range(count):
+        if index % 2:
+            rules.append("*.team%d.api.dev=10.0.%d.%d" % (
+                index // 2, index // 256 % 256, index % 256
+            ))
+        else:
+            rules.append("db.team%d.local.co=127.0.0.1" % (index // 2 + 1))
+    return rules
+
+
+def linear(rules):
+    patterns = [rule.split("=") for rule in rules]
+
+    def lookup(labels):
+        name = ".".join(labels).lower()
+        for pattern, address in patterns:
+            if fnmatch.fnmatchcase(name, pattern):
+                return address
+    return lookup
+
+
+def main(number=20000):
+    for count in (10, 1000, 10000):
+        rules = make_rules(count)
+        cases = (
+            ("trie", Rules(rules).lookup),
+            ("linear scan", linear(rules)),
+        )
+        for name, lookup in cases:
+            loops = number if name == "trie" else max(number // count, 10)
+            elapsed = min(timeit.repeat(
+                lambda: [lookup(labels) for labels in NAMES],
+                number=loops, repeat=3
+            ))
+            print("%6d rules  %-12s %10.2f us/lookup" % (
+                count, name, elapsed / loops / len(NAMES) * 1e6
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Time from starting ``devns`` to its first answer, with and without the
+addresses saved by an earlier run::
+
+    PYTHONPATH=. python benchmarks/bench_startup.py
+
+Each case starts a fresh server process and queries it until it answers, so
+interpreter startup is included. Discovery that falls back on resolving the
+host's FQDN can take far longer on a network with broken DNS, which is
+exactly what starting from the state file avoids.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import subprocess
+
+QUERY = (
+    b"Kj\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+    b"\x04test\x03dev\x00\x00\x01\x00\x01"
+)
+
+
+def _free_port():
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+
+def first_answer(args, timeout=30):
+    """Start a server with ``args``, returning seconds to its first answer."""
+    port = _free_port()
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(0.001)
+    started = time.time()
+    process = subprocess.Popen([
+        sys.executable, "-m", "devns.cli", "--host", "127.0.0.1", "--port",
+        str(port), "--no-resolver", "--no-tcp",
+    ] + args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while time.time() - started < timeout:
+            client.sendto(QUERY, ("127.0.0.1", port))
+            try:
+                client.recv(512)
+            except socket.error:
+                continue
+            return time.time() - started
+        raise RuntimeError("no answer within %ss" % timeout)
+    finally:
+        client.close()
+        process.send_signal(signal.SIGINT)
+        process.communicate()
+
+
+def main(repeat=5):
+    directory = tempfile.mkdtemp()
+    state_file = os.path.join(directory, "state.json")
+    try:
+        first_answer(["--state-file", state_file])
+        cases = (
+            ("ifconfig discovery", ["--no-state", "--discovery", "ifconfig"]),
+            ("native discovery", ["--no-state"]),
+            ("state file", ["--state-file", state_file]),
+            ("configured address", [
+                "--no-state", "--address", "10.0.0.1", "--address6", "fd00::1"
+            ]),
+        )
+        for name, args in cases:
+            elapsed = sorted(first_answer(args) for _ in range(repeat))
+            print("%-24s %8.1f ms (best %.1f ms)" % (
+                name, elapsed[len(elapsed) // 2] * 1e3, elapsed[0] * 1e3
+            ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure what a zone file costs to load and keep, and what answering from it
+costs, for zones of a few thousand to a few hundred thousand records::
+
+    PYTHONPATH=. python benchmarks/bench_zone.py
+
+Memory is what tracemalloc sees allocated by the zone, divided by the
+number of records in it.
+"""
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import timeit
+import tempfile
+import tracemalloc
+
+from devns.dns import DNS, Query
+from devns.zone import Zone
+
+
+def write(path, count):
+    # A mix like a generated internal zone: mostly addresses, with some
+    # aliases, service records and text.
+    with open(path, "w") as zone:
+        zone.write(
+            "$ORIGIN bench.dev.\n$TTL 300\n"
+            "@ IN SOA ns hostmaster ( 1 3600 600 86400 60 )\n"
+            "  IN NS ns\nns IN A 10.0.0.1\n"
+        )
+        for index in range(count // 4):
+            zone.write(
+                "host%d.rack%d IN A 10.%d.%d.%d\n"
+                "               IN AAAA fd00::%x:%x\n"
+                "alias%d IN CNAME host%d.rack%d\n"
+                "_http._tcp.host%d.rack%d IN SRV 0 0 80 host%d.rack%d\n" % (
+                    index, index % 100,
+                    index >> 16 & 255, index >> 8 & 255, index & 255,
+                    index >> 16, index & 0xffff,
+                    index, index, index % 100,
+                    index, index % 100, index, index % 100
+                )
+            )
+
+
+def main(sizes=(10000, 100000, 300000)):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.dev.zone")
+    try:
+        for count in sizes:
+            write(path, count)
+            tracemalloc.start()
+            zone = Zone.load(path)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            started = time.time()
+            zone = Zone.load(path)
+            loaded = time.time() - started
+            timings = []
+            for name, rrtype in (
+                ("host5.rack5", DNS.RRType.A),
+                ("alias5", DNS.RRType.A),
+                ("nope", DNS.RRType.A),
+            ):
+                query = Query(rrtype, tuple(name.split(".")) + zone.origin)
+                timings.append(min(timeit.repeat(
+                    lambda: zone.answers(query), number=100000, repeat=3
+                )) / 100000)
+            print(
+                "%7d records  load %7.1f ms  %5.0f bytes/record  "
+                "answer %5.2f us  via CNAME %5.2f us  missing %5.2f us" % (
+                    len(zone), loaded * 1e3, float(memory) / len(zone),
+                    timings[0] * 1e6, timings[1] * 1e6, timings[2] * 1e6
+                )
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -43,5 +43,5 @@ __author__ = "Dave Hayes"
 __license__ = "MIT"
 __copyright__ = "Copyright (c) 2017 Dave Hayes"
 
-from .dns import DNS  # noqa
+from .dns import DNS, CLASSES, OPCODES, RCODES, RRTYPES  # noqa
 from . import server  # noqa
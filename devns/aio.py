@@ -0,0 +1,91 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import logging
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def available():
+    """Whether the asyncio serving mode can be used here."""
+    return asyncio is not None
+
+
+class DNSProtocol(asyncio.DatagramProtocol if asyncio else object):
+    """
+    Answers datagrams with :meth:`DevNS._build_response` from inside an
+    event loop, so other coroutines can share the loop with the server.
+    Responses from upstream come back into ``loop`` from the forwarder's
+    thread, so waiting on them doesn't hold the loop up.
+    """
+
+    def __init__(self, server, loop):
+        self.server = server
+        self.loop = loop
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+    def datagram_received(self, data, client):
+        logger.debug("Request from %s:%s", *client[:2])
+        try:
+            response = self.server._build_response(
+                data, reply=lambda response: self.loop.call_soon_threadsafe(
+                    self._send, response, client
+                )
+            )
+        except Exception:
+            logger.exception("Failed answering request, skipping it")
+            return
+        self._send(response, client)
+
+    def _send(self, response, client):
+        # Closed meanwhile, for a response from upstream.
+        if response and self.transport is not None:
+            self.transport.sendto(response, client)
+
+    def error_received(self, exc):
+        logger.debug("Ignoring socket error: %s", exc)
+
+
+def endpoint(server, loop=None, connection=None):
+    """
+    Return a coroutine which starts answering on ``connection`` (by default
+    ``server.connection``) in ``loop`` and resolves to a
+    ``(transport, protocol)`` pair.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    return loop.create_datagram_endpoint(
+        lambda: DNSProtocol(server, loop),
+        sock=connection or server.connection
+    )
+
+
+def serve_forever(server, loop=None):
+    """Answer on every socket ``server`` has bound until the loop stops."""
+    if loop is None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    transports = [
+        loop.run_until_complete(endpoint(server, loop, connection))[0]
+        for connection in server.connections or [server.connection]
+    ]
+    try:
+        loop.run_forever()
+    finally:
+        for transport in transports:
+            transport.close()
+        loop.run_until_complete(asyncio.sleep(0))
+    return 0
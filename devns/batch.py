@@ -0,0 +1,245 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import sys
+import errno
+import ctypes
+import ctypes.util
+import select
+import socket
+import struct
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+_SOCKADDR_SIZE = 128  # sizeof(struct sockaddr_storage)
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+def _load_libc():
+    # The structures above are Linux's. Others with recvmmsg(2), like
+    # FreeBSD, lay struct mmsghdr out differently.
+    if not sys.platform.startswith("linux"):
+        return None, None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        recvmmsg = libc.recvmmsg
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError, TypeError):
+        return None, None
+    recvmmsg.restype = sendmmsg.restype = ctypes.c_int
+    recvmmsg.argtypes = (
+        ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int,
+        ctypes.c_void_p
+    )
+    sendmmsg.argtypes = (
+        ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int
+    )
+    return recvmmsg, sendmmsg
+
+
+_recvmmsg, _sendmmsg = _load_libc()
+
+
+def available():
+    """Whether Linux's recvmmsg(2) and sendmmsg(2) can be used here."""
+    return _recvmmsg is not None
+
+
+def _sockaddr_to_address(sockaddr):
+    family = struct.unpack_from("=H", sockaddr)[0]
+    port = struct.unpack_from("!H", sockaddr, 2)[0]
+    if family == socket.AF_INET6:
+        return socket.inet_ntop(socket.AF_INET6, sockaddr[8:24]), port
+    return socket.inet_ntoa(sockaddr[4:8]), port
+
+
+def _wait(connection, write=False):
+    # The sockets have a timeout set, which makes them non-blocking as far
+    # as the kernel is concerned, so we do the waiting ourselves.
+    fds = ([connection], [], []) if not write else ([], [connection], [])
+    ready = select.select(*(fds + (connection.gettimeout(), )))
+    return any(ready)
+
+
+class Batch(object):
+    """
+    Receives up to ``size`` datagrams with one recvmmsg(2) call, straight
+    into a ring of preallocated buffers, and sends the replies queued with
+    :meth:`reply` with one sendmmsg(2) call.
+
+    Datagrams are handed out as memoryviews over the receive buffers, so
+    they're only valid until the next :meth:`recv`.
+    """
+
+    def __init__(self, connection, size=32, bufsize=1232):
+        self.connection = connection
+        self.size = size
+        self.bufsize = bufsize
+        self.count = 0
+        self._buffers = [bytearray(bufsize) for _ in range(size)]
+        self._views = [memoryview(buffer) for buffer in self._buffers]
+        self._arrays = [
+            (ctypes.c_char * bufsize).from_buffer(buffer)
+            for buffer in self._buffers
+        ]
+        self._names = [
+            ctypes.create_string_buffer(_SOCKADDR_SIZE) for _ in range(size)
+        ]
+        self._recv_iov = (_IOVec * size)()
+        self._recv = (_MMsgHdr * size)()
+        self._send_iov = (_IOVec * size)()
+        self._send = (_MMsgHdr * size)()
+        self._pending = []
+        for index in range(size):
+            self._recv_iov[index].iov_base = ctypes.addressof(
+                self._arrays[index]
+            )
+            self._recv_iov[index].iov_len = bufsize
+            header = self._recv[index].msg_hdr
+            header.msg_name = ctypes.addressof(self._names[index])
+            header.msg_iov = ctypes.pointer(self._recv_iov[index])
+            header.msg_iovlen = 1
+            header = self._send[index].msg_hdr
+            header.msg_name = ctypes.addressof(self._names[index])
+            header.msg_iov = ctypes.pointer(self._send_iov[index])
+            header.msg_iovlen = 1
+
+    def recv(self):
+        """Wait for and receive a batch, returning how many arrived."""
+        self.count = 0
+        if not _wait(self.connection):
+            return 0
+        for index in range(self.size):
+            self._recv[index].msg_hdr.msg_namelen = _SOCKADDR_SIZE
+        count = _recvmmsg(
+            self.connection.fileno(), self._recv, self.size, MSG_DONTWAIT,
+            None
+        )
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return 0
+            raise socket.error(error, "recvmmsg: %s" % errno.errorcode.get(
+                error, error
+            ))
+        self.count = count
+        return count
+
+    def datagram(self, index):
+        return self._views[index][:self._recv[index].msg_len]
+
+    def client(self, index):
+        return _sockaddr_to_address(self._names[index].raw)
+
+    def reply(self, index, response):
+        send = self._send[len(self._pending)]
+        send.msg_hdr.msg_namelen = self._recv[index].msg_hdr.msg_namelen
+        send.msg_hdr.msg_name = ctypes.addressof(self._names[index])
+        iov = self._send_iov[len(self._pending)]
+        iov.iov_base = ctypes.cast(ctypes.c_char_p(response), ctypes.c_void_p)
+        iov.iov_len = len(response)
+        # Keep the bytes alive until they've been sent.
+        self._pending.append(response)
+
+    def flush(self):
+        """Send every queued reply, returning how many went out."""
+        total = len(self._pending)
+        sent = 0
+        while sent < total:
+            count = _sendmmsg(
+                self.connection.fileno(),
+                ctypes.cast(
+                    ctypes.byref(self._send[sent]), ctypes.POINTER(_MMsgHdr)
+                ),
+                total - sent, MSG_DONTWAIT
+            )
+            if count >= 0:
+                sent += count
+                continue
+            error = ctypes.get_errno()
+            if error == errno.EINTR:
+                continue
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK):
+                if _wait(self.connection, write=True):
+                    continue
+            logger.warning(
+                "Dropping a reply: %s", errno.errorcode.get(error, error)
+            )
+            sent += 1
+        del self._pending[:]
+        return sent
+
+
+class FallbackBatch(object):
+    """
+    :class:`Batch` for platforms without recvmmsg(2): one datagram per call
+    via ``recvfrom_into`` into a preallocated buffer, replies sent right
+    away.
+    """
+
+    def __init__(self, connection, size=1, bufsize=1232):
+        self.connection = connection
+        self.size = 1
+        self.bufsize = bufsize
+        self.count = 0
+        self._buffer = bytearray(bufsize)
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        self._client = None
+
+    def recv(self):
+        self.count = 0
+        self._length, self._client = self.connection.recvfrom_into(
+            self._buffer
+        )
+        self.count = 1
+        return 1
+
+    def datagram(self, index):
+        return self._view[:self._length]
+
+    def client(self, index):
+        return self._client
+
+    def reply(self, index, response):
+        self.connection.sendto(response, self._client)
+
+    def flush(self):
+        return 0
+
+
+def new_batch(connection, size=32, bufsize=1232):
+    """Return a :class:`Batch`, or a :class:`FallbackBatch` if unavailable."""
+    if available() and size > 1:
+        return Batch(connection, size, bufsize)
+    logger.debug("recvmmsg unavailable, falling back to recvfrom_into")
+    return FallbackBatch(connection, size, bufsize)
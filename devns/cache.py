@@ -0,0 +1,71 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import struct
+import logging
+import threading
+from collections import OrderedDict
+
+from .dns import RA, RD
+
+
+logger = logging.getLogger(__name__)
+
+_ID_FLAGS = struct.Struct("!HH")
+_RECURSION = RD | RA
+
+
+class ResponseCache(object):
+    """
+    Encoded responses keyed by question, minus the transaction ID and flags.
+
+    Everything after the ID of a response only depends on the question and
+    the address we answer with, except for RD, which is copied from the
+    request, and RA, which follows it. So we keep those bytes around, and
+    per request only pack a fresh ID and the flags with RD and RA patched
+    in front of them; the rest of the flags, like TC, stay as they were.
+    Entries are evicted least recently used first once ``size`` is reached.
+    It's safe to share between threads.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, key):
+        return key in self._templates
+
+    def get(self, key, id, rd=0):
+        with self._lock:
+            try:
+                template = self._templates.pop(key)
+            except KeyError:
+                return None
+            self._templates[key] = template
+        flags, template = template
+        return _ID_FLAGS.pack(id, flags | _RECURSION if rd else flags) + (
+            template
+        )
+
+    def set(self, key, response):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._templates.pop(key, None)
+            while len(self._templates) >= self.size:
+                self._templates.popitem(last=False)
+            flags = _ID_FLAGS.unpack_from(response)[1] & ~_RECURSION
+            self._templates[key] = (flags, response[_ID_FLAGS.size:])
+
+    def clear(self):
+        with self._lock:
+            if self._templates:
+                logger.debug(
+                    "Dropping %d cached responses", len(self._templates)
+                )
+            self._templates.clear()
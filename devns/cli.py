@@ -3,7 +3,36 @@ import logging
 import argparse
 
 from .server import DevNS
-from . import config, __version__
+from .dns import MAX_PAYLOAD, MAX_UDP
+from . import config, forward, rules, __version__
+
+
+def _rule(rule):
+    try:
+        rules.parse(rule)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return rule
+
+
+def _upstream(upstream):
+    try:
+        forward.parse(upstream)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return upstream
+
+
+def _payload(payload):
+    try:
+        payload = int(payload)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%r isn't a number" % payload)
+    if not MAX_UDP <= payload <= MAX_PAYLOAD:
+        raise argparse.ArgumentTypeError(
+            "%d isn't between %d and %d" % (payload, MAX_UDP, MAX_PAYLOAD)
+        )
+    return payload
 
 
 def parse_args(args=None, config=config):
@@ -36,15 +65,117 @@ def parse_args(args=None, config=config):
         "--ttl", "-t", type=int, metavar="SECONDS",
         help="how often to refresh the address"
     )
+    address.add_argument(
+        "--address6", "-6", type=str, metavar="ADDRESS6",
+        help="IPv6 address to respond to AAAA queries with"
+    )
+    address.add_argument(
+        "--discovery", type=str, nargs="+", metavar="BACKEND",
+        choices=("netlink", "ioctl", "proc", "ifconfig"),
+        help="how to list interface addresses, first working one wins "
+        "(netlink, ioctl, proc, ifconfig)"
+    )
+    address.add_argument(
+        "--no-watch", action="store_false", dest="watch",
+        help="don't watch for address changes, only refresh every --ttl "
+        "seconds"
+    )
+    address.add_argument(
+        "--rules", type=_rule, nargs="+", metavar="PATTERN=ADDRESS",
+        help="answer names matching PATTERN, like db.local.dev or "
+        "*.api.dev, with ADDRESS instead"
+    )
+    address.add_argument(
+        "--hosts-file", type=str, metavar="FILE", dest="hosts_file",
+        help="answer the names in this hosts file with their addresses, "
+        "picking up edits as they're made"
+    )
+    address.add_argument(
+        "--zone-files", type=str, nargs="+", metavar="FILE",
+        dest="zone_files",
+        help="answer for the zones in these RFC 1035 zone files from their "
+        "records"
+    )
+    address.add_argument(
+        "--no-wildcard", action="store_false", dest="wildcard",
+        help="only answer names from --rules, --hosts-file and "
+        "--zone-files, saying the rest don't exist"
+    )
+    address.add_argument(
+        "--state-file", type=str, metavar="FILE", dest="state_file",
+        help="where to remember addresses between runs, to answer with "
+        "them while they're rediscovered"
+    )
+    address.add_argument(
+        "--no-state", action="store_const", const=None, dest="state_file",
+        help="always discover addresses before answering"
+    )
 
     listen = parser.add_argument_group("Network")
     listen.add_argument("--host", "-H", type=str, help="address to listen on")
     listen.add_argument("--port", "-p", type=int, help="port to listen on")
+    listen.add_argument(
+        "--listen", "-l", type=str, nargs="+", metavar="ADDRESS",
+        help="more addresses to listen on, IPv4 or IPv6, on the same port"
+    )
+    listen.add_argument(
+        "--max-payload", type=_payload, metavar="BYTES", dest="max_payload",
+        help="largest UDP message to accept or send to EDNS clients, "
+        "512 to 65535"
+    )
+    listen.add_argument(
+        "--no-tcp", action="store_false", dest="tcp",
+        help="don't answer over TCP"
+    )
+    listen.add_argument(
+        "--tcp-connections", type=int, metavar="CONNECTIONS",
+        dest="tcp_connections", help="most TCP connections to keep open"
+    )
+    listen.add_argument(
+        "--tcp-timeout", type=float, metavar="SECONDS", dest="tcp_timeout",
+        help="close TCP connections idle for this long"
+    )
+
+    performance = parser.add_argument_group("Performance")
+    performance.add_argument(
+        "--mode", "-m", choices=("blocking", "threaded", "asyncio"),
+        help="serve from a blocking loop, a thread pool or an asyncio event "
+        "loop"
+    )
+    performance.add_argument(
+        "--batch", type=int, metavar="DATAGRAMS", dest="batch_size",
+        help="receive and answer up to this many datagrams per system call "
+        "(blocking mode only)"
+    )
+    performance.add_argument(
+        "--min-threads", type=int, metavar="THREADS", dest="min_threads",
+        help="threads to keep around in threaded mode"
+    )
+    performance.add_argument(
+        "--max-threads", type=int, metavar="THREADS", dest="max_threads",
+        help="most threads to answer from in threaded mode"
+    )
+    performance.add_argument(
+        "--cache-size", "-c", type=int, metavar="ENTRIES", dest="cache_size",
+        help="how many encoded responses to keep (0 disables the cache)"
+    )
+    performance.add_argument(
+        "--workers", "-w", type=int, metavar="PROCESSES",
+        help="how many processes to answer from (Linux and BSD)"
+    )
+    performance.add_argument(
+        "--pin-cpus", action="store_true", dest="pin_cpus",
+        help="pin each worker process to its own CPU (Linux)"
+    )
+    performance.add_argument(
+        "--pool-size", type=int, metavar="REQUESTS", dest="pool_size",
+        help="how many request objects to recycle (0 disables pooling)"
+    )
 
     resolver_group = parser.add_argument_group("Resolver")
     resolver_group.add_argument(
         "--domains", "-d", type=str, nargs="*", metavar="DOMAIN",
-        help="domains to create resolver files for"
+        help="domains to answer for and create resolver files for"
     )
     resolver_group.add_argument(
         "--resolver-dir", "-rd", type=str, metavar="DIRECTORY",
@@ -55,6 +186,24 @@ def parse_args(args=None, config=config):
         help="disable creating resolver files"
     )
 
+    forwarding = parser.add_argument_group("Forwarding")
+    forwarding.add_argument(
+        "--upstreams", type=_upstream, nargs="+",
+        metavar="ADDRESS[:PORT]",
+        help="ask these servers about names outside --domains instead of "
+        "refusing them, IPv6 with a port as [ADDRESS]:PORT"
+    )
+    forwarding.add_argument(
+        "--upstream-timeout", type=float, metavar="SECONDS",
+        dest="upstream_timeout",
+        help="how long to wait for each upstream before trying the next"
+    )
+    forwarding.add_argument(
+        "--upstream-sockets", type=int, metavar="SOCKETS",
+        dest="upstream_sockets",
+        help="UDP sockets to keep open for forwarding, each on a random port"
+    )
+
     parser.set_defaults(**config.DEFAULTS)
     return parser.parse_args(args, namespace=config)
 
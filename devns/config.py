@@ -1,3 +1,4 @@
+import os
 import logging
 
 from six import iteritems
@@ -12,14 +13,40 @@ logger = logging.getLogger(__name__)
 class Config(object):
     DEFAULTS = dict(
         address=None,
+        address6=None,
+        batch_size=0,
+        cache_size=1024,
+        discovery=("netlink", "ioctl", "proc", "ifconfig"),
         domains=("dev", ),
         host="",
+        hosts_file=None,
+        listen=(),
         log_level=logging.ERROR,
+        max_payload=1232,
+        max_threads=8,
+        min_threads=1,
+        mode="blocking",
+        pin_cpus=False,
+        pool_size=16,
         port=0,
         resolver=True,
         resolver_dir="/etc/resolver",
+        rules=(),
+        state_file=os.path.join(
+            os.path.expanduser("~"), ".cache", "devns", "state.json"
+        ),
+        tcp=True,
+        tcp_connections=64,
+        tcp_timeout=10,
         ttl=300,
+        upstream_sockets=8,
+        upstream_timeout=2.0,
+        upstreams=(),
+        watch=True,
+        wildcard=True,
         verbosity=0,
+        workers=1,
+        zone_files=(),
     )
 
     def __init__(self):
@@ -44,6 +71,42 @@ class Config(object):
         logger.debug("Setting config.address to %r", address)
         self._data["address"] = address
 
+    @property
+    def address6(self):
+        return self._data.get("address6", self.DEFAULTS["address6"])
+
+    @address6.setter
+    def address6(self, address6):
+        logger.debug("Setting config.address6 to %r", address6)
+        self._data["address6"] = address6
+
+    @property
+    def batch_size(self):
+        return self._data.get("batch_size", self.DEFAULTS["batch_size"])
+
+    @batch_size.setter
+    def batch_size(self, batch_size):
+        logger.debug("Setting config.batch_size to %r", batch_size)
+        self._data["batch_size"] = batch_size
+
+    @property
+    def cache_size(self):
+        return self._data.get("cache_size", self.DEFAULTS["cache_size"])
+
+    @cache_size.setter
+    def cache_size(self, cache_size):
+        logger.debug("Setting config.cache_size to %r", cache_size)
+        self._data["cache_size"] = cache_size
+
+    @property
+    def discovery(self):
+        return self._data.get("discovery", self.DEFAULTS["discovery"])
+
+    @discovery.setter
+    def discovery(self, discovery):
+        logger.debug("Setting config.discovery to %r", discovery)
+        self._data["discovery"] = discovery
+
     @property
     def domains(self):
         return self._data.get("domains", self.DEFAULTS["domains"])
@@ -64,6 +127,24 @@ class Config(object):
         logger.debug("Setting config.host to %r", host)
         self._data["host"] = host
 
+    @property
+    def hosts_file(self):
+        return self._data.get("hosts_file", self.DEFAULTS["hosts_file"])
+
+    @hosts_file.setter
+    def hosts_file(self, hosts_file):
+        logger.debug("Setting config.hosts_file to %r", hosts_file)
+        self._data["hosts_file"] = hosts_file
+
+    @property
+    def listen(self):
+        return self._data.get("listen", self.DEFAULTS["listen"])
+
+    @listen.setter
+    def listen(self, listen):
+        logger.debug("Setting config.listen to %r", listen)
+        self._data["listen"] = listen
+
     @property
     def log_level(self):
         return logger.getEffectiveLevel()
@@ -79,6 +160,60 @@ class Config(object):
             _logger.setLevel(level)
         logging._releaseLock()
 
+    @property
+    def max_payload(self):
+        return self._data.get("max_payload", self.DEFAULTS["max_payload"])
+
+    @max_payload.setter
+    def max_payload(self, max_payload):
+        logger.debug("Setting config.max_payload to %r", max_payload)
+        self._data["max_payload"] = max_payload
+
+    @property
+    def max_threads(self):
+        return self._data.get("max_threads", self.DEFAULTS["max_threads"])
+
+    @max_threads.setter
+    def max_threads(self, max_threads):
+        logger.debug("Setting config.max_threads to %r", max_threads)
+        self._data["max_threads"] = max_threads
+
+    @property
+    def min_threads(self):
+        return self._data.get("min_threads", self.DEFAULTS["min_threads"])
+
+    @min_threads.setter
+    def min_threads(self, min_threads):
+        logger.debug("Setting config.min_threads to %r", min_threads)
+        self._data["min_threads"] = min_threads
+
+    @property
+    def mode(self):
+        return self._data.get("mode", self.DEFAULTS["mode"])
+
+    @mode.setter
+    def mode(self, mode):
+        logger.debug("Setting config.mode to %r", mode)
+        self._data["mode"] = mode
+
+    @property
+    def pin_cpus(self):
+        return self._data.get("pin_cpus", self.DEFAULTS["pin_cpus"])
+
+    @pin_cpus.setter
+    def pin_cpus(self, pin_cpus):
+        logger.debug("Setting config.pin_cpus to %r", pin_cpus)
+        self._data["pin_cpus"] = pin_cpus
+
+    @property
+    def pool_size(self):
+        return self._data.get("pool_size", self.DEFAULTS["pool_size"])
+
+    @pool_size.setter
+    def pool_size(self, pool_size):
+        logger.debug("Setting config.pool_size to %r", pool_size)
+        self._data["pool_size"] = pool_size
+
     @property
     def port(self):
         return self._data.get("port", self.DEFAULTS["port"])
@@ -97,6 +232,73 @@ class Config(object):
         logger.debug("Setting config.ttl to %r", ttl)
         self._data["ttl"] = ttl
 
+    @property
+    def rules(self):
+        return self._data.get("rules", self.DEFAULTS["rules"])
+
+    @rules.setter
+    def rules(self, rules):
+        logger.debug("Setting config.rules to %r", rules)
+        self._data["rules"] = rules
+
+    @property
+    def state_file(self):
+        return self._data.get("state_file", self.DEFAULTS["state_file"])
+
+    @state_file.setter
+    def state_file(self, state_file):
+        logger.debug("Setting config.state_file to %r", state_file)
+        self._data["state_file"] = state_file
+
+    @property
+    def upstreams(self):
+        return self._data.get("upstreams", self.DEFAULTS["upstreams"])
+
+    @upstreams.setter
+    def upstreams(self, upstreams):
+        logger.debug("Setting config.upstreams to %r", upstreams)
+        self._data["upstreams"] = upstreams
+
+    @property
+    def upstream_sockets(self):
+        return self._data.get(
+            "upstream_sockets", self.DEFAULTS["upstream_sockets"]
+        )
+
+    @upstream_sockets.setter
+    def upstream_sockets(self, upstream_sockets):
+        logger.debug("Setting config.upstream_sockets to %r", upstream_sockets)
+        self._data["upstream_sockets"] = upstream_sockets
+
+    @property
+    def upstream_timeout(self):
+        return self._data.get(
+            "upstream_timeout", self.DEFAULTS["upstream_timeout"]
+        )
+
+    @upstream_timeout.setter
+    def upstream_timeout(self, upstream_timeout):
+        logger.debug("Setting config.upstream_timeout to %r", upstream_timeout)
+        self._data["upstream_timeout"] = upstream_timeout
+
+    @property
+    def watch(self):
+        return self._data.get("watch", self.DEFAULTS["watch"])
+
+    @watch.setter
+    def watch(self, watch):
+        logger.debug("Setting config.watch to %r", watch)
+        self._data["watch"] = watch
+
+    @property
+    def wildcard(self):
+        return self._data.get("wildcard", self.DEFAULTS["wildcard"])
+
+    @wildcard.setter
+    def wildcard(self, wildcard):
+        logger.debug("Setting config.wildcard to %r", wildcard)
+        self._data["wildcard"] = wildcard
+
     @property
     def resolver(self):
         return self._data.get("resolver", self.DEFAULTS["resolver"])
@@ -115,6 +317,35 @@ class Config(object):
         logger.debug("Setting config.resolver_dir to %r", resolver_dir)
         self._data["resolver_dir"] = resolver_dir
 
+    @property
+    def tcp(self):
+        return self._data.get("tcp", self.DEFAULTS["tcp"])
+
+    @tcp.setter
+    def tcp(self, tcp):
+        logger.debug("Setting config.tcp to %r", tcp)
+        self._data["tcp"] = tcp
+
+    @property
+    def tcp_connections(self):
+        return self._data.get(
+            "tcp_connections", self.DEFAULTS["tcp_connections"]
+        )
+
+    @tcp_connections.setter
+    def tcp_connections(self, tcp_connections):
+        logger.debug("Setting config.tcp_connections to %r", tcp_connections)
+        self._data["tcp_connections"] = tcp_connections
+
+    @property
+    def tcp_timeout(self):
+        return self._data.get("tcp_timeout", self.DEFAULTS["tcp_timeout"])
+
+    @tcp_timeout.setter
+    def tcp_timeout(self, tcp_timeout):
+        logger.debug("Setting config.tcp_timeout to %r", tcp_timeout)
+        self._data["tcp_timeout"] = tcp_timeout
+
     @property
     def verbosity(self):
         return (40 - self.log_level) // 10
@@ -123,3 +354,21 @@ class Config(object):
     def verbosity(self, verbosity):
         logger.debug("Setting config.verbosity to %r", verbosity)
         self.log_level = 40 - (verbosity * 10)
+
+    @property
+    def workers(self):
+        return self._data.get("workers", self.DEFAULTS["workers"])
+
+    @workers.setter
+    def workers(self, workers):
+        logger.debug("Setting config.workers to %r", workers)
+        self._data["workers"] = workers
+
+    @property
+    def zone_files(self):
+        return self._data.get("zone_files", self.DEFAULTS["zone_files"])
+
+    @zone_files.setter
+    def zone_files(self, zone_files):
+        logger.debug("Setting config.zone_files to %r", zone_files)
+        self._data["zone_files"] = zone_files
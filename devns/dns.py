@@ -1,6 +1,11 @@
 from __future__ import (
     absolute_import, print_function, unicode_literals
 )
+
+import socket
+import struct
+import binascii
+
 # These are all transcribed from
 # https://www.iana.org/assignments/dns-parameters/dns-parameters.xhtml
 # I'm pretty sure we only need like 3 or 4 of them, but whatever... maybe this
@@ -11,6 +16,13 @@ class DNS(object):
 
     class Class(object):
         Internet = 1
+        IN = 1
+        Chaos = 3
+        CH = 3
+        Hesiod = 4
+        HS = 4
+        NONE = 254
+        ANY = 255
 
     class OpCode(object):
         Query = 0
@@ -120,7 +132,7 @@ class DNS(object):
         AXFR = 252       # transfer of an entire zone
         MAILB = 253      # mailbox-related RRs (MB, MG or MR)
         MAILA = 254      # mail agent RRs (OBSOLETE - see MX)
-        # * = 255        # A request for all records the server/cache has available
+        ANY = 255        # A request for all records the server/cache has available
         URI = 256        # URI
         CAA = 257        # Certification Authority Restriction
         AVC = 258        # Application Visibility and Control
@@ -128,24 +140,129 @@ class DNS(object):
         DLV = 32769      # DNSSEC Lookaside Validation
 
 
-def bytes_to_int(value):
-    return int("".join("%x" % _intify(x) for x in value), 16)
+class FormatError(ValueError):
+    """Raised when a message can't be decoded (RCODE 1, FORMERR)."""
 
 
-def _bytes(args):  # pragma: no cover
-    return b"".join(chr(i) for i in args)
+class Registry(object):
+    """
+    Two way index over one of the :class:`DNS` constant tables.
 
+    Both directions are plain dict lookups built once at import time.
+    Mnemonics are matched case-insensitively, with ``-`` and ``_``
+    interchangeable, and the RFC 3597 generic form (``TYPE65``, ``CLASS3``)
+    is accepted when the registry has a ``generic`` prefix. Where several
+    mnemonics share a code, :meth:`mnemonic` returns the one named in
+    ``preferred``, falling back to the alphabetically first one.
+    """
 
-if bytes is not str:  # pragma: no cover
-    _bytes = bytes  # noqa
+    def __init__(self, table, preferred=None, generic=None):
+        self.table = table
+        self.generic = generic
+        self._codes = {}
+        self._mnemonics = {}
+        for mnemonic, code in sorted(vars(table).items()):
+            if mnemonic.startswith("_") or not isinstance(code, int):
+                continue
+            self._codes[mnemonic.upper()] = code
+            self._codes[mnemonic.upper().replace("_", "-")] = code
+            self._mnemonics.setdefault(code, mnemonic)
+        self._mnemonics.update(preferred or {})
 
+    def __contains__(self, code):
+        return code in self._mnemonics
 
-def int_to_bytes(value, length=4):
-    fmt = ("%%0%dx" % length) % value
-    ints = tuple(
-        int(fmt[x:x + 2], 16) for x in range(0, len(fmt), 2)
-    )
-    return _bytes(ints)
+    def __iter__(self):
+        return iter(sorted(self._mnemonics.items()))
+
+    def __len__(self):
+        return len(self._mnemonics)
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, self.table.__name__)
+
+    def mnemonic(self, code):
+        """Return the mnemonic for ``code``, or ``code`` as a string."""
+        try:
+            return self._mnemonics[code]
+        except KeyError:
+            return str(code)
+
+    def code(self, mnemonic):
+        """Return the code for ``mnemonic``, raising KeyError if unknown."""
+        key = mnemonic.upper()
+        try:
+            return self._codes[key]
+        except KeyError:
+            if self.generic and key.startswith(self.generic):
+                digits = key[len(self.generic):]
+                if digits.isdigit() and int(digits) < 0x10000:
+                    return int(digits)
+            raise KeyError(mnemonic)
+
+
+CLASSES = Registry(
+    DNS.Class, preferred={1: "IN", 3: "CH", 4: "HS"}, generic="CLASS"
+)
+OPCODES = Registry(DNS.OpCode)
+# BADVERS and BADSIG share 16. Only BADVERS can show up in a message header
+# (via the EDNS extended RCODE), BADSIG lives in the TSIG error field.
+RCODES = Registry(DNS.RCode, preferred={16: "BADVERS"})
+RRTYPES = Registry(DNS.RRType, generic="TYPE")
+
+
+# Precompiled wire formats. Everything on the wire is big-endian ("network
+# order"), and we only ever need unsigned 8, 16 and 32 bit fields.
+_HEADER = struct.Struct("!6H")     # ID, flags, QD/AN/NS/AR counts
+_QUESTION = struct.Struct("!HH")   # QTYPE, QCLASS
+_RECORD = struct.Struct("!HHIH")   # TYPE, CLASS, TTL, RDLENGTH
+_LENGTH = struct.Struct("!B")      # label length octet
+_UINT16 = struct.Struct("!H")      # pointers, MX preference
+_SOA = struct.Struct("!5I")        # SERIAL, REFRESH, RETRY, EXPIRE, MINIMUM
+_SRV = struct.Struct("!3H")        # PRIORITY, WEIGHT, PORT
+
+# The largest message a client that doesn't use EDNS will accept over UDP.
+MAX_UDP = 512
+# The largest message that fits behind the two octet length over TCP.
+MAX_TCP = 65535
+# The most an OPT record can offer to accept, in its two octet CLASS.
+MAX_PAYLOAD = 65535
+# RFC 1035 2.3.4 size limits, in octets.
+MAX_LABEL = 63
+MAX_NAME = 255
+
+# Record types whose RDATA names may be compressed (RFC 3597 section 4).
+_COMPRESSIBLE = frozenset((
+    DNS.RRType.NS, DNS.RRType.MD, DNS.RRType.MF, DNS.RRType.CNAME,
+    DNS.RRType.SOA, DNS.RRType.MB, DNS.RRType.MG, DNS.RRType.MR,
+    DNS.RRType.PTR, DNS.RRType.MINFO, DNS.RRType.MX,
+))
+
+# How the fixed size fields in structured RDATA unpack for display.
+_RDATA_FIELDS = {
+    DNS.RRType.SOA: _SOA,
+    DNS.RRType.MX: _UINT16,
+    DNS.RRType.SRV: _SRV,
+}
+
+# Bit masks for the second 16 bit word of the header.
+QR = 0x8000
+OPCODE = 0x7800
+AA = 0x0400
+TC = 0x0200
+RD = 0x0100
+RA = 0x0080
+Z = 0x0040
+AD = 0x0020
+CD = 0x0010
+RCODE = 0x000f
+
+
+# Wire encoded names we've already decoded, mapped to their label tuples, so
+# repeat queries for the same name share one tuple instead of building a new
+# one per packet.
+_NAMES = {}
+_NAMES_MAX = 4096
 
 
 def _intify(value):
@@ -154,7 +271,105 @@ def _intify(value):
     return value
 
 
+def unpack_flags(flags):
+    """Split a header flags word into its fields, in wire order."""
+    return (
+        (flags & QR) >> 15,
+        (flags & OPCODE) >> 11,
+        (flags & AA) >> 10,
+        (flags & TC) >> 9,
+        (flags & RD) >> 8,
+        (flags & RA) >> 7,
+        (flags & Z) >> 6,
+        (flags & AD) >> 5,
+        (flags & CD) >> 4,
+        flags & RCODE,
+    )
+
+
+def pack_flags(qr=0, opcode=0, aa=0, tc=0, rd=0, ra=0, z=0, ad=0, cd=0,
+               rcode=0):
+    """Inverse of :func:`unpack_flags`."""
+    high = (qr & 1) << 15 | (opcode & 0xf) << 11 | (aa & 1) << 10
+    high |= (tc & 1) << 9 | (rd & 1) << 8
+    low = (ra & 1) << 7 | (z & 1) << 6 | (ad & 1) << 5 | (cd & 1) << 4
+    return high | low | rcode & 0xf
+
+
+def _labels(name):
+    try:
+        return _NAMES[name]
+    except KeyError:
+        pass
+    labels = []
+    offset = 0
+    length = _intify(name[offset])
+    while length != 0:
+        offset += 1
+        labels.append(name[offset:offset + length].decode("latin-1"))
+        offset += length
+        length = _intify(name[offset])
+    if len(_NAMES) >= _NAMES_MAX:
+        _NAMES.clear()
+    labels = _NAMES[name] = tuple(labels)
+    return labels
+
+
+def _encode_name(labels, offset, names, compress=True):
+    """
+    Encode ``labels`` as if written at ``offset`` in a message.
+
+    ``names`` maps every name suffix already written to the message to its
+    offset. The longest suffix found there is replaced with a pointer, and
+    the suffixes written out in full are added to it (RFC 1035 4.1.4).
+    """
+    parts = []
+    for index in range(len(labels)):
+        suffix = labels[index:]
+        if compress and suffix in names:
+            parts.append(_UINT16.pack(0xc000 | names[suffix]))
+            return b"".join(parts)
+        if offset < 0x4000:
+            names.setdefault(suffix, offset)
+        label = labels[index].encode("latin-1")
+        parts.append(_LENGTH.pack(len(label)))
+        parts.append(label)
+        offset += len(label) + 1
+    parts.append(b"\x00")
+    return b"".join(parts)
+
+
+def _skip_name(view, offset):
+    # Returns the offset just past the encoded name starting at ``offset``.
+    start = offset
+    end = len(view)
+    while True:
+        if offset >= end:
+            raise FormatError("Name runs past the message")
+        length = _intify(view[offset])
+        if length == 0:
+            return offset + 1
+        if length & 0xc0 == 0xc0:
+            if offset + 2 > end:
+                raise FormatError("Name runs past the message")
+            return offset + 2
+        if length > MAX_LABEL:
+            raise FormatError("Bad label length %#x" % length)
+        offset += length + 1
+        if offset - start >= MAX_NAME:
+            raise FormatError("Name is too long")
+
+
+def _name_str(labels):
+    return ".".join(labels) + "."
+
+
 class Header(object):
+    __slots__ = (
+        "id", "qr", "opcode", "aa", "tc", "rd", "ra", "z", "ad", "cd",
+        "rcode", "query", "answer", "authority", "additional",
+    )
+
     def __init__(self, id, qr=0, opcode=0, aa=0, tc=0, rd=0, ra=0, z=0, ad=0,
                  cd=0, rcode=0, query=0, answer=0, authority=0, additional=0):
         self.id = id
@@ -175,21 +390,11 @@ class Header(object):
 
     @property
     def opcode_str(self):
-        for opcode in dir(DNS.OpCode):
-            if getattr(DNS.OpCode, opcode, None) == self.opcode:
-                break
-        else:
-            opcode = str(self.opcode)
-        return opcode
+        return OPCODES.mnemonic(self.opcode)
 
     @property
     def rcode_str(self):
-        for rcode in dir(DNS.RCode):
-            if getattr(DNS.RCode, rcode, None) == self.rcode:
-                break
-        else:
-            rcode = str(self.rcode)
-        return rcode
+        return RCODES.mnemonic(self.rcode)
 
     @property
     def flags(self):
@@ -206,24 +411,28 @@ class Header(object):
 
     @classmethod
     def from_bytes(cls, data):
-        flags = format(bytes_to_int(data[2:4]), "016b")
-        return cls(
-            id=bytes_to_int(data[:2]),
-            qr=int(flags[0], 2),   # Query
-            opcode=int(flags[1:5], 2),
-            aa=int(flags[5], 2),   # Authoritative Answer
-            tc=int(flags[6], 2),   # Truncated Response
-            rd=int(flags[7], 2),   # Recursion Desired
-            ra=int(flags[8], 2),   # Recursion Available
-            z=int(flags[9], 2),    # Reserved
-            ad=int(flags[10], 2),  # Authentic Data
-            cd=int(flags[11], 2),  # Checking Disabled
-            rcode=int(flags[12:], 2),
-            query=bytes_to_int(data[4:6]),
-            answer=bytes_to_int(data[6:8]),
-            authority=bytes_to_int(data[8:10]),
-            additional=bytes_to_int(data[10:12]),
-        )
+        return cls.__new__(cls).load(data)
+
+    def load(self, data):
+        if len(data) < _HEADER.size:
+            raise FormatError("Message is shorter than a header")
+        (
+            self.id, flags, self.query, self.answer, self.authority,
+            self.additional
+        ) = _HEADER.unpack_from(data)
+        (
+            self.qr,      # Query
+            self.opcode,
+            self.aa,      # Authoritative Answer
+            self.tc,      # Truncated Response
+            self.rd,      # Recursion Desired
+            self.ra,      # Recursion Available
+            self.z,       # Reserved
+            self.ad,      # Authentic Data
+            self.cd,      # Checking Disabled
+            self.rcode,
+        ) = unpack_flags(flags)
+        return self
 
     def __str__(self):
         return "\n".join((
@@ -259,29 +468,22 @@ class Header(object):
         )
 
     def to_bytes(self):
-        header = int("".join((
-            format(self.qr, "b"),        # QR: Response
-            format(self.opcode, "04b"),  # Opcode
-            format(self.aa, "b"),        # Authoritative Answer
-            format(self.tc, "b"),        # Truncated Response
-            format(self.rd, "b"),        # Recursion Desired
-            format(self.ra, "b"),        # Recursion Available (should match RD)
-            format(self.z, "b"),         # Reserved
-            format(self.ad, "b"),        # Authentic Data
-            format(self.cd, "b"),        # Checking Disabled
-            format(self.rcode, "04b")    # status: NOERROR
-        )), 2)
-        return b"".join((
-            int_to_bytes(self.id),          # ID
-            int_to_bytes(header),
-            int_to_bytes(self.query),       # QUERY: 1
-            int_to_bytes(self.answer),      # ANSWER: 1
-            int_to_bytes(self.authority),   # AUTHORITY: 0
-            int_to_bytes(self.additional),  # ADDITIONAL: 0
-        ))
+        return _HEADER.pack(
+            self.id,
+            pack_flags(
+                self.qr, self.opcode, self.aa, self.tc, self.rd, self.ra,
+                self.z, self.ad, self.cd, self.rcode
+            ),
+            self.query,       # QUERY: 1
+            self.answer,      # ANSWER: 1
+            self.authority,   # AUTHORITY: 0
+            self.additional,  # ADDITIONAL: 0
+        )
 
 
 class Query(object):
+    __slots__ = ("rrtype", "labels", "qclass")
+
     def __init__(self, rrtype, labels, qclass=1):
         self.rrtype = rrtype
         self.labels = labels
@@ -289,47 +491,78 @@ class Query(object):
 
     @property
     def rrtype_str(self):
-        for rrtype in dir(DNS.RRType):
-            if getattr(DNS.RRType, rrtype, None) == self.rrtype:
-                break
-        else:
-            rrtype = str(self.rrtype)
-        return rrtype
+        return RRTYPES.mnemonic(self.rrtype)
 
     @property
     def qclass_str(self):
-        if self.qclass == 1:
-            return "IN"
-        return str(self.qclass)
+        return CLASSES.mnemonic(self.qclass)
 
     @property
     def domain(self):
         return ".".join(self.labels)
 
     @classmethod
-    def from_bytes(cls, data):
-        ini = 12
-        lon = _intify(data[ini])
-        labels = []
-        while lon != 0:
-            part = data[ini + 1:ini + lon + 1]
-            labels.append(part.decode("latin-1"))
-            ini += lon + 1
-            lon = _intify(data[ini])
-        rrtype = bytes_to_int(data[ini + 1:ini + 3])
-        qclass = bytes_to_int(data[ini + 3:ini + 5])
-        return cls(rrtype, tuple(labels), qclass)
+    def from_bytes(cls, data, offset=12):
+        return cls.__new__(cls).load(data, offset)
+
+    def load(self, data, offset=12):
+        self._read(memoryview(data), offset)
+        return self
+
+    def _read(self, view, offset):
+        # Returns the offset just past the question. Compression pointers may
+        # only point backwards, and each one further back than the last, so
+        # following them always terminates.
+        end = len(view)
+        start = floor = offset
+        segments = []
+        resume = None
+        size = 0
+        while True:
+            if offset >= end:
+                raise FormatError("Question name runs past the message")
+            length = _intify(view[offset])
+            if length == 0:
+                break
+            if length & 0xc0 == 0xc0:
+                if offset + 2 > end:
+                    raise FormatError("Question name runs past the message")
+                target = _UINT16.unpack_from(view, offset)[0] & 0x3fff
+                if target < _HEADER.size or target >= floor:
+                    raise FormatError("Bad compression pointer %#x" % target)
+                segments.append(view[start:offset].tobytes())
+                if resume is None:
+                    resume = offset + 2
+                start = floor = offset = target
+                continue
+            if length > MAX_LABEL:
+                raise FormatError("Bad label length %#x" % length)
+            offset += length + 1
+            size += length + 1
+            if size >= MAX_NAME:
+                raise FormatError("Question name is too long")
+        offset += 1
+        if resume is None:
+            name = view[start:offset].tobytes()
+        else:
+            segments.append(view[start:offset].tobytes())
+            name = b"".join(segments)
+            offset = resume
+        if offset + _QUESTION.size > end:
+            raise FormatError("Question is truncated")
+        self.labels = _labels(name)
+        self.rrtype, self.qclass = _QUESTION.unpack_from(view, offset)
+        return offset + _QUESTION.size
 
     def to_bytes(self):
         parts = []
         for label in self.labels:
-            parts.extend(chr(len(label)))
+            label = label.encode("latin-1")
+            parts.append(_LENGTH.pack(len(label)))
             parts.append(label)
-        parts = "".join(parts).encode("latin-1")
-        parts += b"".join((
-            b"\x00", int_to_bytes(self.rrtype), int_to_bytes(self.qclass)
-        ))
-        return parts
+        parts.append(b"\x00")
+        parts.append(_QUESTION.pack(self.rrtype, self.qclass))
+        return b"".join(parts)
 
     def __repr__(self):
         return "%s(rrtype=%r, labels=%r, qclass=%r)" % (
@@ -345,58 +578,443 @@ class Query(object):
         ))
 
 
+class Opt(object):
+    """
+    The EDNS(0) OPT pseudo-record (RFC 6891).
+
+    ``rcode`` holds the upper eight bits of the extended RCODE, and
+    ``options`` the raw, still encoded option list.
+    """
+
+    __slots__ = ("payload", "rcode", "version", "do", "options")
+
+    def __init__(self, payload=MAX_UDP, rcode=0, version=0, do=0,
+                 options=b""):
+        self.payload = payload
+        self.rcode = rcode
+        self.version = version
+        self.do = do
+        self.options = options
+
+    @classmethod
+    def find(cls, view, offset, header):
+        """
+        Return the OPT record from the additional section of the message in
+        ``view``, whose answer section starts at ``offset``, or None.
+        """
+        skip = header.answer + header.authority
+        end = len(view)
+        for index in range(skip + header.additional):
+            offset = _skip_name(view, offset)
+            if offset + _RECORD.size > end:
+                raise FormatError("Record is truncated")
+            rrtype, rrclass, ttl, rdlength = _RECORD.unpack_from(view, offset)
+            offset += _RECORD.size
+            if offset + rdlength > end:
+                raise FormatError("RDATA runs past the message")
+            if rrtype == DNS.RRType.OPT and index >= skip:
+                return cls(
+                    payload=rrclass,
+                    rcode=ttl >> 24,
+                    version=(ttl >> 16) & 0xff,
+                    do=(ttl >> 15) & 1,
+                    options=view[offset:offset + rdlength].tobytes(),
+                )
+            offset += rdlength
+
+    def to_bytes(self, rcode=None):
+        rcode = self.rcode if rcode is None else rcode
+        # The extended RCODE, version and DO bit, in place of a TTL.
+        ttl = (rcode & 0xff) << 24 | (self.version & 0xff) << 16
+        ttl |= (self.do & 1) << 15
+        return b"".join((
+            b"\x00",  # root
+            _RECORD.pack(
+                DNS.RRType.OPT,
+                self.payload,
+                ttl,
+                len(self.options),
+            ),
+            self.options,
+        ))
+
+    def __repr__(self):
+        return "%s(payload=%r, rcode=%r, version=%r, do=%r, options=%r)" % (
+            type(self).__name__, self.payload, self.rcode, self.version,
+            self.do, self.options
+        )
+
+    def __str__(self):
+        return "\n".join((
+            ";; OPT PSEUDOSECTION:",
+            "; EDNS: version: %s, flags:%s; udp: %s" % (
+                self.version, " do" if self.do else "", self.payload
+            )
+        ))
+
+
 class Request(object):
-    def __init__(self, header, query):
+    """
+    A DNS message as received from a client.
+
+    Only the 12 byte header is decoded up front. The question section, and
+    the OPT record if there is one, are decoded the first time :attr:`query`
+    or :attr:`opt` is read, so packets we end up ignoring never pay for it.
+    """
+
+    __slots__ = ("header", "_query", "_queries", "_opt", "_data")
+
+    def __init__(self, header, query, opt=None):
         self.header = header
-        self.query = query
+        self._query = query
+        self._queries = ()
+        self._opt = opt
+        self._data = None
+
+    def _decode(self):
+        # Only forget the message once all of it decoded, so a failure is
+        # raised again on the next read rather than leaving the question of
+        # whatever message this request held before.
+        view = memoryview(self._data)
+        offset = _HEADER.size
+        queries = []
+        query = self._query or Query.__new__(Query)
+        for _ in range(self.header.query):
+            offset = query._read(view, offset)
+            queries.append(query)
+            query = Query.__new__(Query)
+        opt = None
+        if self.header.additional:
+            opt = Opt.find(view, offset, self.header)
+        self._query = queries[0] if queries else None
+        self._queries = tuple(queries[1:])
+        self._opt = opt
+        self._data = None
+
+    @property
+    def query(self):
+        if self._data is not None:
+            self._decode()
+        return self._query
+
+    @query.setter
+    def query(self, query):
+        if self._data is not None:
+            self._decode()
+        self._query = query
+
+    @property
+    def queries(self):
+        """Every question in the message, decoded in one pass."""
+        if self._data is not None:
+            self._decode()
+        if self._query is None:
+            return ()
+        return (self._query, ) + self._queries
+
+    @property
+    def opt(self):
+        if self._data is not None:
+            self._decode()
+        return self._opt
+
+    @opt.setter
+    def opt(self, opt):
+        if self._data is not None:
+            self._decode()
+        self._opt = opt
 
     @classmethod
     def from_bytes(cls, data):
-        return cls(
-            header=Header.from_bytes(data),
-            query=Query.from_bytes(data)
-        )
+        request = cls.__new__(cls)
+        request.header = Header.from_bytes(data)
+        request._query = None
+        request._queries = ()
+        request._opt = None
+        request._data = data
+        return request
+
+    def load(self, data):
+        self.header.load(data)
+        self._data = data
+        return self
 
     def to_bytes(self):
-        return b"".join((self.header.to_bytes(), self.query.to_bytes()))
+        parts = [self.header.to_bytes(), self.query.to_bytes()]
+        if self.opt is not None:
+            parts.append(self.opt.to_bytes())
+        return b"".join(parts)
 
     def __str__(self):
-        return "%s\n\n%s\n" % (self.header, self.query)
+        sections = [str(self.header)]
+        if self.opt is not None:
+            sections.append(str(self.opt))
+        sections.extend(str(query) for query in self.queries)
+        return "%s\n" % "\n\n".join(sections)
 
     def __repr__(self):
-        return "%s(header=%r, query=%r)" % (
-            type(self).__name__, self.header, self.query
+        opt = ""
+        if self.opt is not None:
+            opt = ", opt=%r" % self.opt
+        return "%s(header=%r, query=%r%s)" % (
+            type(self).__name__, self.header, self.query, opt
         )
 
 
-class Response(Request):
-    def __init__(self, header, query, address, ttl=60):
-        super(Response, self).__init__(header, query)
-        self.address = address
+class Record(object):
+    """
+    A resource record.
+
+    ``rdata`` is either the encoded RDATA, or a sequence of encoded chunks and
+    label tuples. Label tuples are names, and get compressed along with the
+    rest of the message when the record type allows it.
+    """
+
+    __slots__ = ("labels", "rrtype", "rdata", "ttl", "rrclass")
+
+    def __init__(self, labels, rrtype, rdata, ttl=60, rrclass=1):
+        self.labels = labels
+        self.rrtype = rrtype
+        self.rdata = rdata
         self.ttl = ttl
+        self.rrclass = rrclass
 
-    def to_bytes(self):
+    @classmethod
+    def address(cls, labels, address, ttl=60, rrclass=1):
+        if ":" in address:
+            return cls(
+                labels, DNS.RRType.AAAA,
+                socket.inet_pton(socket.AF_INET6, address), ttl, rrclass
+            )
+        return cls(
+            labels, DNS.RRType.A, socket.inet_aton(address), ttl, rrclass
+        )
+
+    @classmethod
+    def soa(cls, labels, mname, rname, serial, refresh, retry, expire,
+            minimum, ttl=60, rrclass=1):
+        return cls(labels, DNS.RRType.SOA, (
+            mname, rname,
+            _SOA.pack(serial, refresh, retry, expire, minimum),
+        ), ttl, rrclass)
+
+    @property
+    def rdata_str(self):
+        rdata = self.rdata
+        if isinstance(rdata, bytes):
+            if self.rrtype == DNS.RRType.A and len(rdata) == 4:
+                return socket.inet_ntoa(rdata)
+            if self.rrtype == DNS.RRType.AAAA and len(rdata) == 16:
+                return socket.inet_ntop(socket.AF_INET6, rdata)
+            return "\\# %d %s" % (len(rdata), binascii.hexlify(
+                rdata
+            ).decode("ascii"))
+        fields = _RDATA_FIELDS.get(self.rrtype)
+        parts = []
+        for part in rdata:
+            if isinstance(part, tuple):
+                parts.append(_name_str(part))
+            elif fields and len(part) == fields.size:
+                parts.extend(str(value) for value in fields.unpack(part))
+            else:
+                parts.append(Record(self.labels, 0, part).rdata_str)
+        return " ".join(parts)
+
+    def to_bytes(self, offset=0, names=None):
+        if names is None:
+            names = {}
+        owner = _encode_name(self.labels, offset, names)
+        rdata = self.rdata
+        if not isinstance(rdata, bytes):
+            compress = self.rrtype in _COMPRESSIBLE
+            offset += len(owner) + _RECORD.size
+            parts = []
+            for part in rdata:
+                if isinstance(part, tuple):
+                    part = _encode_name(part, offset, names, compress)
+                parts.append(part)
+                offset += len(part)
+            rdata = b"".join(parts)
         return b"".join((
-            super(Response, self).to_bytes(),
-            b"\xc0\x0c",                      # Pointer/Offset
-            int_to_bytes(self.query.rrtype),  # TYPE: A
-            int_to_bytes(self.query.qclass),  # CLASS: IN
-            int_to_bytes(self.ttl, 8),        # TTL: 60
-            int_to_bytes(4),                  # RDLENGTH: 4 octets
-            _bytes(int(octet) for octet in self.address.split('.')),
+            owner,
+            _RECORD.pack(self.rrtype, self.rrclass, self.ttl, len(rdata)),
+            rdata,
         ))
 
+    def __repr__(self):
+        return "%s(labels=%r, rrtype=%r, rdata=%r, ttl=%r, rrclass=%r)" % (
+            type(self).__name__, self.labels, self.rrtype, self.rdata,
+            self.ttl, self.rrclass
+        )
+
     def __str__(self):
-        answer = "\n".join((
-            ";; ANSWER SECTION",
-            "%s.\t\t  %s\t  %s\t  %s\t  %s" % (
-                self.query.domain, self.ttl, self.query.qclass_str.upper(),
-                self.query.rrtype_str.upper(), self.address
-            )
+        return "%s\t\t  %s\t  %s\t  %s\t  %s" % (
+            _name_str(self.labels), self.ttl,
+            CLASSES.mnemonic(self.rrclass).upper(),
+            RRTYPES.mnemonic(self.rrtype).upper(), self.rdata_str
+        )
+
+
+class MessageBuilder(object):
+    """
+    Encodes a header, questions and any number of answer, authority and
+    additional records into one message with name compression.
+
+    The section counts are taken from what actually gets encoded. If the
+    message would grow past ``limit``, the additional section is cut short
+    first. If that isn't enough, the answer or authority section is cut
+    short too and TC is set. An :class:`Opt` record always goes last and is
+    never cut, and carries the upper bits of the header's RCODE.
+    """
+
+    def __init__(self, header, limit=MAX_UDP, opt=None):
+        self.header = header
+        self.limit = limit
+        self.opt = opt
+        self.questions = []
+        self.answers = []
+        self.authority = []
+        self.additional = []
+
+    def to_bytes(self):
+        header = self.header
+        limit = self.limit
+        opt = b""
+        if self.opt is not None:
+            opt = self.opt.to_bytes(header.rcode >> 4)
+            limit -= len(opt)
+        names = {}
+        parts = []
+        size = _HEADER.size
+        for query in self.questions:
+            name = _encode_name(query.labels, size, names)
+            parts.append(name)
+            parts.append(_QUESTION.pack(query.rrtype, query.qclass))
+            size += len(name) + _QUESTION.size
+        counts = []
+        tc = header.tc
+        full = False
+        for section in (self.answers, self.authority, self.additional):
+            count = 0
+            for record in section:
+                if full:
+                    break
+                encoded = record.to_bytes(size, names)
+                if size + len(encoded) > limit:
+                    # Nothing after this may point into the names it added.
+                    full = True
+                    tc = tc or section is not self.additional
+                    break
+                parts.append(encoded)
+                size += len(encoded)
+                count += 1
+            counts.append(count)
+        parts.insert(0, _HEADER.pack(
+            header.id,
+            pack_flags(
+                header.qr, header.opcode, header.aa, tc, header.rd,
+                header.ra, header.z, header.ad, header.cd, header.rcode
+            ),
+            len(self.questions), counts[0], counts[1],
+            counts[2] + (1 if opt else 0)
         ))
-        return "%s\n%s\n" % (super(Response, self).__str__(), answer)
+        parts.append(opt)
+        return b"".join(parts)
+
+
+class Response(Request):
+    __slots__ = ("address", "ttl", "answers", "authority", "additional",
+                 "limit")
+
+    def __init__(self, header, query, address=None, ttl=60, answers=(),
+                 authority=(), additional=(), limit=MAX_UDP, opt=None):
+        super(Response, self).__init__(header, query, opt)
+        self.address = address
+        self.ttl = ttl
+        self.answers = list(answers)
+        self.authority = list(authority)
+        self.additional = list(additional)
+        self.limit = limit
+
+    @property
+    def records(self):
+        """
+        The answer section. That's :attr:`answers`, led by an A or AAAA record
+        for :attr:`address` if the question asked for that type.
+        """
+        if self.address is None:
+            return self.answers
+        query = self.query
+        record = Record.address(
+            query.labels, self.address, self.ttl, query.qclass
+        )
+        if query.rrtype not in (record.rrtype, DNS.RRType.ANY):
+            return self.answers
+        return [record] + self.answers
+
+    def to_bytes(self):
+        builder = MessageBuilder(self.header, self.limit, self.opt)
+        builder.questions.append(self.query)
+        builder.answers.extend(self.records)
+        builder.authority.extend(self.authority)
+        builder.additional.extend(self.additional)
+        return builder.to_bytes()
+
+    def __str__(self):
+        sections = []
+        for title, records in (
+            ("ANSWER", self.records),
+            ("AUTHORITY", self.authority),
+            ("ADDITIONAL", self.additional),
+        ):
+            if records:
+                sections.append("\n".join(
+                    [";; %s SECTION" % title] + [str(r) for r in records]
+                ))
+        request = super(Response, self).__str__()
+        if not sections:
+            return request
+        return "%s\n%s\n" % (request, "\n\n".join(sections))
 
     def __repr__(self):
-        return "%s(header=%r, query=%r, address=%r, ttl=%r)" % (
-            type(self).__name__, self.header, self.query, self.address, self.ttl
+        extra = "".join(
+            ", %s=%r" % (name, getattr(self, name))
+            for name in ("answers", "authority", "additional", "opt")
+            if getattr(self, name)
+        )
+        return "%s(header=%r, query=%r, address=%r, ttl=%r%s)" % (
+            type(self).__name__, self.header, self.query, self.address,
+            self.ttl, extra
         )
+
+
+class RequestPool(object):
+    """
+    Recycles :class:`Request` objects, and the Header and Query they hold, for
+    one worker.
+
+    :meth:`acquire` decodes a datagram into a free request (or a new one if
+    none are free) and :meth:`release` hands it back once nothing refers to
+    it anymore. At most ``size`` idle requests are kept.
+    """
+
+    __slots__ = ("size", "_free")
+
+    def __init__(self, size=16):
+        self.size = size
+        self._free = []
+
+    def __len__(self):
+        return len(self._free)
+
+    def acquire(self, data):
+        try:
+            request = self._free.pop()
+        except IndexError:
+            request = Request(Header(0), Query(0, ()))
+        return request.load(data)
+
+    def release(self, request):
+        if len(self._free) < self.size:
+            request._data = None
+            self._free.append(request)
@@ -0,0 +1,422 @@
+"""
+Relay questions about names we don't answer for to upstream resolvers.
+
+Queries go out over UDP from sockets opened ahead of time, each bound to a
+random source port, under a random ID. A response only counts when it comes
+from the upstream that was asked, with that ID and the same question, and
+anything else arriving on the socket is dropped (RFC 5452).
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import errno
+import random
+import socket
+import logging
+import functools
+import threading
+import collections
+
+try:
+    import selectors
+except ImportError:  # pragma: no cover
+    selectors = None
+
+from .dns import _UINT16, MAX_TCP, FormatError, Header, Query
+from .refresh import monotonic
+from .wakeup import Waker
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 53
+
+# How many random ports to try binding before letting the kernel pick.
+_BIND_ATTEMPTS = 16
+_random = random.SystemRandom()
+
+
+def available():
+    """Whether questions can be forwarded here."""
+    return selectors is not None
+
+
+def parse(upstream):
+    """
+    Split ``"address[:port]"`` into ``(address, port)``, raising ValueError
+    when it's no good. IPv6 addresses with a port go in brackets, like
+    ``[::1]:5353``.
+    """
+    address, port = upstream.strip(), ""
+    if address.startswith("["):
+        address, bracket, port = address[1:].partition("]")
+        if not bracket or port and not port.startswith(":"):
+            raise ValueError("Expected [ADDRESS]:PORT, got %r" % upstream)
+        port = port[1:]
+    elif address.count(":") == 1:
+        address, _, port = address.partition(":")
+    family = _family(address)
+    try:
+        address = socket.inet_ntop(family, socket.inet_pton(family, address))
+    except (socket.error, ValueError) as e:
+        raise ValueError("Bad upstream address %r: %s" % (upstream, e))
+    if not port:
+        return address, DEFAULT_PORT
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError("Bad upstream port %r in %r" % (port, upstream))
+    return address, int(port)
+
+
+def _family(address):
+    return socket.AF_INET6 if ":" in address else socket.AF_INET
+
+
+def _matches(response, id, query):
+    # Whether ``response`` answers the question we sent under ``id``.
+    try:
+        header = Header.from_bytes(response)
+        if header.id != id or not header.qr or header.query != 1:
+            return False
+        question = Query.from_bytes(response)
+    except FormatError:
+        return False
+    if (question.rrtype, question.qclass) != (query.rrtype, query.qclass):
+        return False
+    if len(question.labels) != len(query.labels):
+        return False
+    return all(
+        a.lower() == b.lower() for a, b in zip(question.labels, query.labels)
+    )
+
+
+def _recv_exactly(connection, size):
+    parts = []
+    while size:
+        data = connection.recv(size)
+        if not data:
+            raise socket.error("Connection closed")
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+class SocketPool(object):
+    """
+    Unconnected, non-blocking UDP sockets for one address family, each bound
+    to its own random port.
+
+    :meth:`acquire` hands out an idle socket, or a new one if none are idle,
+    and :meth:`release` takes it back. Sockets that may still have a late
+    response coming are closed instead of kept, so they can't hold up the
+    next query. It's safe to share between threads.
+    """
+
+    def __init__(self, family, size=8):
+        self.family = family
+        self.size = size
+        self._free = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._free)
+
+    def open(self):
+        """Open sockets until ``size`` are idle."""
+        while len(self._free) < self.size:
+            connection = self._open()
+            with self._lock:
+                self._free.append(connection)
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return self._open()
+
+    def release(self, connection, reuse=True):
+        with self._lock:
+            if reuse and len(self._free) < self.size:
+                self._free.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            free, self._free = self._free, []
+        for connection in free:
+            connection.close()
+
+    def _bind(self):
+        connection = socket.socket(self.family, socket.SOCK_DGRAM)
+        host = "::" if self.family == socket.AF_INET6 else "0.0.0.0"
+        try:
+            for _ in range(_BIND_ATTEMPTS):
+                try:
+                    connection.bind((host, _random.randint(1024, 65535)))
+                    return connection
+                except socket.error as e:
+                    if e.errno not in (errno.EADDRINUSE, errno.EACCES):
+                        raise
+            connection.bind((host, 0))
+        except socket.error:
+            connection.close()
+            raise
+        return connection
+
+    def _open(self):
+        connection = self._bind()
+        connection.setblocking(False)
+        return connection
+
+
+class _Exchange(object):
+    # A question on its way upstream, and how far it got.
+
+    __slots__ = (
+        "query", "message", "callback", "tcp", "index", "tried", "upstream",
+        "id", "sent", "deadline",
+    )
+
+    def __init__(self, query, message, callback, tcp, index):
+        self.query = query
+        self.message = message
+        self.callback = callback
+        self.tcp = tcp
+        self.index = index
+        self.tried = 0
+        self.upstream = self.id = self.sent = self.deadline = None
+
+
+class Forwarder(object):
+    """
+    Sends queries to ``upstreams``, a list of ``(address, port)``, and
+    passes their responses on.
+
+    Each upstream gets ``timeout`` seconds to answer before the next one is
+    tried, starting from whichever answered last time, so one that's down
+    only slows things until another one answers.
+
+    Between :meth:`open` and :meth:`close` a thread of our own sends the
+    questions and watches every socket with one out from a selector, so
+    however slow the upstreams, only whoever asked waits on them.
+    """
+
+    def __init__(self, upstreams, timeout=2.0, size=8):
+        self.upstreams = list(upstreams)
+        self.timeout = timeout
+        self._pools = {}
+        for address, _ in self.upstreams:
+            family = _family(address)
+            if family not in self._pools:
+                self._pools[family] = SocketPool(family, size)
+        self._preferred = 0
+        # Sockets with a question out, in the order they time out.
+        self._pending = collections.OrderedDict()
+        # (method, exchange) calls for our thread to make, from any other.
+        self._calls = collections.deque()
+        self._selector = None
+        self._thread = None
+        self._running = False
+        self._waker = None
+
+    def open(self):
+        for pool in self._pools.values():
+            pool.open()
+        if self._thread is not None:
+            return
+        self._selector = selectors.DefaultSelector()
+        self._waker = Waker()
+        self._selector.register(self._waker, selectors.EVENT_READ, self._drain)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stop, passing None on for any questions still out."""
+        if self._thread is not None:
+            self._running = False
+            self._wake()
+            self._thread.join()
+            self._thread = None
+        for pool in self._pools.values():
+            pool.close()
+
+    def submit(self, query, message, callback, tcp=False):
+        """
+        Send ``message``, asking ``query``, upstream, and call ``callback``
+        with the response under ``message``'s ID, or None if no upstream
+        answered in time. With ``tcp``, a truncated response is asked for
+        again over TCP.
+
+        ``callback`` is called once, from another thread, so it should be
+        quick and ``query`` must not change until then.
+        """
+        if not self._running:
+            logger.warning("Not forwarding, the forwarder isn't open")
+            return callback(None)
+        self._queue(self._start, _Exchange(
+            query, message, callback, tcp, self._preferred
+        ))
+
+    def forward(self, query, message, tcp=False):
+        """Like :meth:`submit`, but wait for the response and return it."""
+        done = threading.Event()
+        responses = []
+
+        def callback(response):
+            responses.append(response)
+            done.set()
+
+        self.submit(query, message, callback, tcp)
+        done.wait()
+        return responses[0]
+
+    def _queue(self, method, exchange):
+        self._calls.append((method, exchange))
+        self._wake()
+
+    def _wake(self):
+        waker = self._waker
+        if waker is not None:
+            waker.wake()
+
+    def _serve(self):
+        selector = self._selector
+        try:
+            while self._running:
+                for key, mask in selector.select(self._timeout()):
+                    key.data(mask)
+                self._expire(monotonic())
+        finally:
+            for connection, exchange in list(self._pending.items()):
+                self._done(connection)
+                self._finish(exchange, None)
+            while self._calls:
+                self._finish(self._calls.popleft()[1], None)
+            selector.close()
+            self._waker.close()
+            self._waker = None
+
+    def _drain(self, mask):
+        self._waker.drain()
+        while self._calls:
+            method, exchange = self._calls.popleft()
+            method(exchange)
+
+    def _timeout(self):
+        if not self._pending:
+            return None
+        exchange = next(iter(self._pending.values()))
+        return max(exchange.deadline - monotonic(), 0)
+
+    def _expire(self, now):
+        while self._pending:
+            connection, exchange = next(iter(self._pending.items()))
+            if exchange.deadline > now:
+                break
+            # It might still get a late response, so it isn't kept.
+            self._done(connection)
+            self._failed(exchange, socket.timeout())
+
+    def _start(self, exchange):
+        upstream = exchange.upstream = self.upstreams[exchange.index]
+        pool = self._pools[_family(upstream[0])]
+        exchange.id = _random.randint(0, 0xffff)
+        exchange.sent = _UINT16.pack(exchange.id) + (
+            exchange.message[_UINT16.size:]
+        )
+        connection = None
+        try:
+            connection = pool.acquire()
+            connection.sendto(exchange.sent, upstream)
+        except socket.error as e:
+            if connection is not None:
+                pool.release(connection, False)
+            return self._failed(exchange, e)
+        exchange.deadline = monotonic() + self.timeout
+        self._pending[connection] = exchange
+        self._selector.register(
+            connection, selectors.EVENT_READ,
+            functools.partial(self._receive, connection)
+        )
+
+    def _receive(self, connection, mask):
+        exchange = self._pending[connection]
+        while True:
+            try:
+                response, source = connection.recvfrom(MAX_TCP)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                self._done(connection)
+                return self._failed(exchange, e)
+            if source[:2] == exchange.upstream and _matches(
+                response, exchange.id, exchange.query
+            ):
+                break
+            logger.debug("Dropping a response from %s, it's not ours",
+                         source[0])
+        self._done(connection, True)
+        self._preferred = exchange.index
+        if exchange.tcp and Header.from_bytes(response).tc:
+            # Rare enough to get a thread of its own rather than a
+            # non-blocking TCP client.
+            thread = threading.Thread(target=self._retry, args=(exchange, ))
+            thread.daemon = True
+            thread.start()
+            return
+        self._finish(exchange, response)
+
+    def _retry(self, exchange):
+        try:
+            response = self._exchange_tcp(
+                exchange.upstream, exchange.id, exchange.query, exchange.sent
+            )
+        except (socket.error, FormatError) as e:
+            # Back to our thread for the next upstream.
+            return self._queue(
+                functools.partial(self._failed, error=e), exchange
+            )
+        self._finish(exchange, response)
+
+    def _done(self, connection, reuse=False):
+        del self._pending[connection]
+        self._selector.unregister(connection)
+        self._pools[connection.family].release(connection, reuse)
+
+    def _failed(self, exchange, error):
+        logger.info(
+            "No answer from upstream %s port %d: %s", exchange.upstream[0],
+            exchange.upstream[1], str(error) or "timed out"
+        )
+        exchange.tried += 1
+        if exchange.tried >= len(self.upstreams):
+            return self._finish(exchange, None)
+        exchange.index = (exchange.index + 1) % len(self.upstreams)
+        self._start(exchange)
+
+    def _finish(self, exchange, response):
+        if response is not None:
+            response = exchange.message[:_UINT16.size] + (
+                response[_UINT16.size:]
+            )
+        try:
+            exchange.callback(response)
+        except Exception:
+            logger.exception("Failed passing on an upstream's response")
+
+    def _exchange_tcp(self, upstream, id, query, message):
+        connection = socket.socket(_family(upstream[0]), socket.SOCK_STREAM)
+        try:
+            connection.settimeout(self.timeout)
+            connection.connect(upstream)
+            connection.sendall(_UINT16.pack(len(message)) + message)
+            length = _UINT16.unpack(_recv_exactly(connection, 2))[0]
+            response = _recv_exactly(connection, length)
+        finally:
+            connection.close()
+        if not _matches(response, id, query):
+            raise FormatError("The response over TCP isn't for our question")
+        return response
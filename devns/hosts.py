@@ -0,0 +1,324 @@
+"""
+Answer names from a hosts(5) format file, like ``/etc/hosts`` or one of the
+blocklists that run to hundreds of thousands of lines.
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import os
+import mmap
+import time
+import socket
+import logging
+import threading
+from itertools import compress, islice
+try:
+    from itertools import filterfalse
+except ImportError:  # pragma: no cover
+    from itertools import ifilterfalse as filterfalse
+
+
+logger = logging.getLogger(__name__)
+
+_NOTHING = (None, None)
+
+# Lines compared at a time before the serving threads get a turn.
+_CHUNK = 4096
+
+
+def parse(line):
+    """
+    Return ``(address, names)`` for one line of a hosts file, ``names`` as
+    lowercase label tuples, or None if the line doesn't map anything.
+    """
+    line = line.split(b"#", 1)[0].split()
+    if len(line) < 2:
+        return None
+    address = line[0].decode("latin-1")
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    try:
+        socket.inet_pton(family, address)
+    except (socket.error, ValueError):
+        logger.debug("Skipping a line with bad address %r", address)
+        return None
+    names = tuple(
+        tuple(name.decode("latin-1").lower().rstrip(".").split("."))
+        for name in line[1:]
+    )
+    return address, names
+
+
+def _lines(path):
+    """
+    The lines of the file at ``path`` read through mmap, in lists of up to
+    ``_CHUNK`` of them.
+    """
+    with open(path, "rb") as hosts:
+        if not os.fstat(hosts.fileno()).st_size:
+            return
+        mapped = mmap.mmap(hosts.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            lines = iter(mapped.readline, b"")
+            chunk = list(islice(lines, _CHUNK))
+            while chunk:
+                yield chunk
+                chunk = list(islice(lines, _CHUNK))
+        finally:
+            mapped.close()
+
+
+def _pause():
+    # Each chunk is compared in C holding the GIL, so let go of it in
+    # between rather than waiting for the interpreter to ask.
+    time.sleep(0)
+
+
+class HostsFile(object):
+    """
+    Addresses by name from a hosts file, for :meth:`lookup` with a
+    question's labels.
+
+    :meth:`reload` only parses the lines that weren't there last time and
+    forgets the ones that are gone, but telling which those are still
+    means reading and hashing every line: around 350 ms for a file of
+    300,000 lines, however small the edit. That happens ``_CHUNK`` lines
+    at a time with other threads let run in between, so lookups meanwhile
+    wait a few milliseconds rather than for the whole file.
+
+    As in hosts(5) the first line naming something wins, and every name
+    remembers the lines it's on, so when the one that won is deleted the
+    next one takes over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._names = {}
+        # Line -> (address, ) + names for the lines we've applied.
+        self._lines = {}
+        # Name -> the line naming it, or a tuple of them in file order when
+        # there's more than one, and the names there's more than one for.
+        self._sources = {}
+        self._shared = set()
+        # Names above the ones in the file, with how many there are below.
+        self._parents = {}
+        # Shared labels, addresses and answers, there are far fewer of
+        # these than names.
+        self._labels = {}
+        self._values = {}
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def lookup(self, labels):
+        """
+        Return ``(address, address6)`` for ``labels``, either of which may
+        be None, or None when the file doesn't name them.
+        """
+        found = self._names.get(labels)
+        if found is None:
+            found = self._names.get(tuple(label.lower() for label in labels))
+        return found
+
+    def contains(self, labels):
+        """
+        Whether the file names ``labels`` or a name below it, so it exists
+        even if nothing answers for it directly.
+        """
+        labels = tuple([label.lower() for label in labels])
+        return labels in self._names or labels in self._parents
+
+    def load(self):
+        """Forget everything and read the whole file again."""
+        with self._lock:
+            self._names.clear()
+            self._lines.clear()
+            self._sources.clear()
+            self._shared.clear()
+            self._parents.clear()
+            self._labels.clear()
+            self._values.clear()
+            self._stat = None
+        return self.reload()
+
+    def reload(self):
+        """
+        Apply whatever changed since the last load, if the file did.
+        Returns how many lines were added and removed.
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError as e:
+                logger.warning("Can't read %s: %s", self.path, e)
+                stat = None
+            else:
+                stat = (stat.st_ino, stat.st_size, stat.st_mtime)
+            if stat == self._stat and stat is not None:
+                return 0, 0
+            try:
+                lines, fresh, removed = self._changes(stat)
+            except (IOError, OSError, ValueError) as e:
+                logger.warning("Failed reading %s: %s", self.path, e)
+                return 0, 0
+            # Lines are only ever added in file order into nothing, but
+            # otherwise they may have moved, too.
+            ordered = not self._lines
+            touched = set() if ordered else set(self._shared)
+            for line in removed:
+                self._remove(line, self._lines.pop(line)[1:], touched)
+            count = 0
+            for line in fresh:
+                if line in self._lines:
+                    continue
+                parsed = parse(line)
+                if parsed is None:
+                    continue
+                address, names = parsed
+                address = self._labels.setdefault(address, address)
+                names = tuple(self._label(name) for name in names)
+                self._lines[line] = (address, ) + names
+                self._add(line, address, names, touched)
+                count += 1
+            self._settle(touched, None if ordered else lines)
+            self._stat = stat
+        if count or removed:
+            logger.info(
+                "Loaded %s: %d lines added, %d removed, %d names",
+                self.path, count, len(removed), len(self._names)
+            )
+        return count, len(removed)
+
+    def _changes(self, stat):
+        """
+        Return ``(lines, fresh, removed)``: every line of the file, the ones
+        not applied yet and the applied ones that are gone.
+        """
+        # Telling what changed stays out of Python code, which only ever
+        # sees the lines that did.
+        lines = []
+        fresh = []
+        seen = set()
+        if stat is not None:
+            for chunk in _lines(self.path):
+                lines.extend(chunk)
+                seen.update(chunk)
+                fresh.extend(filterfalse(self._lines.__contains__, chunk))
+                _pause()
+        removed = []
+        known = list(self._lines)
+        for start in range(0, len(known), _CHUNK):
+            chunk = known[start:start + _CHUNK]
+            removed.extend(filterfalse(seen.__contains__, chunk))
+            _pause()
+        # Letting go of these touches every line again, so not both at once.
+        del known
+        _pause()
+        del seen
+        return lines, fresh, removed
+
+    def _label(self, name):
+        labels = self._labels
+        return tuple(labels.setdefault(label, label) for label in name)
+
+    def _value(self, value):
+        if value == _NOTHING:
+            return None
+        return self._values.setdefault(value, value)
+
+    def _add(self, line, address, names, touched):
+        for name in names:
+            sources = self._sources.get(name)
+            if sources is None:
+                self._sources[name] = line
+                self._names[name] = self._value(
+                    (None, address) if ":" in address else (address, None)
+                )
+                self._count(name, 1)
+                continue
+            if not isinstance(sources, tuple):
+                sources = (sources, )
+            self._sources[name] = sources + (line, )
+            self._shared.add(name)
+            touched.add(name)
+
+    def _remove(self, line, names, touched):
+        for name in names:
+            sources = self._sources.get(name)
+            if not isinstance(sources, tuple):
+                if sources == line:
+                    del self._sources[name]
+                    del self._names[name]
+                    self._count(name, -1)
+                # Otherwise it's named twice on the line, and done already.
+                continue
+            sources = tuple(source for source in sources if source != line)
+            if len(sources) < 2:
+                self._shared.discard(name)
+            if not sources:
+                del self._sources[name]
+                del self._names[name]
+                self._count(name, -1)
+                continue
+            self._sources[name] = sources if len(sources) > 1 else sources[0]
+            touched.add(name)
+
+    def _count(self, name, step):
+        parents = self._parents
+        for index in range(1, len(name)):
+            parent = name[index:]
+            count = parents.get(parent, 0) + step
+            if count:
+                parents[parent] = count
+            else:
+                del parents[parent]
+
+    def _settle(self, touched, lines=None):
+        # Answer each name from the first of its lines for each family,
+        # putting them back in file order first unless they're in it.
+        unsorted = []
+        for name in touched:
+            sources = self._sources.get(name)
+            if sources is None:
+                continue
+            if isinstance(sources, tuple) and lines is not None:
+                unsorted.append(name)
+            else:
+                self._answer(name, sources)
+        if not unsorted:
+            return
+        wanted = set()
+        for name in unsorted:
+            wanted.update(self._sources[name])
+        positions = _positions(lines, wanted)
+        for name in unsorted:
+            sources = tuple(sorted(
+                self._sources[name], key=positions.__getitem__
+            ))
+            self._sources[name] = sources
+            self._answer(name, sources)
+
+    def _answer(self, name, sources):
+        if not isinstance(sources, tuple):
+            sources = (sources, )
+        found = [None, None]
+        for source in sources:
+            address = self._lines[source][0]
+            ipv6 = ":" in address
+            if found[ipv6] is None:
+                found[ipv6] = address
+        self._names[name] = self._value(tuple(found))
+
+
+def _positions(lines, wanted):
+    """Where each of the ``wanted`` lines first is in ``lines``."""
+    positions = {}
+    for start in range(0, len(lines), _CHUNK):
+        chunk = lines[start:start + _CHUNK]
+        indexes = range(start, start + len(chunk))
+        for index in compress(indexes, map(wanted.__contains__, chunk)):
+            positions.setdefault(lines[index], index)
+        _pause()
+    return positions
@@ -0,0 +1,316 @@
+"""
+Enumerate interface addresses without forking ``ifconfig``.
+
+Every backend takes an address family and returns the addresses of that
+family configured on this host, or raises :class:`Unavailable` when it
+can't work here. :func:`addresses` tries them in order.
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import os
+import sys
+import errno
+import ctypes
+import select
+import socket
+import struct
+import logging
+import binascii
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# rtnetlink(7)
+NETLINK_ROUTE = 0
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x001
+NLM_F_DUMP = 0x300
+# Multicast groups announcing address changes.
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+# Addresses still doing, or having failed, duplicate address detection.
+IFA_F_DADFAILED = 0x08
+IFA_F_TENTATIVE = 0x40
+
+_NLMSGHDR = struct.Struct("=IHHII")    # length, type, flags, seq, pid
+_IFADDRMSG = struct.Struct("=BBBBI")   # family, prefixlen, flags, scope, index
+_RTATTR = struct.Struct("=HH")         # length, type
+
+SIOCGIFCONF = 0x8912
+_IFREQ_SIZE = 40 if struct.calcsize(str("P")) == 8 else 32
+_IFCONF = struct.Struct(str("iP"))
+
+
+class Unavailable(Exception):
+    """This backend can't enumerate addresses on this system."""
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def parse_addresses(data):
+    """
+    Yield ``(type, family, index, address)`` for every RTM_NEWADDR and
+    RTM_DELADDR message in a netlink datagram.
+
+    Tentative and failed addresses are left out of RTM_NEWADDR messages.
+    """
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, type, flags, seq, pid = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size or offset + length > len(data):
+            break
+        end = offset + length
+        if type in (RTM_NEWADDR, RTM_DELADDR):
+            body = offset + _NLMSGHDR.size
+            family, _, ifa_flags, _, index = _IFADDRMSG.unpack_from(data, body)
+            attributes = {}
+            position = body + _IFADDRMSG.size
+            while position + _RTATTR.size <= end:
+                size, kind = _RTATTR.unpack_from(data, position)
+                if size < _RTATTR.size:
+                    break
+                attributes[kind] = data[
+                    position + _RTATTR.size:position + size
+                ]
+                position += _align(size)
+            # IFA_LOCAL is our end of point-to-point links, IFA_ADDRESS the
+            # other one, so it's only the answer without IFA_LOCAL.
+            packed = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+            unusable = ifa_flags & (IFA_F_TENTATIVE | IFA_F_DADFAILED)
+            skip = type == RTM_NEWADDR and unusable
+            if packed and not skip:
+                yield type, family, index, socket.inet_ntop(family, packed)
+        offset += _align(length)
+
+
+def _netlink_socket():
+    if not hasattr(socket, "AF_NETLINK"):
+        raise Unavailable("no netlink sockets on %s" % sys.platform)
+    try:
+        return socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE
+        )
+    except (socket.error, OSError) as e:
+        raise Unavailable("can't open a netlink socket: %s" % e)
+
+
+def netlink(family=socket.AF_INET):
+    """Dump the kernel's address table over rtnetlink (Linux)."""
+    connection = _netlink_socket()
+    try:
+        connection.settimeout(1)
+        request = _IFADDRMSG.pack(family, 0, 0, 0, 0)
+        connection.send(_NLMSGHDR.pack(
+            _NLMSGHDR.size + len(request), RTM_GETADDR,
+            NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+        ) + request)
+        found = []
+        while True:
+            data = connection.recv(65536)
+            found.extend(
+                address for _, _family, _, address in parse_addresses(data)
+                if _family == family
+            )
+            types = set(_message_types(data))
+            if NLMSG_ERROR in types:
+                raise Unavailable("netlink refused the address dump")
+            if NLMSG_DONE in types:
+                return found
+    except (socket.error, OSError) as e:
+        raise Unavailable("netlink address dump failed: %s" % e)
+    finally:
+        connection.close()
+
+
+def _message_types(data):
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, type = _NLMSGHDR.unpack_from(data, offset)[:2]
+        if length < _NLMSGHDR.size:
+            break
+        yield type
+        offset += _align(length)
+
+
+def ioctl(family=socket.AF_INET):
+    """Ask for the IPv4 interface list with the SIOCGIFCONF ioctl (Linux)."""
+    if family != socket.AF_INET:
+        raise Unavailable("SIOCGIFCONF only knows about IPv4")
+    if fcntl is None or not sys.platform.startswith("linux"):
+        raise Unavailable("SIOCGIFCONF is only wired up for Linux")
+    connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        count = 32
+        while True:
+            buffer = bytearray(_IFREQ_SIZE * count)
+            array = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+            result = fcntl.ioctl(
+                connection.fileno(), SIOCGIFCONF,
+                _IFCONF.pack(len(buffer), ctypes.addressof(array))
+            )
+            length = _IFCONF.unpack(result)[0]
+            # A full buffer might mean there's more than fit.
+            if length < len(buffer):
+                break
+            count *= 2
+    except (IOError, OSError) as e:
+        raise Unavailable("SIOCGIFCONF failed: %s" % e)
+    finally:
+        connection.close()
+    return [
+        socket.inet_ntoa(bytes(buffer[offset + 20:offset + 24]))
+        for offset in range(0, length, _IFREQ_SIZE)
+    ]
+
+
+def proc(family=socket.AF_INET):
+    """Read /proc/net/fib_trie or /proc/net/if_inet6 (Linux)."""
+    try:
+        if family == socket.AF_INET6:
+            with open("/proc/net/if_inet6") as lines:
+                return _parse_if_inet6(lines)
+        with open("/proc/net/fib_trie") as lines:
+            return _parse_fib_trie(lines)
+    except (IOError, OSError) as e:
+        raise Unavailable("can't read /proc: %s" % e)
+
+
+def _parse_if_inet6(lines):
+    found = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 6:
+            continue
+        if int(parts[4], 16) & (IFA_F_TENTATIVE | IFA_F_DADFAILED):
+            continue
+        found.append(socket.inet_ntop(
+            socket.AF_INET6, binascii.unhexlify(parts[0])
+        ))
+    return found
+
+
+def _parse_fib_trie(lines):
+    # Local addresses are the "/32 host LOCAL" leaves of the trie, under
+    # the "|-- 10.0.0.1" line naming them. Each one shows up once per table.
+    found = []
+    last = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith("|--"):
+            last = line[3:].strip()
+        elif line.startswith("/32 host LOCAL") and last not in found:
+            found.append(last)
+    return found
+
+
+BACKENDS = OrderedDict([
+    ("netlink", netlink),
+    ("ioctl", ioctl),
+    ("proc", proc),
+])
+
+
+def addresses(family=socket.AF_INET, backends=None):
+    """
+    Return the addresses from the first of ``backends`` (names from
+    :data:`BACKENDS`, all of them by default) that works here.
+    """
+    for name in backends or BACKENDS:
+        try:
+            found = BACKENDS[name](family)
+        except Unavailable as e:
+            logger.debug("Skipping %s: %s", name, e)
+            continue
+        logger.debug("Found %r with %s", found, name)
+        return found
+    raise Unavailable("none of %s work here" % ", ".join(backends or BACKENDS))
+
+
+class Watcher(object):
+    """
+    Calls ``callback`` from a daemon thread with the ``(type, family,
+    index, address)`` changes from :func:`parse_addresses` whenever the
+    kernel announces an address being added or removed (Linux).
+
+    Nothing runs between announcements. If the kernel had to drop some
+    because we fell behind, ``callback`` gets an empty list, since the
+    changes can't be told apart any more.
+    """
+
+    def __init__(self, callback, groups=None):
+        if groups is None:
+            groups = RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR
+        self.callback = callback
+        self.groups = groups
+        self._connection = None
+        self._thread = None
+        self._wakeup = None
+
+    def start(self):
+        """Subscribe and start watching, raising :class:`Unavailable`."""
+        connection = _netlink_socket()
+        try:
+            connection.bind((0, self.groups))
+        except (socket.error, OSError) as e:
+            connection.close()
+            raise Unavailable("can't subscribe to address changes: %s" % e)
+        self._connection = connection
+        self._wakeup = os.pipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if self._thread is None:
+            return
+        os.write(self._wakeup[1], b"x")
+        self._thread.join(timeout)
+        self._thread = None
+        self._connection.close()
+        for fd in self._wakeup:
+            os.close(fd)
+
+    def _run(self):
+        while True:
+            try:
+                readable = select.select(
+                    [self._connection, self._wakeup[0]], [], []
+                )[0]
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if self._wakeup[0] in readable:
+                return
+            try:
+                changes = list(parse_addresses(self._connection.recv(65536)))
+                if not changes:
+                    continue
+            except (socket.error, OSError) as e:
+                if e.args[0] != errno.ENOBUFS:
+                    logger.exception("Stopped watching for address changes")
+                    return
+                logger.debug("Missed address changes, the queue overflowed")
+                changes = []
+            logger.debug("Address changes: %r", changes)
+            try:
+                self.callback(changes)
+            except Exception:
+                logger.exception("Failed handling address changes")
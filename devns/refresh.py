@@ -0,0 +1,52 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+monotonic = getattr(time, "monotonic", time.time)
+
+
+class Refresher(object):
+    """
+    Calls ``refresh`` from a daemon thread every ``interval`` seconds, or
+    straight away when :meth:`wake` is called, so slow address discovery
+    never happens while a client is waiting for an answer.
+    """
+
+    def __init__(self, refresh, interval):
+        self.refresh = refresh
+        self.interval = interval
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping:
+                return
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed refreshing, trying again later")
@@ -0,0 +1,129 @@
+"""
+Per-name addresses, like ``*.api.dev=10.0.0.5`` or ``db.local.co=::1``.
+
+Rules are compiled into a trie keyed by label from the root down, so a
+lookup walks the question's labels once, however many rules there are.
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import socket
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "*"
+
+# Slots of a trie node.
+_CHILDREN, _EXACT, _WILDCARD = range(3)
+
+
+def _node():
+    return [{}, None, None]
+
+
+def parse(rule):
+    """
+    Split ``"pattern=address"`` into ``(labels, address)``, the labels from
+    the leftmost down, raising ValueError when either half is no good.
+    """
+    pattern, separator, address = rule.partition("=")
+    if not separator:
+        raise ValueError("Expected PATTERN=ADDRESS, got %r" % rule)
+    return _labels(pattern), _address(address.strip())
+
+
+def _labels(pattern):
+    labels = tuple(pattern.strip().rstrip(".").lower().split("."))
+    if not all(labels):
+        raise ValueError("Empty label in %r" % pattern)
+    if WILDCARD in labels[1:] or any(
+        WILDCARD in label and label != WILDCARD for label in labels
+    ):
+        raise ValueError("%r can only be a whole, leftmost label in %r" % (
+            WILDCARD, pattern
+        ))
+    return labels
+
+
+def _address(address):
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    try:
+        socket.inet_pton(family, address)
+    except (socket.error, ValueError) as e:
+        raise ValueError("Bad address %r: %s" % (address, e))
+    return address
+
+
+class Rules(object):
+    """
+    Addresses to answer with, by name.
+
+    An exact name beats a wildcard, and a wildcard closer to the name beats
+    one further up. Like DNS wildcards, ``*.api.dev`` covers every name
+    below ``api.dev`` but not ``api.dev`` itself; a lone ``*`` covers
+    everything. A name can have an IPv4 and an IPv6 address, each set by
+    its own rule.
+    """
+
+    def __init__(self, rules=()):
+        self._root = _node()
+        self._count = 0
+        for rule in rules:
+            self.add(*parse(rule))
+
+    def __len__(self):
+        return self._count
+
+    def add(self, labels, address):
+        wildcard = labels[:1] == (WILDCARD, )
+        if wildcard:
+            labels = labels[1:]
+        node = self._root
+        for label in reversed(labels):
+            child = node[_CHILDREN].get(label)
+            if child is None:
+                child = node[_CHILDREN][label] = _node()
+            node = child
+        slot = _WILDCARD if wildcard else _EXACT
+        ipv4, ipv6 = node[slot] or (None, None)
+        if ":" in address:
+            ipv6 = address
+        else:
+            ipv4 = address
+        if node[slot] is None:
+            self._count += 1
+        node[slot] = (ipv4, ipv6)
+
+    def lookup(self, labels):
+        """
+        Return ``(address, address6)`` for the question's ``labels``, either
+        of which may be None, or None when no rule covers the name.
+        """
+        node = self._root
+        found = None
+        for index in range(len(labels) - 1, -1, -1):
+            if node[_WILDCARD] is not None:
+                found = node[_WILDCARD]
+            children = node[_CHILDREN]
+            node = children.get(labels[index])
+            if node is None:
+                # Names are case-insensitive, rules are kept lowercase.
+                node = children.get(labels[index].lower())
+                if node is None:
+                    return found
+        return node[_EXACT] or found
+
+    def contains(self, labels):
+        """
+        Whether some rule names ``labels`` or a name below it, so it exists
+        even if nothing answers for it directly.
+        """
+        node = self._root
+        for index in range(len(labels) - 1, -1, -1):
+            node = node[_CHILDREN].get(labels[index].lower())
+            if node is None:
+                return False
+        return True
@@ -5,18 +5,62 @@ from builtins import *  # noqa
 
 import os
 import socket
+import struct
 import logging
 import functools
 import subprocess
-from datetime import datetime
 
-from . import config
-from .dns import DNS, Request, Response
+try:
+    import selectors
+except ImportError:  # pragma: no cover
+    selectors = None
+
+from . import aio, config, forward, interfaces, rules, state, tcp
+from .hosts import HostsFile
+from .refresh import Refresher, monotonic
+from .rules import Rules
+from .supervisor import Supervisor
+from .tcp import TCPListener
+from .zone import Zone, ZoneError
+from .threads import AdaptiveThreadPool, OrderedWriter
+from .batch import new_batch
+from .cache import ResponseCache
+from .dns import (
+    DNS, MAX_PAYLOAD, MAX_TCP, MAX_UDP, QR, FormatError, Header, Opt, Query,
+    Record, Request, RequestPool, Response
+)
 from contextlib import contextmanager
 
 
 logger = logging.getLogger(__name__)
 
+_SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", None)
+
+# How often to check whether the hosts file changed, in seconds.
+_HOSTS_INTERVAL = 1
+
+# REFRESH, RETRY, EXPIRE and MINIMUM of the SOA records we make up. The
+# last one and the record's own TTL bound how long resolvers cache our
+# NXDOMAIN and NODATA answers (RFC 2308), which we keep to the same minute
+# as positive ones so a new rule or address isn't hidden for long.
+_SOA_TIMERS = (3600, 600, 86400, 60)
+
+# Everything after the ID of a FORMERR response with no sections.
+_FORMERR = struct.pack("!5H", QR | DNS.RCode.FormErr, 0, 0, 0, 0)
+
+
+def _sendto(response, destination):
+    connection, client = destination
+    connection.sendto(response, client)
+
+
+def _reply(response, destination):
+    # For responses from upstream, sent from the forwarder's thread.
+    try:
+        _sendto(response, destination)
+    except socket.error as e:
+        logger.warning("Failed sending response: %s", e)
+
 
 def interruptable(func):
     @functools.wraps(func)
@@ -35,14 +79,61 @@ class DevNS(object):
         self.config = config
         self.config.update(kwargs)
         self.connection = None
+        self.connections = []
+        self._tcp_listener = None
+        self._address_refresher = None
         self._address = None
-        self._address_last_updated = datetime.utcnow()
+        self._address6 = None
+        self._address6_last_updated = None
+        self._cache = ResponseCache(self.config.cache_size)
+        self._pool = RequestPool(self.config.pool_size)
+        self._rules = Rules(self.config.rules)
+        self._hosts = None
+        if self.config.hosts_file:
+            self._hosts = HostsFile(self.config.hosts_file)
+        self._zones = set(
+            tuple(filter(None, domain.lower().split(".")))
+            for domain in self.config.domains
+        ) or set([()])
+        self._check_rules()
+        # Zones loaded from files, by origin.
+        self._zone_data = {}
+        self._forwarder = None
+        if self.config.upstreams and not forward.available():
+            logger.error(
+                "Not forwarding to %r, this interpreter has no selectors",
+                self.config.upstreams
+            )
+        elif self.config.upstreams:
+            self._forwarder = forward.Forwarder(
+                [forward.parse(upstream) for upstream in config.upstreams],
+                config.upstream_timeout, config.upstream_sockets
+            )
+
+    def _check_rules(self):
+        # They're answered all the same, but no resolver file points the
+        # system at us for them.
+        for rule in self.config.rules:
+            labels = rules.parse(rule)[0]
+            if labels[:1] == (rules.WILDCARD, ):
+                labels = labels[1:]
+            if self._zone(labels) is None:
+                logger.warning(
+                    "%s is outside %r, only clients asking devns directly "
+                    "will see it", rule, self.config.domains
+                )
+
+    @property
+    def _max_payload(self):
+        return min(max(self.config.max_payload, MAX_UDP), MAX_PAYLOAD)
 
-    def _choose_address(self, addresses):
+    def _choose_address(self, addresses, family=socket.AF_INET):
         logger.debug("Selecting the best IP from candidates %r", addresses)
         possible = []
         if not isinstance(addresses, list):
             addresses = [addresses]
+        if family == socket.AF_INET6:
+            return self._choose_address6(addresses)
 
         for address in addresses:
             try:
@@ -71,6 +162,33 @@ class DevNS(object):
         else:
             logger.warning("Found no suitable IP addresses in %r", addresses)
 
+    def _choose_address6(self, addresses):
+        # Unique local (fc00::/7) beats link-local (fe80::/10), which beats
+        # loopback. Anything else is skipped, just like public IPv4 space.
+        possible = []
+        for address in addresses:
+            try:
+                packed = bytearray(socket.inet_pton(socket.AF_INET6, address))
+            except (socket.error, ValueError, TypeError):
+                logger.debug("Skipping %s", address)
+                continue
+            if packed == bytearray(15) + b"\x01":
+                rank = 0
+            elif packed[0] == 0xfe and packed[1] & 0xc0 == 0x80:
+                rank = 1
+            elif packed[0] & 0xfe == 0xfc:
+                rank = 2
+            else:
+                logger.debug("Skipping %s", address)
+                continue
+            logger.debug("Considering %s", address)
+            possible.append((rank, packed, address))
+        if possible:
+            address = max(possible)[-1]
+            logger.debug("Selected IPv6 address %s", address)
+            return address
+        logger.info("Found no suitable IPv6 addresses in %r", addresses)
+
     def _get_address_by_hostname(self):
         try:
             logger.debug("Attempting to determine response IP from hostname")
@@ -80,8 +198,9 @@ class DevNS(object):
         except Exception as e:
             logger.warning("Unable to resolve %r: %s", hostname, e)
 
-    def _get_address_by_ifconfig(self):
+    def _get_address_by_ifconfig(self, family=socket.AF_INET):
         logger.debug("Attempting to determine response IP from ifconfig")
+        keyword = "inet6" if family == socket.AF_INET6 else "inet"
         addresses = []
         output = subprocess.check_output(("ifconfig", ))
         if not isinstance(output, str):
@@ -89,33 +208,63 @@ class DevNS(object):
         for line in output.split("\n"):
             try:
                 parts = line.strip().split(" ")
-                assert parts[0] == "inet"
-                address = parts[1].split(":")[-1]
+                assert parts[0] == keyword
+                if family == socket.AF_INET6:
+                    # "inet6 fe80::1%lo0 prefixlen 64" on BSD and newer
+                    # net-tools, "inet6 addr: fe80::1/64 Scope:Link" on older
+                    address = parts[2] if parts[1] == "addr:" else parts[1]
+                    address = address.split("%")[0].split("/")[0]
+                else:
+                    address = parts[1].split(":")[-1]
                 addresses.append(address)
             except:
                 continue
-        return self._choose_address(addresses)
+        return self._choose_address(addresses, family)
 
-    @property
-    def _address_age(self):
-        if self.config.address:
-            return 0
-        delta = datetime.utcnow() - self._address_last_updated
-        return delta.days * 86400 + delta.seconds
+    def _get_address_by_interfaces(self, family=socket.AF_INET, backend=None):
+        return self._choose_address(
+            interfaces.addresses(family, backend and (backend, )), family
+        )
+
+    def _discover_address(self, family=socket.AF_INET):
+        """
+        Choose an address from the interfaces listed by the first of
+        ``config.discovery`` that works here, which may be None if none of
+        them suit. Raises :class:`interfaces.Unavailable` if none work.
+        """
+        errors = []
+        for backend in self.config.discovery:
+            try:
+                if backend == "ifconfig":
+                    return self._get_address_by_ifconfig(family)
+                return self._get_address_by_interfaces(family, backend)
+            except Exception as e:
+                logger.debug(
+                    "Address discovery with %s failed: %s", backend, e
+                )
+                errors.append("%s: %s" % (backend, e))
+        raise interfaces.Unavailable(
+            "; ".join(errors) or "no discovery backends configured"
+        )
+
+    def _try_discover_address(self, family=socket.AF_INET):
+        try:
+            return self._discover_address(family)
+        except interfaces.Unavailable as e:
+            logger.warning("Unable to list interface addresses: %s", e)
 
     @property
     def address(self):
+        # Only the very first read may have to discover anything, keeping
+        # it fresh is up to refresh() from the background.
         if not self._address:
             logger.debug("Address not set, refreshing")
             self.address = self.config.address
-        elif self._address_age > self.config.ttl:
-            logger.debug("Address is stale, refreshing")
-            self.address = self.config.address
         return self._address
 
     @address.setter
     def address(self, address):
-        address = address or self._get_address_by_ifconfig()
+        address = address or self._try_discover_address()
         address = address or self._get_address_by_hostname()
         if not address:
             logger.critical(
@@ -131,14 +280,209 @@ class DevNS(object):
             map(lambda x: chr(int(x)), address.split('.'))
         ).encode("latin-1")
         self._encoded_address = bytes([int(octet) for octet in address.split('.')])
-        self._address_last_updated = datetime.utcnow()
+        self._cache.clear()
+
+    @property
+    def address6(self):
+        if self.config.address6:
+            if self._address6 != self.config.address6:
+                self.address6 = self.config.address6
+        elif self._address6_last_updated is None:
+            logger.debug("IPv6 address not set, refreshing")
+            self.address6 = None
+        return self._address6
+
+    @address6.setter
+    def address6(self, address):
+        try:
+            address = address or self._discover_address(socket.AF_INET6)
+        except Exception as e:
+            logger.warning("Unable to determine an IPv6 address: %s", e)
+            address = None
+        self._address6 = address
+        self._address6_last_updated = monotonic()
+        self._cache.clear()
+
+    def refresh(self):
+        """
+        Rediscover whichever addresses weren't configured, keeping the ones
+        we have if that fails.
+
+        New addresses are swapped in whole, so requests answered meanwhile
+        see either the old address or the new one.
+        """
+        changed = False
+        if not self.config.address:
+            address = self._try_discover_address()
+            address = address or self._get_address_by_hostname()
+            if not address:
+                logger.warning(
+                    "Could not rediscover the address, keeping %s",
+                    self._address
+                )
+            elif address != self._address:
+                logger.info("Address changed to %s", address)
+                self.address = address
+                changed = True
+        if not self.config.address6:
+            try:
+                address6 = self._discover_address(socket.AF_INET6)
+            except interfaces.Unavailable as e:
+                logger.warning(
+                    "Could not rediscover the IPv6 address, keeping %s: %s",
+                    self._address6, e
+                )
+            else:
+                if address6 != self._address6:
+                    logger.info("IPv6 address changed to %s", address6)
+                    # Not through the setter, None means it's gone this time.
+                    self._address6 = address6
+                    self._cache.clear()
+                    changed = True
+                self._address6_last_updated = monotonic()
+        if changed:
+            self._save_state()
+
+    def _restore_state(self):
+        """
+        Answer with the addresses the last run found, if this still looks
+        like the same host with the same interfaces. Returns whether it did.
+        """
+        if not self.config.state_file:
+            return False
+        saved = state.load(self.config.state_file)
+        if not saved or saved.get("fingerprint") != state.fingerprint():
+            return False
+        restored = False
+        try:
+            if not self.config.address and saved.get("address"):
+                self.address = saved["address"]
+                restored = True
+            if not self.config.address6 and "address6" in saved:
+                socket.inet_pton(socket.AF_INET6, saved["address6"] or "::")
+                self._address6 = saved["address6"]
+                self._address6_last_updated = monotonic()
+                restored = True
+        except (socket.error, ValueError, TypeError) as e:
+            logger.warning(
+                "Ignoring bad state in %s: %s", self.config.state_file, e
+            )
+            self._address = None
+            self._address6 = self._address6_last_updated = None
+            return False
+        if restored:
+            logger.info(
+                "Answering with %s and %s from the last run until they're "
+                "rediscovered", self._address, self._address6
+            )
+        return restored
+
+    def _save_state(self):
+        if not self.config.state_file:
+            return
+        # Only what we discovered, configured addresses aren't ours to keep.
+        state.save(self.config.state_file, dict(
+            fingerprint=state.fingerprint(),
+            address=None if self.config.address else self._address,
+            address6=None if self.config.address6 else self._address6,
+        ))
+
+    @contextmanager
+    def _refresher(self):
+        # Discover what we have to up front, so no request ever waits on it,
+        # unless the last run left us something to start from.
+        discover = not (self.config.address and self.config.address6)
+        restored = discover and self._restore_state()
+        self.address
+        self.address6
+        refresher = watcher = None
+        if discover:
+            refresher = Refresher(self.refresh, self.config.ttl)
+            refresher.start()
+            if restored:
+                refresher.wake()
+            else:
+                self._save_state()
+            if self.config.watch:
+                watcher = self._watcher(refresher)
+        self._address_refresher = refresher
+        try:
+            yield refresher
+        finally:
+            self._address_refresher = None
+            if watcher is not None:
+                watcher.stop()
+            if refresher is not None:
+                refresher.stop()
+
+    @contextmanager
+    def _watch_hosts(self):
+        # Loading a big file takes a while, so that happens in the
+        # background too, and until it's done its names get the default.
+        refresher = None
+        if self._hosts is not None:
+            refresher = Refresher(self._hosts.reload, _HOSTS_INTERVAL)
+            refresher.start()
+            refresher.wake()
+        try:
+            yield refresher
+        finally:
+            if refresher is not None:
+                refresher.stop()
+
+    @contextmanager
+    def _forwarding(self):
+        # Open the sockets to forward from before the first question comes
+        # in, rather than while it waits.
+        if self._forwarder is not None:
+            self._forwarder.open()
+        try:
+            yield self._forwarder
+        finally:
+            if self._forwarder is not None:
+                self._forwarder.close()
+
+    def _watcher(self, refresher):
+        # Rediscover as soon as the kernel says something changed, leaving
+        # the TTL as a safety net for announcements we never get.
+        watcher = interfaces.Watcher(lambda changes: refresher.wake())
+        try:
+            watcher.start()
+        except interfaces.Unavailable as e:
+            logger.debug("Not watching for address changes: %s", e)
+            return None
+        logger.debug("Watching for address changes")
+        return watcher
+
+    def _socket(self, host, type=socket.SOCK_DGRAM):
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        connection = socket.socket(family, type)
+        if type == socket.SOCK_STREAM:
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if family == socket.AF_INET6:
+            # Leave the IPv4 side of the port to any 0.0.0.0 we also bind.
+            connection.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        if self.config.workers > 1:
+            if _SO_REUSEPORT is None:
+                raise socket.error("SO_REUSEPORT isn't supported here")
+            logger.debug("Enabling SO_REUSEPORT")
+            connection.setsockopt(socket.SOL_SOCKET, _SO_REUSEPORT, 1)
+        return connection
+
+    def _bind_udp(self, host, port):
+        logger.debug("Attempting to bind to %s:%s", host, port)
+        connection = self._socket(host)
+        try:
+            connection.bind((host, port))
+        except Exception:
+            connection.close()
+            raise
+        logger.debug("Successfully bound to %s:%s", *connection.getsockname())
+        return connection
 
     @contextmanager
     def bind(self):
         logger.debug("Opening socket")
-        connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        logger.debug("Setting socket timeout to 3.05 seconds")
-        connection.settimeout(3.05)
         if self.config.port:
             logger.debug(
                 "Attempting to bind to %s:%s",
@@ -149,59 +493,437 @@ class DevNS(object):
             logger.debug(
                 "Attempting to bind to %r with a random port", self.config.host
             )
+        self.connections = []
         try:
+            connection = self._socket(self.config.host)
+            self.connections.append(connection)
             connection.bind((self.config.host, self.config.port))
             logger.debug(
-                "Successfully bound to %s:%s", *connection.getsockname()
+                "Successfully bound to %s:%s", *connection.getsockname()[:2]
             )
             self.connection = connection
+            # Everything else shares the port, random or not.
+            port = connection.getsockname()[1]
+            for host in self.config.listen or ():
+                self.connections.append(self._bind_udp(host, port))
         except (socket.error, OverflowError, TypeError) as e:
             yield e
         else:
             yield self.connection
         finally:
             logger.debug("Closing socket")
+            self._close_connections()
+
+    def _close_connections(self):
+        for connection in self.connections:
             try:
-                self.connection.close()
+                connection.close()
             except:
                 pass
+        self.connections = []
+
+    def _build_response(self, data, pool=None, tcp=False, reply=None):
+        """
+        Return the response to ``data``, or None for none. Given a
+        ``reply`` callable, questions that go upstream return None straight
+        away and their response is passed to ``reply`` once it arrives, from
+        another thread.
+        """
+        pool = pool or self._pool
+        try:
+            request = pool.acquire(data)
+        except FormatError as e:
+            return self._format_error(data, e)
+        try:
+            return self._answer(request, tcp, reply)
+        except FormatError as e:
+            return self._format_error(data, e)
+        finally:
+            pool.release(request)
 
-    def _build_response(self, data):
-        request = Request.from_bytes(data)
+    def _format_error(self, data, error):
+        logger.info("Malformed request: %s", error)
+        if len(data) < 2:
+            return None
+        return bytes(data[:2]) + _FORMERR
+
+    def _answer(self, request, tcp=False, reply=None):
+        if request.header.qr:
+            logger.debug("Ignoring a response sent to us")
+            return None
         logger.info("Received request:\n%s", request)
         if request.header.opcode != DNS.OpCode.Query:
             logger.warning(
                 "Ignoring unsupported opcode: %r", request.header.opcode_str
             )
             return None
+        if request.header.query != 1:
+            # Nobody agrees on what more than one question means, so like
+            # most servers we don't try.
+            raise FormatError(
+                "Expected one question, got %d" % request.header.query
+            )
+        header = request.header
+        query = request.query
+        opt = request.opt
+        if opt is not None and opt.version:
+            return self._badvers(request)
+        limit = self._limit(opt, tcp)
+        zone = self._zone(query.labels)
+        matched = self._lookup(query.labels)
+        if zone is None:
+            if matched is None:
+                if self._forwarder is not None:
+                    return self._forward(request, limit, tcp, reply)
+                return self._refused(request)
+            # Named by a rule or the hosts file, so ours all the same, as a
+            # zone of its own.
+            zone = tuple([label.lower() for label in query.labels])
+        # The addresses may be swapped by the refresher at any moment, so
+        # read them once, and key the cache on them so an answer built with
+        # the old one can't be served after the swap.
+        rcode, data, address, address6 = self._source(query, zone, matched)
+        key = (
+            query.labels, query.rrtype, query.qclass, limit,
+            None if opt is None else opt.do, address, address6
+        )
+        response = self._cache.get(key, header.id, header.rd)
+        if response:
+            logger.info("Sending cached response for %s", query.domain)
+            return response
+        if data is not None:
+            answers = data.answers(query)
+        else:
+            answers = self._answers(query, address, address6)
+            if len(query.labels) == len(zone) and query.rrtype in (
+                DNS.RRType.SOA, DNS.RRType.ANY
+            ):
+                answers.append(self._soa(zone, query.qclass))
+        response = self._respond(request, zone, rcode, answers, limit)
+        self._cache.set(key, response)
+        return response
+
+    def _limit(self, opt, tcp=False):
+        # How big a response may get, which over UDP is up to the client.
+        if tcp:
+            return MAX_TCP
+        if opt is None:
+            return MAX_UDP
+        return min(max(opt.payload, MAX_UDP), self._max_payload)
+
+    def _lookup(self, labels):
+        # Rules come first, then the hosts file.
+        matched = self._rules.lookup(labels)
+        if matched is None and self._hosts is not None:
+            matched = self._hosts.lookup(labels)
+        return matched
+
+    def _contains(self, labels):
+        # Whether the rules or the hosts file name ``labels`` or a name
+        # below it, which makes it an empty non-terminal rather than
+        # nonexistent (RFC 8020).
+        if self._rules.contains(labels):
+            return True
+        return self._hosts is not None and self._hosts.contains(labels)
+
+    def _source(self, query, zone, matched):
+        """
+        Where the answer to ``query`` in ``zone`` comes from, given what the
+        rules and hosts file say: ``(rcode, data, address, address6)``,
+        ``data`` being the zone file to answer from, if any.
+        """
+        rcode = DNS.RCode.NoError
+        data = self._zone_data.get(zone)
+        if matched is not None:
+            address, address6 = matched
+            data = None
+        elif data is not None:
+            # A zone file says everything there is to say about its names.
+            address = address6 = None
+            if not data.exists(query.labels) and not self._contains(
+                query.labels
+            ):
+                rcode = DNS.RCode.NXDomain
+        elif self.config.wildcard:
+            address = self.address
+            address6 = None
+            if query.rrtype in (DNS.RRType.AAAA, DNS.RRType.ANY):
+                address6 = self.address6
+        else:
+            address = address6 = None
+            if len(query.labels) > len(zone) and not self._contains(
+                query.labels
+            ):
+                rcode = DNS.RCode.NXDomain
+        return rcode, data, address, address6
+
+    def _respond(self, request, zone, rcode, answers, limit):
         header = request.header
+        query = request.query
+        # No answer, so say which zone it's from, and for how long that's
+        # worth remembering.
+        authority = [] if answers else [self._soa(zone, query.qclass)]
         header.qr = 1
+        header.aa = 1
         header.ra = header.rd
         header.ad = 0
         header.cd = 1
+        header.rcode = rcode
         header.query = 1
-        header.answer = 1
-        header.authority = 0
+        header.answer = len(answers)
+        header.authority = len(authority)
         header.additional = 0
-        response = Response(header, request.query, self.address)
+        opt = None
+        if request.opt is not None:
+            header.additional = 1
+            opt = Opt(self._max_payload, do=request.opt.do)
+        response = Response(
+            header, query, answers=answers, authority=authority, limit=limit,
+            opt=opt
+        )
+        logger.info("Sending response:\n%s", response)
+        return response.to_bytes()
+
+    def _zone(self, labels):
+        """The longest of our zones ``labels`` is in, or None."""
+        zones = self._zones
+        # Lowered up front, or a shorter zone spelled the same way as the
+        # question would win over a longer one that isn't. From a list, as
+        # a tuple built from a generator gets resized, which is slower.
+        labels = tuple([label.lower() for label in labels])
+        for index in range(len(labels) + 1):
+            if labels[index:] in zones:
+                return labels[index:]
+        return None
+
+    def _soa(self, zone, rrclass=1):
+        data = self._zone_data.get(zone)
+        if data is not None:
+            return Record(
+                zone, DNS.RRType.SOA, data.soa.rdata, data.soa.ttl, rrclass
+            )
+        return Record.soa(
+            zone, ("ns", ) + zone, ("hostmaster", ) + zone, 1,
+            *_SOA_TIMERS, ttl=_SOA_TIMERS[-1], rrclass=rrclass
+        )
+
+    def _forward(self, request, limit, tcp=False, reply=None):
+        header = request.header
+        # The request goes back to its pool before the response arrives.
+        query = Query(
+            request.query.rrtype, request.query.labels, request.query.qclass
+        )
+        opt = None
+        if request.opt is not None:
+            # Ask for no more than we'd pass on, a bigger answer comes back
+            # truncated and, for TCP clients, gets asked for over TCP.
+            opt = Opt(min(limit, self._max_payload), do=request.opt.do)
+        request = Request(Header(
+            header.id, opcode=header.opcode, rd=header.rd, ad=header.ad,
+            cd=header.cd, query=1, additional=int(opt is not None)
+        ), query, opt)
+        message = request.to_bytes()
+        if reply is None:
+            response = self._forwarder.forward(query, message, tcp)
+            return self._forwarded(request, response)
+        self._forwarder.submit(query, message, lambda response: reply(
+            self._forwarded(request, response)
+        ), tcp)
+        return None
+
+    def _forwarded(self, request, response):
+        # ``request`` is what went upstream, standing in for the client's.
+        if response is None:
+            logger.warning("No upstream answered for %s", request.query.domain)
+            return self._empty(request, DNS.RCode.ServFail)
+        logger.info("Forwarded %s upstream", request.query.domain)
+        return response
+
+    def _refused(self, request):
+        logger.info(
+            "Refusing %s, it's not in any of %r", request.query.domain,
+            self.config.domains
+        )
+        return self._empty(request, DNS.RCode.Refused)
+
+    def _empty(self, request, rcode):
+        # A response with no records, only the question and any OPT.
+        header = request.header
+        header.qr = 1
+        header.ra = header.rd
+        header.ad = 0
+        header.rcode = rcode
+        header.answer = header.authority = header.additional = 0
+        opt = None
+        if request.opt is not None:
+            header.additional = 1
+            opt = Opt(self._max_payload, do=request.opt.do)
+        response = Response(header, request.query, opt=opt)
         logger.info("Sending response:\n%s", response)
         return response.to_bytes()
 
+    def _badvers(self, request):
+        # We only speak EDNS version 0 (RFC 6891 6.1.3)
+        logger.info(
+            "Rejecting unsupported EDNS version %r", request.opt.version
+        )
+        return self._empty(request, DNS.RCode.BADVERS)
+
+    def _answers(self, query, address, address6=None):
+        rrtype = query.rrtype
+        answers = []
+        if rrtype in (DNS.RRType.A, DNS.RRType.ANY) and address:
+            answers.append(Record.address(
+                query.labels, address, rrclass=query.qclass
+            ))
+        if rrtype in (DNS.RRType.AAAA, DNS.RRType.ANY) and address6:
+            answers.append(Record.address(
+                query.labels, address6, rrclass=query.qclass
+            ))
+        return answers
+
     def _listen(self):
+        connections = self.connections or [self.connection]
         logger.debug(
             "Ready to reply to incoming requests with %s", self.address
         )
-        print("Listening on {0}:{1}".format(*self.connection.getsockname()))
-        while True:
+        for connection in connections:
+            print("Listening on {0}:{1}".format(*connection.getsockname()))
+        if self.config.mode == "asyncio":
+            return self._listen_asyncio()
+        if self.config.mode == "threaded":
+            threads = AdaptiveThreadPool(
+                self._thread_handler, OrderedWriter(_sendto),
+                self.config.min_threads, self.config.max_threads
+            )
+            threads.start()
+            try:
+                return self._serve([
+                    (c, functools.partial(self._submit, threads, c))
+                    for c in connections
+                ])
+            finally:
+                threads.stop()
+        if self.config.batch_size:
+            return self._serve([
+                (c, functools.partial(self._process_batch, new_batch(
+                    c, self.config.batch_size, self._max_payload
+                )))
+                for c in connections
+            ])
+        return self._serve([
+            (c, functools.partial(self._receive, c)) for c in connections
+        ])
+
+    def _serve(self, handlers):
+        """
+        Call each ``(socket, handler)`` pair's handler whenever its socket
+        has something to read, and run the TCP listener alongside them.
+        """
+        if selectors is None:
+            # All we can do is block on the one socket, with a timeout to
+            # let Control+C through every now and then.
+            connection, handler = handlers[0]
+            connection.settimeout(3.05)
+            while True:
+                handler()
+        listener = self._tcp_listener
+        selector = selectors.DefaultSelector()
+        for connection, handler in handlers:
+            selector.register(connection, selectors.EVENT_READ, handler)
+        if listener is not None:
+            listener.register(selector)
+        try:
+            while True:
+                timeout = listener.timeout() if listener else None
+                for key, mask in selector.select(timeout):
+                    key.data(mask)
+                if listener is not None:
+                    listener.expire()
+        finally:
+            if listener is not None:
+                listener.close()
+            selector.close()
+
+    def _receive(self, connection, mask=None):
+        try:
+            query, client = connection.recvfrom(self._max_payload)
+            logger.debug("Request from %s:%s", *client[:2])
+            response = self._build_response(query, reply=functools.partial(
+                _reply, destination=(connection, client)
+            ))
+            if response:
+                connection.sendto(response, client)
+        except socket.error:
+            pass
+        except Exception:
+            logger.exception("Failed answering request, skipping it")
+
+    def endpoint(self, loop=None, connection=None):
+        """
+        Start answering on a bound socket (``self.connection`` by default)
+        from an asyncio event loop.
+
+        Returns a coroutine resolving to a ``(transport, protocol)`` pair, so
+        the server can share ``loop`` with other coroutines. Closing the
+        transport stops answering.
+        """
+        return aio.endpoint(self, loop, connection)
+
+    def _listen_asyncio(self):
+        if not aio.available():
+            logger.critical("asyncio is not available on this interpreter")
+            return 4
+        if self._tcp_listener is not None:
+            self._tcp_listener.start()
+        return aio.serve_forever(self)
+
+    def _thread_handler(self):
+        # Request pools aren't thread safe, so every thread gets its own.
+        pool = RequestPool(self.config.pool_size)
+
+        def handle(data, destination):
+            # A forwarded request's answer comes back through ``reply``,
+            # outside the OrderedWriter, so it isn't ordered with the rest.
+            return self._build_response(data, pool, reply=functools.partial(
+                _reply, destination=destination
+            ))
+
+        return handle
+
+    def _submit(self, threads, connection, mask=None):
+        try:
+            query, client = connection.recvfrom(self._max_payload)
+        except socket.error:
+            return
+        logger.debug("Request from %s:%s", *client[:2])
+        threads.submit(query, (connection, client))
+
+    def _process_batch(self, batch, mask=None):
+        try:
+            count = batch.recv()
+        except socket.error:
+            return 0
+        for index in range(count):
             try:
-                query, client = self.connection.recvfrom(1024)
-                logger.debug("Request from %s:%s", *client)
-                response = self._build_response(query)
-                if not response:
-                    continue
-                self.connection.sendto(response, client)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Request from %s:%s", *batch.client(index))
+                # Responses from upstream come after the batch went out.
+                response = self._build_response(
+                    batch.datagram(index), reply=functools.partial(
+                        _reply, destination=(
+                            batch.connection, batch.client(index)
+                        )
+                    )
+                )
+                if response:
+                    batch.reply(index, response)
             except socket.error:
                 continue
+            except Exception:
+                logger.exception("Failed answering request, skipping it")
+        batch.flush()
+        return count
 
     @contextmanager
     def _resolver(self):
@@ -241,6 +963,55 @@ class DevNS(object):
                         "Failed cleaning up resolver config %s", resolver
                     )
 
+    @contextmanager
+    def _tcp(self):
+        listener = None
+        if self.config.tcp and tcp.available():
+            listener = self._bind_tcp()
+        self._tcp_listener = listener
+        try:
+            yield listener
+        finally:
+            self._tcp_listener = None
+            if listener is not None:
+                listener.stop()
+
+    def _bind_tcp(self):
+        listener = None
+        for udp in self.connections or [self.connection]:
+            host, port = udp.getsockname()[:2]
+            try:
+                connection = self._socket(host, socket.SOCK_STREAM)
+            except socket.error as e:
+                logger.error("Not answering over TCP: %s", e)
+                return None
+            try:
+                connection.bind((host, port))
+                connection.listen(128)
+            except (socket.error, OverflowError, TypeError) as e:
+                logger.error(
+                    "Not answering over TCP on %s:%s, failed binding: %s",
+                    host, port, e
+                )
+                connection.close()
+                continue
+            logger.debug("Listening for TCP connections on %s:%s", host, port)
+            if listener is None:
+                pool = RequestPool(self.config.pool_size)
+
+                def handler(message, reply):
+                    return self._build_response(
+                        message, pool, tcp=True, reply=reply
+                    )
+
+                listener = TCPListener(
+                    connection, handler, self.config.tcp_connections,
+                    self.config.tcp_timeout
+                )
+            else:
+                listener.listen(connection)
+        return listener
+
     @interruptable
     def _run(self):
         with self._resolver() as resolver:
@@ -249,10 +1020,71 @@ class DevNS(object):
                     "Failed trying to write resolver config: %s", resolver
                 )
                 return 3
-            return self._listen()
+            with self._refresher():
+                with self._watch_hosts():
+                    with self._forwarding():
+                        with self._tcp():
+                            return self._listen()
+
+    @interruptable
+    def _run_workers(self):
+        with self._resolver() as resolver:
+            if isinstance(resolver, Exception):
+                logger.critical(
+                    "Failed trying to write resolver config: %s", resolver
+                )
+                return 3
+            # Workers bind their own sockets, so pin them to the port we got
+            # and let go of all of ours once they're up, or the kernel would
+            # keep handing them queries nobody reads.
+            self.config.host, self.config.port = (
+                self.connection.getsockname()[:2]
+            )
+            print("Starting {0} workers".format(self.config.workers))
+            supervisor = Supervisor(
+                self, self.config.workers, self.config.pin_cpus
+            )
+            supervisor.start()
+            self._close_connections()
+            return supervisor.run()
+
+    @interruptable
+    def _work(self):
+        # Forked with the parent's sockets, which would share the port too.
+        self._close_connections()
+        with self.bind() as connection:
+            if isinstance(connection, Exception):
+                return 2
+            with self._refresher():
+                with self._watch_hosts():
+                    with self._forwarding():
+                        with self._tcp():
+                            return self._listen()
+
+    def _load_zone_files(self):
+        """Read every zone file, returning False if one can't be."""
+        zone_data = {}
+        for path in self.config.zone_files:
+            try:
+                data = Zone.load(path)
+            except (IOError, OSError, ZoneError) as e:
+                logger.critical("Failed loading zone file %s: %s", path, e)
+                return False
+            logger.info(
+                "Loaded %d records for %s from %s", len(data),
+                ".".join(data.origin) or ".", path
+            )
+            zone_data[data.origin] = data
+        self._zone_data = zone_data
+        self._zones.update(zone_data)
+        return True
 
     def run(self):
+        if not self._load_zone_files():
+            return 5
         with self.bind() as connection:
             if isinstance(connection, Exception):
                 return 2
+            if self.config.workers > 1:
+                return self._run_workers()
             return self._run()
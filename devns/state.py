@@ -0,0 +1,72 @@
+"""
+Remember the addresses we answered with between runs, so a restart can
+answer straight away and rediscover from the background.
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import os
+import json
+import socket
+import logging
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+def fingerprint():
+    """
+    Something cheap to compute that changes along with the host and its
+    network interfaces, but not with the addresses on them.
+    """
+    try:
+        names = sorted(socket.if_nameindex())
+    except (AttributeError, OSError, socket.error):
+        names = []
+    return "%s %s" % (
+        socket.gethostname(),
+        " ".join("%d:%s" % (index, name) for index, name in names)
+    )
+
+
+def load(path):
+    """Return the state saved at ``path``, or None if there's none usable."""
+    try:
+        with open(path) as state_file:
+            state = json.load(state_file)
+    except (IOError, OSError, ValueError) as e:
+        logger.debug("No usable state in %s: %s", path, e)
+        return None
+    if not isinstance(state, dict) or state.get("version") != VERSION:
+        logger.debug("Ignoring state in %s from another version", path)
+        return None
+    return state
+
+
+def save(path, state):
+    """
+    Write ``state`` to ``path`` by renaming a complete file over it, so
+    readers never see half of one. Failing is logged, not raised.
+    """
+    state = dict(state, version=VERSION)
+    directory = os.path.dirname(path) or "."
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temporary = tempfile.mkstemp(prefix=".devns-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as state_file:
+                json.dump(state, state_file, sort_keys=True)
+            getattr(os, "replace", os.rename)(temporary, path)
+        except Exception:
+            os.unlink(temporary)
+            raise
+    except (IOError, OSError, TypeError, ValueError) as e:
+        logger.warning("Failed saving state to %s: %s", path, e)
+        return False
+    logger.debug("Saved state to %s", path)
+    return True
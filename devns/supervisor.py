@@ -0,0 +1,126 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import os
+import time
+import errno
+import signal
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Workers that die sooner than this after starting are restarted with a
+# delay, so one that can't bind doesn't turn into a fork loop.
+MIN_UPTIME = 1.0
+
+
+class Shutdown(Exception):
+    pass
+
+
+def _shutdown(signum, frame):
+    raise Shutdown(signum)
+
+
+def _exited(status):
+    """How a worker went, from the status :func:`os.wait` gave for it."""
+    if os.WIFSIGNALED(status):
+        return "was killed by signal %d" % os.WTERMSIG(status)
+    return "exited with status %d" % os.WEXITSTATUS(status)
+
+
+def _cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return None
+
+
+class Supervisor(object):
+    """
+    Forks ``count`` copies of ``server``, each answering on its own
+    SO_REUSEPORT socket, restarts any that exit, and takes them all down
+    when told to stop.
+    """
+
+    def __init__(self, server, count, pin=False):
+        self.server = server
+        self.count = count
+        self.pin = pin
+        self.workers = {}
+        self._cpus = _cpus() if pin else None
+        if pin and not self._cpus:
+            logger.warning("CPU pinning isn't supported here, ignoring it")
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid:
+            logger.debug("Started worker %d as pid %d", index, pid)
+            self.workers[pid] = (index, time.time())
+            return pid
+        code = 1
+        try:
+            code = self._work(index)
+        except BaseException:
+            logger.exception("Worker %d crashed", index)
+        finally:
+            # Never fall back into the parent's stack, it'd clean up the
+            # resolver files on the way out.
+            os._exit(code or 0)
+
+    def _work(self, index):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if self._cpus:
+            cpu = self._cpus[index % len(self._cpus)]
+            logger.debug("Pinning worker %d to CPU %d", index, cpu)
+            os.sched_setaffinity(0, (cpu, ))
+        return self.server._work()
+
+    def start(self):
+        for index in range(self.count):
+            self.spawn(index)
+
+    def run(self):
+        """Restart workers as they exit until we're told to shut down."""
+        previous = signal.signal(signal.SIGTERM, _shutdown)
+        try:
+            while self.workers:
+                pid, status = os.wait()
+                index, started = self.workers.pop(pid, (None, None))
+                if index is None:
+                    continue
+                logger.warning(
+                    "Worker %d (pid %d) %s, restarting it",
+                    index, pid, _exited(status)
+                )
+                if time.time() - started < MIN_UPTIME:
+                    time.sleep(MIN_UPTIME)
+                self.spawn(index)
+        except (KeyboardInterrupt, Shutdown):
+            logger.info("Shutting down %d workers", len(self.workers))
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.stop()
+        return 0
+
+    def stop(self):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+        while self.workers:
+            try:
+                pid, _ = os.wait()
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                break
+            except KeyboardInterrupt:
+                continue
+            self.workers.pop(pid, None)
+        self.workers.clear()
@@ -0,0 +1,287 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import errno
+import struct
+import socket
+import logging
+import functools
+import threading
+import collections
+
+try:
+    import selectors
+except ImportError:  # pragma: no cover
+    selectors = None
+
+from .refresh import monotonic
+from .wakeup import Waker
+
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct("!H")
+
+# Stop reading from a client once this much of its output is unsent.
+MAX_PENDING = 256 * 1024
+
+
+def available():
+    """Whether the TCP listener can be used here."""
+    return selectors is not None
+
+
+class TCPConnection(object):
+    """
+    One client connection: splits the stream into length-prefixed messages
+    and buffers whatever the socket wouldn't take yet.
+    """
+
+    def __init__(self, sock, client):
+        self.sock = sock
+        self.client = client
+        self.last_active = monotonic()
+        self._in = bytearray()
+        self._out = bytearray()
+
+    @property
+    def pending(self):
+        return len(self._out)
+
+    def feed(self, data):
+        """Add received octets, returning every message they completed."""
+        self._in += data
+        messages = []
+        while len(self._in) >= _LENGTH.size:
+            length = _LENGTH.unpack_from(self._in)[0]
+            end = _LENGTH.size + length
+            if len(self._in) < end:
+                break
+            messages.append(bytes(self._in[_LENGTH.size:end]))
+            del self._in[:end]
+        return messages
+
+    def queue(self, response):
+        self._out += _LENGTH.pack(len(response))
+        self._out += response
+
+    def flush(self):
+        """Send as much as the socket takes, returning whether it all went."""
+        while self._out:
+            try:
+                sent = self.sock.send(self._out)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return False
+                raise
+            del self._out[:sent]
+        return True
+
+
+class TCPListener(object):
+    """
+    Answers DNS over TCP (RFC 7766) on a listening socket.
+
+    Queries may be pipelined: each one goes to ``handler`` along with a
+    ``reply`` callable as soon as its message is complete. The handler
+    returns the response, or None and calls ``reply`` with it later, from
+    any thread, once it has one. Clients match responses up by ID (RFC 7766
+    6.2.1.1), so one that's deferred doesn't hold up the others behind it.
+    Connections idle for longer than ``idle_timeout`` seconds are closed,
+    and new ones are turned away while ``max_connections`` are open.
+
+    Everything happens from callbacks registered with a selector, each
+    key's data being called with the event mask. :meth:`serve_forever` runs
+    a selector of its own in a thread, or :meth:`register` the listener
+    with somebody else's and call :meth:`expire` when :meth:`timeout` says.
+    """
+
+    def __init__(self, sock, handler, max_connections=64, idle_timeout=10.0):
+        self.sock = sock
+        self.socks = [sock]
+        self.handler = handler
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connections = {}
+        self.selector = None
+        self._thread = None
+        self._running = False
+        self._waker = None
+        # Responses replied with from other threads, to queue from ours.
+        self._replies = collections.deque()
+
+    def __len__(self):
+        return len(self.connections)
+
+    def listen(self, sock):
+        """Accept connections on another listening socket too."""
+        self.socks.append(sock)
+        if self.selector is not None:
+            self._register(sock)
+
+    def register(self, selector):
+        self.selector = selector
+        self._waker = Waker()
+        selector.register(self._waker, selectors.EVENT_READ, self._deliver)
+        for sock in self.socks:
+            self._register(sock)
+
+    def _register(self, sock):
+        sock.setblocking(False)
+        self.selector.register(
+            sock, selectors.EVENT_READ, functools.partial(self._accept, sock)
+        )
+
+    def timeout(self, now=None):
+        """Seconds until the next connection may have gone idle."""
+        if not self.connections:
+            return None
+        now = monotonic() if now is None else now
+        oldest = min(c.last_active for c in self.connections.values())
+        return max(oldest + self.idle_timeout - now, 0)
+
+    def expire(self, now=None):
+        now = monotonic() if now is None else now
+        for connection in list(self.connections.values()):
+            if now - connection.last_active >= self.idle_timeout:
+                logger.debug(
+                    "Closing idle TCP connection from %s:%s",
+                    *connection.client[:2]
+                )
+                self._close(connection)
+
+    def close(self):
+        for connection in list(self.connections.values()):
+            self._close(connection)
+        for sock in self.socks:
+            self._unregister(sock)
+            sock.close()
+        del self.socks[:]
+        if self._waker is not None:
+            self._unregister(self._waker)
+            self._waker.close()
+            self._waker = None
+        self.selector = None
+
+    def _unregister(self, sock):
+        if self.selector is None:
+            return
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError, RuntimeError):
+            pass
+
+    def _accept(self, listening, mask):
+        try:
+            sock, client = listening.accept()
+        except socket.error as e:
+            logger.debug("Failed accepting a TCP connection: %s", e)
+            return
+        if len(self.connections) >= self.max_connections:
+            logger.warning(
+                "Refusing TCP connection from %s:%s, %d are open already",
+                client[0], client[1], len(self.connections)
+            )
+            sock.close()
+            return
+        logger.debug("TCP connection from %s:%s", *client[:2])
+        sock.setblocking(False)
+        connection = TCPConnection(sock, client)
+        self.connections[sock] = connection
+        self.selector.register(
+            sock, selectors.EVENT_READ, functools.partial(self._ready, connection)
+        )
+
+    def _ready(self, connection, mask):
+        try:
+            if mask & selectors.EVENT_READ and not self._read(connection):
+                return self._close(connection)
+            if connection.flush():
+                events = selectors.EVENT_READ
+            elif connection.pending < MAX_PENDING:
+                events = selectors.EVENT_READ | selectors.EVENT_WRITE
+            else:
+                events = selectors.EVENT_WRITE
+        except socket.error as e:
+            logger.debug(
+                "Dropping TCP connection from %s:%s: %s",
+                connection.client[0], connection.client[1], e
+            )
+            return self._close(connection)
+        connection.last_active = monotonic()
+        key = self.selector.get_key(connection.sock)
+        if key.events != events:
+            self.selector.modify(connection.sock, events, key.data)
+
+    def _read(self, connection):
+        try:
+            data = connection.sock.recv(65536)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return True
+            raise
+        if not data:
+            return False
+        reply = functools.partial(self.reply, connection)
+        for message in connection.feed(data):
+            try:
+                response = self.handler(message, reply)
+            except Exception:
+                logger.exception("Failed answering request, skipping it")
+                continue
+            if response:
+                connection.queue(response)
+        return True
+
+    def reply(self, connection, response):
+        """Send ``response`` on ``connection`` soon, from any thread."""
+        self._replies.append((connection, response))
+        self._wake()
+
+    def _wake(self):
+        waker = self._waker
+        if waker is not None:
+            waker.wake()
+
+    def _deliver(self, mask):
+        self._waker.drain()
+        while self._replies:
+            connection, response = self._replies.popleft()
+            if self.connections.get(connection.sock) is not connection:
+                continue
+            connection.queue(response)
+            self._ready(connection, 0)
+
+    def _close(self, connection):
+        self.connections.pop(connection.sock, None)
+        self._unregister(connection.sock)
+        connection.sock.close()
+
+    def start(self):
+        """Serve from a selector of our own in a background thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the thread :meth:`start` began, or just :meth:`close`."""
+        if self._thread is None:
+            return self.close()
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def serve_forever(self):
+        selector = selectors.DefaultSelector()
+        self.register(selector)
+        try:
+            while self._running:
+                for key, mask in selector.select(self.timeout()):
+                    key.data(mask)
+                self.expire()
+        finally:
+            self.close()
+            selector.close()
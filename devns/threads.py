@@ -0,0 +1,165 @@
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import socket
+import logging
+import threading
+
+from six.moves import queue
+
+
+logger = logging.getLogger(__name__)
+
+
+class OrderedWriter(object):
+    """
+    Sends each client its responses in the order its requests arrived,
+    whichever thread finishes them first.
+
+    Clients don't wait on each other: nothing orders datagrams between
+    clients anyway, so one slow answer only holds back later ones to the
+    same client. Sends are serialized, so threads never interleave them.
+
+    Every sequence number :meth:`reserve` hands out must be written exactly
+    once, with a response of ``None`` for requests that don't get one, or
+    everything after it for that client is held back.
+
+    Responses sent some other way aren't ordered at all. DevNS writes
+    ``None`` for a request it forwards upstream and sends the answer
+    straight from the forwarder's thread once it arrives, so that answer
+    can overtake or trail the client's other responses. The upside is
+    that a slow upstream never holds back local answers.
+    """
+
+    # Slots of a client's state.
+    _SEND, _RESERVE, _PENDING = range(3)
+
+    def __init__(self, send):
+        self._send = send
+        self._lock = threading.Lock()
+        self._clients = {}
+
+    def __len__(self):
+        with self._lock:
+            return sum(
+                len(state[self._PENDING]) for state in self._clients.values()
+            )
+
+    def reserve(self, client):
+        """The sequence number for ``client``'s next request."""
+        with self._lock:
+            state = self._clients.get(client)
+            if state is None:
+                state = self._clients[client] = [0, 0, {}]
+            state[self._RESERVE] += 1
+            return state[self._RESERVE] - 1
+
+    def write(self, sequence, response, client):
+        with self._lock:
+            state = self._clients[client]
+            pending = state[self._PENDING]
+            pending[sequence] = response
+            while state[self._SEND] in pending:
+                response = pending.pop(state[self._SEND])
+                state[self._SEND] += 1
+                if not response:
+                    continue
+                try:
+                    self._send(response, client)
+                except socket.error as e:
+                    logger.warning("Failed sending response: %s", e)
+            if state[self._SEND] == state[self._RESERVE]:
+                # Nothing outstanding, so nothing to remember.
+                del self._clients[client]
+
+
+class AdaptiveThreadPool(object):
+    """
+    Answers submitted requests from between ``min_threads`` and
+    ``max_threads`` threads.
+
+    A thread is added whenever more requests are queued than there are idle
+    threads to take them, and threads beyond ``min_threads`` exit after
+    ``idle_timeout`` seconds without work. Once ``backlog`` requests are
+    queued, :meth:`submit` blocks rather than dropping any.
+
+    ``handler_factory`` is called once in each thread and returns the
+    callable that turns a request and its client into a response there, so
+    threads don't have to share per-request state.
+    """
+
+    def __init__(self, handler_factory, writer, min_threads=1, max_threads=8,
+                 idle_timeout=5.0, backlog=None):
+        self.min_threads = max(min_threads, 1)
+        self.max_threads = max(max_threads, self.min_threads)
+        self.idle_timeout = idle_timeout
+        self._handler_factory = handler_factory
+        self._writer = writer
+        self._queue = queue.Queue(backlog or self.max_threads * 64)
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._idle = 0
+
+    def __len__(self):
+        return len(self._threads)
+
+    def start(self):
+        for _ in range(self.min_threads):
+            self._spawn()
+
+    def submit(self, data, client):
+        """Queue a request; only ever call this from one thread."""
+        with self._lock:
+            queued = self._queue.qsize()
+            grow = len(self._threads) < self.max_threads and queued >= self._idle
+        if grow:
+            self._spawn()
+        self._queue.put((self._writer.reserve(client), data, client))
+
+    def stop(self, timeout=None):
+        """Answer everything already queued, then stop every thread."""
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    def _spawn(self):
+        thread = threading.Thread(target=self._work)
+        thread.daemon = True
+        with self._lock:
+            self._threads.add(thread)
+            logger.debug("Adding a thread, now %d", len(self._threads))
+        thread.start()
+
+    def _retire(self):
+        self._threads.discard(threading.current_thread())
+        logger.debug("Retiring a thread, now %d", len(self._threads))
+
+    def _work(self):
+        handle = self._handler_factory()
+        while True:
+            with self._lock:
+                self._idle += 1
+            try:
+                item = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._idle -= 1
+                    if len(self._threads) > self.min_threads:
+                        return self._retire()
+                continue
+            with self._lock:
+                self._idle -= 1
+                if item is None:
+                    return self._retire()
+            sequence, data, client = item
+            response = None
+            try:
+                response = handle(data, client)
+            except Exception:
+                logger.exception("Failed answering request, skipping it")
+            finally:
+                self._writer.write(sequence, response, client)
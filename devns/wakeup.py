@@ -0,0 +1,42 @@
+"""
+Wake a thread waiting on a selector from any other thread.
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import socket
+
+
+class Waker(object):
+    """
+    A socket pair to register with a selector, that turns readable
+    whenever :meth:`wake` is called until the selector's thread
+    :meth:`drain`\\ s it.
+    """
+
+    def __init__(self):
+        self._wakeup, self._woken = socket.socketpair()
+        for sock in (self._wakeup, self._woken):
+            sock.setblocking(False)
+
+    def fileno(self):
+        return self._woken.fileno()
+
+    def wake(self):
+        try:
+            self._wakeup.send(b"\x00")
+        except socket.error:
+            # Closed, or woken plenty already.
+            pass
+
+    def drain(self):
+        try:
+            while self._woken.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def close(self):
+        self._woken.close()
+        self._wakeup.close()
@@ -0,0 +1,394 @@
+"""
+Load RFC 1035 master files ("zone files") for devns to answer from.
+
+Supports A, AAAA, CNAME, NS, SOA, SRV and TXT records, the ``$ORIGIN``,
+``$TTL`` and ``$INCLUDE`` directives, parentheses, quoted strings and
+comments. RDATA is encoded once, at load time: as bytes where it can be
+copied into a response as-is, and as chunks around the label tuples of
+names that responses compress.
+"""
+from __future__ import (
+    absolute_import, print_function, unicode_literals
+)
+
+import io
+import os
+import re
+import socket
+import logging
+
+from .dns import DNS, MAX_LABEL, Record, _SOA, _SRV, _encode_name
+
+
+logger = logging.getLogger(__name__)
+
+# How many CNAMEs to follow within a zone before giving up on a loop.
+MAX_CHAIN = 8
+
+_CLASSES = frozenset(("IN", "CS", "CH", "HS"))
+_TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_TTL = re.compile(r"^(?:\d+[smhdw]?)+$", re.IGNORECASE)
+# Lines that need more than str.split() to take apart.
+_SPECIAL = re.compile(r'["()\\;]')
+# A quoted string, which may be missing its closing quote, a parenthesis or
+# the start of a comment, or anything else up to whitespace or one of those.
+_TOKEN = re.compile(
+    r'"(?:[^"\\]|\\.)*(")?|[();]|(?:[^\s"();\\]|\\.?)+', re.DOTALL
+)
+
+
+class ZoneError(ValueError):
+    """A zone file that can't be loaded, with where it went wrong."""
+
+
+def _ttl(token):
+    if token.isdigit():
+        return int(token)
+    total = 0
+    for value, unit in re.findall(r"(\d+)([smhdw]?)", token.lower()):
+        total += int(value) * _TTL_UNITS.get(unit, 1)
+    return total
+
+
+def _fields(tokens, count, rrtype):
+    # The RDATA of a type that takes exactly ``count`` fields.
+    if len(tokens) != count:
+        raise ValueError("%s needs %d field%s, got %d" % (
+            rrtype, count, "" if count == 1 else "s", len(tokens)
+        ))
+    return tokens
+
+
+def _split(line):
+    """
+    Take a line apart into tokens, returning them and how many parentheses
+    it leaves open. Quoted strings keep their quotes, so TXT records can
+    tell them apart.
+    """
+    if not _SPECIAL.search(line):
+        return line.split(), 0
+    tokens = []
+    depth = 0
+    for match in _TOKEN.finditer(line):
+        token = match.group()
+        if token == ";":
+            break
+        if token in ("(", ")"):
+            depth += 1 if token == "(" else -1
+        elif token.startswith('"') and match.group(1) is None:
+            raise ValueError("Unterminated quoted string")
+        else:
+            tokens.append(token)
+    return tokens, depth
+
+
+def _unescape(text):
+    # RFC 1035 5.1: \X is X, \DDD is the octet with that decimal value.
+    data = bytearray()
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char == "\\" and text[index + 1:index + 4].isdigit():
+            data.append(int(text[index + 1:index + 4]))
+            index += 4
+            continue
+        if char == "\\":
+            index += 1
+            char = text[index:index + 1]
+        data.extend(char.encode("latin-1"))
+        index += 1
+    return bytes(data)
+
+
+class _Parser(object):
+
+    def __init__(self, zone, origin=None, ttl=None):
+        self.zone = zone
+        self.origin = origin
+        self.ttl = ttl
+        self.owner = None
+        # Names already parsed, by how they were written.
+        self.names = {}
+
+    def name(self, token):
+        labels = self.names.get(token)
+        if labels is None:
+            labels = self.names[token] = self._name(token)
+        return labels
+
+    def _name(self, token):
+        if token == "@":
+            if self.origin is None:
+                raise ValueError("@ without an $ORIGIN")
+            return self.origin
+        if "\\" in token:
+            raise ValueError("Escaped names aren't supported: %r" % token)
+        absolute = token.endswith(".")
+        labels = tuple(token.rstrip(".").lower().split(".")) if (
+            token != "."
+        ) else ()
+        if not all(labels) or any(len(label) > MAX_LABEL for label in labels):
+            raise ValueError("Bad name %r" % token)
+        if not absolute:
+            if self.origin is None:
+                raise ValueError("Relative name %r without an $ORIGIN" % token)
+            labels += self.origin
+        return self.zone._intern_name(labels)
+
+    def parse(self, path):
+        with io.open(path, encoding="latin-1") as lines:
+            tokens = []
+            depth = 0
+            start = None
+            for number, line in enumerate(lines, 1):
+                try:
+                    if not depth:
+                        start = number
+                        blank = line[:1].isspace()
+                    split, opened = _split(line)
+                    tokens.extend(split)
+                    depth += opened
+                    if depth < 0:
+                        raise ValueError("Unbalanced parentheses")
+                    if depth or not tokens:
+                        continue
+                    self.entry(tokens, blank, path)
+                    tokens = []
+                except ZoneError:
+                    raise
+                except (ValueError, IndexError, KeyError, socket.error) as e:
+                    raise ZoneError("%s:%d: %s" % (path, start, e))
+            if depth:
+                raise ZoneError(
+                    "%s:%d: Unbalanced parentheses" % (path, start)
+                )
+
+    def entry(self, tokens, blank, path):
+        if tokens[0].startswith("$"):
+            return self.directive(tokens, path)
+        if not blank:
+            self.owner = self.name(tokens[0])
+            tokens = tokens[1:]
+        if self.owner is None:
+            raise ValueError("No owner name")
+        ttl, tokens = self.ttl_and_class(tokens)
+        encode = self._ENCODERS.get(tokens[0].upper())
+        if encode is None:
+            raise ValueError("Unsupported record type %s" % tokens[0])
+        rrtype, rdata = encode(self, tokens[1:])
+        if ttl is None:
+            if rrtype != DNS.RRType.SOA:
+                raise ValueError("No TTL, and no $TTL to default to")
+            ttl = _SOA.unpack(rdata[2])[4]
+        self.zone.add(self.owner, rrtype, rdata, ttl)
+        if self.ttl is None:
+            # RFC 1035 5.1: a missing TTL is the last one given.
+            self.ttl = ttl
+
+    def directive(self, tokens, path):
+        first = tokens[0].upper()
+        if first == "$ORIGIN":
+            self.origin = self.name(tokens[1])
+            # Relative names mean something else from here on.
+            self.names = {}
+        elif first == "$TTL":
+            self.ttl = _ttl(tokens[1])
+        elif first == "$INCLUDE":
+            include = os.path.join(os.path.dirname(path), tokens[1])
+            origin = self.name(tokens[2]) if len(tokens) > 2 else self.origin
+            _Parser(self.zone, origin, self.ttl).parse(include)
+        else:
+            raise ValueError("Unknown directive %s" % tokens[0])
+
+    def ttl_and_class(self, tokens):
+        """
+        Take the TTL and class, either of which may come first or not at
+        all, off the front of ``tokens``, returning the TTL and the rest.
+        """
+        ttl = self.ttl
+        rrclass = "IN"
+        while True:
+            token = tokens[0].upper()
+            if token in _CLASSES:
+                rrclass = token
+            elif _TTL.match(token):
+                ttl = _ttl(token)
+            else:
+                break
+            tokens = tokens[1:]
+        if rrclass != "IN":
+            raise ValueError("Only class IN is supported, not %s" % rrclass)
+        return ttl, tokens
+
+    def _a(self, tokens):
+        address, = _fields(tokens, 1, "A")
+        return DNS.RRType.A, self.zone._intern(
+            socket.inet_pton(socket.AF_INET, address)
+        )
+
+    def _aaaa(self, tokens):
+        address, = _fields(tokens, 1, "AAAA")
+        return DNS.RRType.AAAA, self.zone._intern(
+            socket.inet_pton(socket.AF_INET6, address)
+        )
+
+    def _cname(self, tokens):
+        name, = _fields(tokens, 1, "CNAME")
+        return DNS.RRType.CNAME, (self.name(name), )
+
+    def _ns(self, tokens):
+        name, = _fields(tokens, 1, "NS")
+        return DNS.RRType.NS, (self.name(name), )
+
+    def _soa(self, tokens):
+        tokens = _fields(tokens, 7, "SOA")
+        mname, rname = self.name(tokens[0]), self.name(tokens[1])
+        serial = int(tokens[2])
+        timers = [_ttl(token) for token in tokens[3:]]
+        return DNS.RRType.SOA, Record.soa(
+            (), mname, rname, serial, *timers
+        ).rdata
+
+    def _srv(self, tokens):
+        tokens = _fields(tokens, 4, "SRV")
+        priority, weight, port = (int(token) for token in tokens[:3])
+        # Never compressed (RFC 2782), so all of it can be encoded now.
+        target = _encode_name(self.name(tokens[3]), 0, {}, compress=False)
+        return DNS.RRType.SRV, self.zone._intern(
+            _SRV.pack(priority, weight, port) + target
+        )
+
+    def _txt(self, tokens):
+        if not tokens:
+            raise ValueError("TXT needs at least one string")
+        parts = []
+        for token in tokens:
+            if token.startswith('"'):
+                token = token[1:-1]
+            data = _unescape(token)
+            if len(data) > 255:
+                raise ValueError("TXT strings are 255 octets at most")
+            parts.append(bytes(bytearray([len(data)])) + data)
+        return DNS.RRType.TXT, self.zone._intern(b"".join(parts))
+
+    # What each record type we know is encoded by, looked up by name so a
+    # type can't reach anything else here.
+    _ENCODERS = {
+        "A": _a, "AAAA": _aaaa, "CNAME": _cname, "NS": _ns, "SOA": _soa,
+        "SRV": _srv, "TXT": _txt,
+    }
+
+
+class Zone(object):
+    """
+    The records of one zone, by owner name.
+
+    Labels, names and RDATA are shared between records wherever they're
+    equal, and each owner's records are kept in a single tuple.
+    """
+
+    def __init__(self):
+        self.origin = None
+        self.soa = None
+        self._records = {}
+        # Every owner name and every name between it and the origin, which
+        # exist even with no records of their own (RFC 8020).
+        self._names = set()
+        self._interned = {}
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.values())
+
+    @classmethod
+    def load(cls, path):
+        """Read the zone file at ``path``, raising :class:`ZoneError`."""
+        zone = cls()
+        _Parser(zone).parse(path)
+        if zone.soa is None:
+            raise ZoneError("%s: No SOA record" % path)
+        zone._finish(path)
+        return zone
+
+    def _intern(self, value):
+        return self._interned.setdefault(value, value)
+
+    def _intern_name(self, labels):
+        interned = self._interned
+        found = interned.get(labels)
+        if found is None:
+            found = interned[labels] = tuple(
+                interned.setdefault(label, label) for label in labels
+            )
+        return found
+
+    def add(self, owner, rrtype, rdata, ttl):
+        record = Record(owner, rrtype, rdata, ttl)
+        if rrtype == DNS.RRType.SOA:
+            if self.soa is not None:
+                raise ValueError("More than one SOA record")
+            self.origin = owner
+            self.soa = record
+        self._records[owner] = self._records.get(owner, ()) + (record, )
+
+    def _finish(self, path):
+        origin = self.origin
+        for owner in list(self._records):
+            if owner[len(owner) - len(origin):] != origin:
+                logger.warning(
+                    "%s: Ignoring %s, it's outside %s", path,
+                    ".".join(owner), ".".join(origin) or "."
+                )
+                del self._records[owner]
+                continue
+            for index in range(len(owner) - len(origin) + 1):
+                self._names.add(self._intern_name(owner[index:]))
+        # Only loading needs to find what to share.
+        self._interned.clear()
+
+    def _find(self, labels):
+        records = self._records.get(labels)
+        if records is not None or labels in self._names:
+            return records
+        # The closest enclosing name decides whether a wildcard applies.
+        for index in range(1, len(labels) - len(self.origin) + 1):
+            if labels[index:] in self._names:
+                return self._records.get(("*", ) + labels[index:])
+        return None
+
+    def exists(self, labels):
+        """Whether ``labels`` is a name in this zone."""
+        labels = tuple(label.lower() for label in labels)
+        return labels in self._names or self._find(labels) is not None
+
+    def answers(self, query):
+        """
+        The records answering ``query``, following CNAMEs within the zone.
+        Owner names are the question's, or the CNAME targets'.
+        """
+        rrtype = query.rrtype
+        owner = query.labels
+        answers = []
+        records = self._records.get(owner)
+        if records is None:
+            records = self._find(tuple(label.lower() for label in owner))
+        for _ in range(MAX_CHAIN):
+            if not records:
+                break
+            matching = [
+                record for record in records
+                if record.rrtype == rrtype or rrtype == DNS.RRType.ANY
+            ]
+            if matching or records[0].rrtype != DNS.RRType.CNAME:
+                answers.extend(
+                    Record(owner, record.rrtype, record.rdata, record.ttl,
+                           query.qclass)
+                    for record in matching
+                )
+                break
+            cname = records[0]
+            answers.append(Record(
+                owner, cname.rrtype, cname.rdata, cname.ttl, query.qclass
+            ))
+            owner = cname.rdata[0]
+            records = self._find(owner)
+        return answers
@@ -2,7 +2,10 @@ import functools
 import logging
 import os
 import pytest
+import socket
+import struct
 import tempfile
+import threading
 
 import devns
 import devns.cli
@@ -40,8 +43,14 @@ def parse_args(config):
     return functools.partial(devns.cli.parse_args, config=config)
 
 
+@pytest.fixture
+def state_file(config, tmpdir):
+    config.state_file = str(tmpdir.join("state.json"))
+    return config.state_file
+
+
 @pytest.yield_fixture
-def server(config, resolver_dir):
+def server(config, resolver_dir, state_file):
     yield devns.server.DevNS(config)
 
 
@@ -66,3 +75,81 @@ def Connection():
             raise response()
 
     return Connection
+
+
+class StandIn(object):
+    """
+    An upstream resolver on loopback for forwarding to. Every datagram it
+    gets is passed to ``reply``, and whatever that returns is sent back.
+    With ``tcp``, it answers one TCP connection on the same port, with
+    ``reply`` too.
+    """
+
+    def __init__(self, reply, tcp=False):
+        self.reply = reply
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.05)
+        self.address = self.sock.getsockname()
+        self.upstream = "%s:%d" % self.address
+        self._stopping = False
+        self._threads = [threading.Thread(target=self._udp)]
+        if tcp:
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.bind(self.address)
+            self.listener.listen(1)
+            self.listener.settimeout(0.05)
+            self._threads.append(threading.Thread(target=self._tcp))
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def _udp(self):
+        while not self._stopping:
+            try:
+                data, client = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            self.queries.append(data)
+            for response in self.reply(data):
+                self.sock.sendto(response, client)
+
+    def _tcp(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+                break
+            except socket.timeout:
+                if self._stopping:
+                    self.listener.close()
+                    return
+        connection.settimeout(5)
+        try:
+            length = struct.unpack("!H", connection.recv(2))[0]
+            data = connection.recv(length)
+            self.queries.append(data)
+            for response in self.reply(data):
+                connection.sendall(struct.pack("!H", len(response)) + response)
+        finally:
+            connection.close()
+            self.listener.close()
+
+    def close(self):
+        self._stopping = True
+        for thread in self._threads:
+            thread.join()
+        self.sock.close()
+
+
+@pytest.yield_fixture
+def upstream():
+    standins = []
+
+    def start(reply, tcp=False):
+        standins.append(StandIn(reply, tcp))
+        return standins[-1]
+
+    yield start
+    for standin in standins:
+        standin.close()
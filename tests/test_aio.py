@@ -0,0 +1,135 @@
+import socket
+import pytest
+
+from mock import patch, MagicMock
+
+from devns import aio
+from devns.dns import Header, Query, Request
+from devns.server import DevNS
+
+asyncio = pytest.importorskip("asyncio")
+
+QUERY = (
+    b"Kj\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+    b"\x04test\x05local\x03dev\x00\x00\x01\x00\x01"
+)
+RESPONSE = (
+    b"Kj\x85\x90\x00\x01\x00\x01\x00\x00\x00\x00"
+    b"\x04test\x05local\x03dev\x00\x00\x01\x00\x01"
+    b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"
+)
+
+
+@pytest.yield_fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.yield_fixture
+def bound(config, server):
+    config.host = "127.0.0.1"
+    config.address = server.address = "1.2.3.4"
+    with server.bind() as connection:
+        yield connection
+
+
+@pytest.mark.parametrize("query, expected", [
+    (QUERY, RESPONSE),
+    (b"\x96\xd1\x50\x00\x00\x01\x00\x00\x00\x00\x00\x00", None),
+])
+def test_protocol_datagram_received(config, server, loop, query, expected):
+    config.address = server.address = "1.2.3.4"
+    protocol = aio.DNSProtocol(server, loop)
+    protocol.connection_made(MagicMock())
+    transport = protocol.transport
+    protocol.datagram_received(query, ("127.0.0.1", 5000))
+    if expected is None:
+        assert not transport.sendto.called
+    else:
+        transport.sendto.assert_called_once_with(
+            expected, ("127.0.0.1", 5000)
+        )
+
+
+def test_protocol_survives_errors(server, loop):
+    protocol = aio.DNSProtocol(server, loop)
+    protocol.connection_made(MagicMock())
+    with patch.object(server, "_build_response", side_effect=ValueError):
+        protocol.datagram_received(QUERY, ("127.0.0.1", 5000))
+    assert not protocol.transport.sendto.called
+    protocol.error_received(OSError())
+    protocol.connection_lost(None)
+    assert protocol.transport is None
+
+
+def test_endpoint(server, bound, loop):
+    transport, protocol = loop.run_until_complete(server.endpoint(loop))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(1)
+    try:
+        client.sendto(QUERY, bound.getsockname())
+        loop.run_until_complete(asyncio.sleep(0.05))
+        assert client.recv(512) == RESPONSE
+    finally:
+        client.close()
+        transport.close()
+        loop.run_until_complete(asyncio.sleep(0))
+
+
+def test_endpoint_forward(config, upstream, bound, loop):
+    # Questions about slow.example.com go unanswered.
+    standin = upstream(lambda data: [] if b"slow" in data else [
+        data[:2] + b"\x81\x80" + data[4:]
+    ])
+    config.upstreams = [standin.upstream]
+    config.upstream_timeout = 0.5
+    server = DevNS(config)
+    server.connection = bound
+    transport, protocol = loop.run_until_complete(server.endpoint(loop))
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(0)
+    received = []
+    try:
+        with server._forwarding():
+            for id, name in ((1, ("slow", "example", "com")),
+                             (2, ("example", "com"))):
+                client.sendto(Request(
+                    Header(id, rd=1, query=1), Query(1, name)
+                ).to_bytes(), bound.getsockname())
+            for _ in range(100):
+                loop.run_until_complete(asyncio.sleep(0.01))
+                try:
+                    received.append(Header.from_bytes(client.recv(512)))
+                except socket.error:
+                    continue
+                if len(received) == 2:
+                    break
+    finally:
+        client.close()
+        transport.close()
+        loop.run_until_complete(asyncio.sleep(0))
+    # The answer that came straight back didn't wait on the one that didn't.
+    assert [(header.id, header.rcode) for header in received] == [
+        (2, 0), (1, 2)
+    ]
+
+
+def test_serve_forever(server, bound, loop):
+    loop.call_later(0.01, loop.stop)
+    assert aio.serve_forever(server, loop) == 0
+
+
+@patch("devns.server.aio.serve_forever", return_value=0)
+def test_server_listen_asyncio(serve_forever, config, server, Connection):
+    config.mode = "asyncio"
+    server.connection = Connection([], None)
+    assert server._listen() == 0
+    serve_forever.assert_called_once_with(server)
+
+
+@patch("devns.server.aio.available", return_value=False)
+def test_server_listen_asyncio_unavailable(available, config, server):
+    config.mode = "asyncio"
+    assert server._listen_asyncio() == 4
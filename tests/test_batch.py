@@ -0,0 +1,110 @@
+import socket
+import pytest
+
+from mock import patch
+
+from devns import batch as _batch
+from devns.batch import Batch, FallbackBatch, new_batch
+
+
+@pytest.yield_fixture
+def sockets():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(1)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(1)
+    yield server, client
+    server.close()
+    client.close()
+
+
+needs_mmsg = pytest.mark.skipif(
+    not _batch.available(), reason="recvmmsg is unavailable"
+)
+
+
+@needs_mmsg
+def test_batch_recv_and_flush(sockets):
+    server, client = sockets
+    batch = Batch(server, 8, 64)
+    for index in range(5):
+        client.sendto(b"datagram %d" % index, server.getsockname())
+    assert batch.recv() == 5
+    for index in range(5):
+        assert bytes(batch.datagram(index)) == b"datagram %d" % index
+        assert batch.client(index) == client.getsockname()
+        batch.reply(index, b"reply %d" % index)
+    assert batch.flush() == 5
+    for index in range(5):
+        assert client.recvfrom(64) == (
+            b"reply %d" % index, server.getsockname()
+        )
+
+
+@needs_mmsg
+def test_batch_recv_caps_at_size(sockets):
+    server, client = sockets
+    batch = Batch(server, 2, 64)
+    for index in range(3):
+        client.sendto(b"%d" % index, server.getsockname())
+    assert batch.recv() == 2
+    assert batch.recv() == 1
+    assert bytes(batch.datagram(0)) == b"2"
+
+
+@needs_mmsg
+def test_batch_recv_truncates_to_bufsize(sockets):
+    server, client = sockets
+    batch = Batch(server, 2, 4)
+    client.sendto(b"0123456789", server.getsockname())
+    assert batch.recv() == 1
+    assert bytes(batch.datagram(0)) == b"0123"
+
+
+@needs_mmsg
+def test_batch_recv_timeout(sockets):
+    server, _ = sockets
+    server.settimeout(0.01)
+    assert Batch(server, 2, 64).recv() == 0
+
+
+@needs_mmsg
+def test_batch_reuses_buffers(sockets):
+    server, client = sockets
+    batch = Batch(server, 2, 64)
+    client.sendto(b"first", server.getsockname())
+    batch.recv()
+    first = batch.datagram(0)
+    client.sendto(b"again", server.getsockname())
+    batch.recv()
+    assert bytes(first) == b"again"
+
+
+def test_fallback_batch(sockets):
+    server, client = sockets
+    batch = FallbackBatch(server, 8, 64)
+    client.sendto(b"datagram", server.getsockname())
+    assert batch.recv() == 1
+    assert bytes(batch.datagram(0)) == b"datagram"
+    assert batch.client(0) == client.getsockname()
+    batch.reply(0, b"reply")
+    assert batch.flush() == 0
+    assert client.recvfrom(64) == (b"reply", server.getsockname())
+
+
+@pytest.mark.parametrize("platform", ["freebsd12", "darwin", "win32"])
+def test_batch_linux_only(platform):
+    with patch.object(_batch.sys, "platform", platform):
+        assert _batch._load_libc() == (None, None)
+
+
+@pytest.mark.parametrize("available, size, expected", [
+    (True, 32, Batch),
+    (True, 1, FallbackBatch),
+    (False, 32, FallbackBatch),
+])
+def test_new_batch(sockets, available, size, expected):
+    with patch.object(_batch, "available", return_value=available):
+        assert isinstance(new_batch(sockets[0], size), expected)
@@ -0,0 +1,81 @@
+from devns.cache import ResponseCache
+
+key = (("local", "dev"), 1, 1)
+response = b"\xdb\xab\x81\x90\x00\x01\x00\x01\x00\x00\x00\x00rest"
+
+
+def test_cache_get_miss():
+    cache = ResponseCache()
+    assert cache.get(key, 1, 0x8180) is None
+
+
+def test_cache_get_patches_id_and_recursion():
+    cache = ResponseCache()
+    cache.set(key, response)
+    assert key in cache
+    assert cache.get(key, 0x2401, 0) == (
+        b"\x24\x01\x80\x10\x00\x01\x00\x01\x00\x00\x00\x00rest"
+    )
+    assert cache.get(key, 0xdbab, 1) == response
+
+
+def test_cache_get_keeps_flags():
+    cache = ResponseCache()
+    # TC and NXDOMAIN were worked out building the response, not from the
+    # request, so they stay.
+    cache.set(key, b"\xdb\xab\x87\x83" + response[4:])
+    assert cache.get(key, 1, 0)[:4] == b"\x00\x01\x86\x03"
+    assert cache.get(key, 1, 1)[:4] == b"\x00\x01\x87\x83"
+
+
+def test_cache_lru_eviction():
+    cache = ResponseCache(size=2)
+    keys = [(("%d" % i, "dev"), 1, 1) for i in range(3)]
+    cache.set(keys[0], response)
+    cache.set(keys[1], response)
+    cache.get(keys[0], 1, 0)
+    cache.set(keys[2], response)
+    assert len(cache) == 2
+    assert keys[0] in cache
+    assert keys[1] not in cache
+    assert keys[2] in cache
+
+
+def test_cache_disabled():
+    cache = ResponseCache(size=0)
+    cache.set(key, response)
+    assert len(cache) == 0
+
+
+def test_cache_clear():
+    cache = ResponseCache()
+    cache.set(key, response)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_cache_shared_between_threads():
+    import threading
+
+    cache = ResponseCache(8)
+    errors = []
+
+    def hammer(offset):
+        try:
+            for index in range(2000):
+                key = (offset + index) % 16
+                cache.set(key, b"\x00" * 4 + b"%d" % key)
+                cache.get((key + 1) % 16, 1, 2)
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=hammer, args=(offset, ))
+        for offset in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(cache) <= 8
@@ -1,3 +1,4 @@
+import os
 import pytest
 import subprocess
 
@@ -8,6 +9,12 @@ def test_parse_args_address(parse_args, config, address):
     assert config.address == address
 
 
+@pytest.mark.parametrize("address6", ("fd00::1", "fe80::1"))
+def test_parse_args_address6(parse_args, config, address6):
+    parse_args(["--address6", address6])
+    assert config.address6 == address6
+
+
 @pytest.mark.parametrize(
     "domains, expected",
     [
@@ -87,3 +94,196 @@ def test_executing_as_a_module(parse_args):
     assert subprocess.check_call(
         ("python", "-m", "devns.cli", "--version")
     ) == 0
+
+
+@pytest.mark.parametrize("args, discovery", [
+    ([], ("netlink", "ioctl", "proc", "ifconfig")),
+    (["--discovery", "proc", "ifconfig"], ["proc", "ifconfig"]),
+])
+def test_parse_args_discovery(parse_args, config, args, discovery):
+    parse_args(args)
+    assert config.discovery == discovery
+
+
+@pytest.mark.parametrize("args, watch", [([], True), (["--no-watch"], False)])
+def test_parse_args_watch(parse_args, config, args, watch):
+    parse_args(args)
+    assert config.watch == watch
+
+
+@pytest.mark.parametrize("args, state_file", [
+    (["--state-file", "/tmp/devns.json"], "/tmp/devns.json"),
+    (["--no-state"], None),
+])
+def test_parse_args_state_file(parse_args, config, args, state_file):
+    parse_args(args)
+    assert config.state_file == state_file
+
+
+def test_parse_args_state_file_default(parse_args, config):
+    parse_args([])
+    assert config.state_file.endswith(
+        os.path.join(".cache", "devns", "state.json")
+    )
+
+
+@pytest.mark.parametrize("args, rules", [
+    ([], ()),
+    (
+        ["--rules", "*.api.dev=10.0.0.5", "db.local.co=::1"],
+        ["*.api.dev=10.0.0.5", "db.local.co=::1"]
+    ),
+])
+def test_parse_args_rules(parse_args, config, args, rules):
+    parse_args(args)
+    assert config.rules == rules
+
+
+@pytest.mark.parametrize("rule", ["api.dev", "a.*.dev=10.0.0.1"])
+def test_parse_args_rules_invalid(parse_args, rule):
+    with pytest.raises(SystemExit):
+        parse_args(["--rules", rule])
+
+
+@pytest.mark.parametrize("args, hosts_file", [
+    ([], None), (["--hosts-file", "/etc/hosts"], "/etc/hosts")
+])
+def test_parse_args_hosts_file(parse_args, config, args, hosts_file):
+    parse_args(args)
+    assert config.hosts_file == hosts_file
+
+
+@pytest.mark.parametrize("args, zone_files", [
+    ([], ()),
+    (["--zone-files", "a.zone", "b.zone"], ["a.zone", "b.zone"]),
+])
+def test_parse_args_zone_files(parse_args, config, args, zone_files):
+    parse_args(args)
+    assert config.zone_files == zone_files
+
+
+@pytest.mark.parametrize("args, upstreams, timeout, sockets", [
+    ([], (), 2.0, 8),
+    (
+        ["--upstreams", "10.0.0.1", "[::1]:5353", "--upstream-timeout",
+         "0.5", "--upstream-sockets", "32"],
+        ["10.0.0.1", "[::1]:5353"], 0.5, 32
+    ),
+])
+def test_parse_args_upstreams(parse_args, config, args, upstreams, timeout,
+                              sockets):
+    parse_args(args)
+    assert config.upstreams == upstreams
+    assert config.upstream_timeout == timeout
+    assert config.upstream_sockets == sockets
+
+
+@pytest.mark.parametrize("upstream", ["resolver.example.com", "10.0.0.1:0"])
+def test_parse_args_upstreams_invalid(parse_args, upstream):
+    with pytest.raises(SystemExit):
+        parse_args(["--upstreams", upstream])
+
+
+def test_parse_args_discovery_invalid(parse_args):
+    with pytest.raises(SystemExit):
+        parse_args(["--discovery", "carrier-pigeon"])
+
+
+@pytest.mark.parametrize("args, listen", [
+    ([], ()),
+    (["--listen", "172.17.0.1", "::"], ["172.17.0.1", "::"]),
+    (["-l", "::1"], ["::1"]),
+])
+def test_parse_args_listen(parse_args, config, args, listen):
+    parse_args(args)
+    assert config.listen == listen
+
+
+@pytest.mark.parametrize("args, tcp, connections, timeout", [
+    ([], True, 64, 10),
+    (["--no-tcp"], False, 64, 10),
+    (["--tcp-connections", "8", "--tcp-timeout", "2.5"], True, 8, 2.5),
+])
+def test_parse_args_tcp(parse_args, config, args, tcp, connections, timeout):
+    parse_args(args)
+    assert config.tcp == tcp
+    assert config.tcp_connections == connections
+    assert config.tcp_timeout == timeout
+
+
+@pytest.mark.parametrize("args, mode", [
+    ([], "blocking"),
+    (["--mode", "asyncio"], "asyncio"),
+    (["-m", "blocking"], "blocking"),
+    (["-m", "threaded"], "threaded"),
+])
+def test_parse_args_mode(parse_args, config, args, mode):
+    parse_args(args)
+    assert config.mode == mode
+
+
+@pytest.mark.parametrize("args, workers, pin_cpus", [
+    ([], 1, False),
+    (["--workers", "4"], 4, False),
+    (["-w", "2", "--pin-cpus"], 2, True),
+])
+def test_parse_args_workers(parse_args, config, args, workers, pin_cpus):
+    parse_args(args)
+    assert config.workers == workers
+    assert config.pin_cpus == pin_cpus
+
+
+@pytest.mark.parametrize("args, min_threads, max_threads", [
+    ([], 1, 8),
+    (["--min-threads", "2", "--max-threads", "16"], 2, 16),
+])
+def test_parse_args_threads(parse_args, config, args, min_threads,
+                            max_threads):
+    parse_args(args)
+    assert config.min_threads == min_threads
+    assert config.max_threads == max_threads
+
+
+@pytest.mark.parametrize("args, max_payload", [
+    ([], 1232),
+    (["--max-payload", "4096"], 4096),
+    (["--max-payload", "512"], 512),
+    (["--max-payload", "65535"], 65535),
+])
+def test_parse_args_max_payload(parse_args, config, args, max_payload):
+    parse_args(args)
+    assert config.max_payload == max_payload
+
+
+@pytest.mark.parametrize("payload", ["511", "65536", "100000", "big"])
+def test_parse_args_max_payload_invalid(parse_args, payload):
+    with pytest.raises(SystemExit):
+        parse_args(["--max-payload", payload])
+
+
+@pytest.mark.parametrize("args, batch_size", [
+    ([], 0),
+    (["--batch", "32"], 32),
+])
+def test_parse_args_batch_size(parse_args, config, args, batch_size):
+    parse_args(args)
+    assert config.batch_size == batch_size
+
+
+@pytest.mark.parametrize("args, cache_size", [
+    ([], 1024),
+    (["--cache-size", "0"], 0),
+    (["-c", "64"], 64),
+])
+def test_parse_args_cache_size(parse_args, config, args, cache_size):
+    parse_args(args)
+    assert config.cache_size == cache_size
+
+
+@pytest.mark.parametrize("args, pool_size", [
+    ([], 16),
+    (["--pool-size", "0"], 0),
+])
+def test_parse_args_pool_size(parse_args, config, args, pool_size):
+    parse_args(args)
+    assert config.pool_size == pool_size
@@ -14,6 +14,12 @@ def test_config_address(config, address):
     assert config.address == address
 
 
+@pytest.mark.parametrize("address6", ("fd00::1", "fe80::1"))
+def test_config_address6(config, address6):
+    config.address6 = address6
+    assert config.address6 == address6
+
+
 @pytest.mark.parametrize(
     "domains, expected",
     [
@@ -75,3 +81,114 @@ def test_config_verbosity(logger, config, verbosity, level):
     config.verbosity = verbosity
     assert config.log_level == level
     assert config.verbosity == verbosity
+
+
+@pytest.mark.parametrize("batch_size", (0, 32))
+def test_config_batch_size(config, batch_size):
+    config.batch_size = batch_size
+    assert config.batch_size == batch_size
+
+
+@pytest.mark.parametrize("cache_size", (0, 64, 1024))
+def test_config_cache_size(config, cache_size):
+    config.cache_size = cache_size
+    assert config.cache_size == cache_size
+
+
+@pytest.mark.parametrize("min_threads, max_threads", [(1, 8), (2, 32)])
+def test_config_threads(config, min_threads, max_threads):
+    config.min_threads = min_threads
+    config.max_threads = max_threads
+    assert config.min_threads == min_threads
+    assert config.max_threads == max_threads
+
+
+@pytest.mark.parametrize("mode", ("blocking", "threaded", "asyncio"))
+def test_config_mode(config, mode):
+    config.mode = mode
+    assert config.mode == mode
+
+
+@pytest.mark.parametrize("tcp, connections, timeout", [
+    (True, 64, 10),
+    (False, 8, 2.5),
+])
+def test_config_tcp(config, tcp, connections, timeout):
+    config.tcp = tcp
+    config.tcp_connections = connections
+    config.tcp_timeout = timeout
+    assert config.tcp == tcp
+    assert config.tcp_connections == connections
+    assert config.tcp_timeout == timeout
+
+
+@pytest.mark.parametrize("hosts_file", [None, "/etc/hosts"])
+def test_config_hosts_file(config, hosts_file):
+    config.hosts_file = hosts_file
+    assert config.hosts_file == hosts_file
+
+
+@pytest.mark.parametrize("upstreams, timeout, sockets", [
+    ((), 2.0, 8), (["10.0.0.1", "[::1]:5353"], 0.5, 32)
+])
+def test_config_upstreams(config, upstreams, timeout, sockets):
+    config.upstreams = upstreams
+    config.upstream_timeout = timeout
+    config.upstream_sockets = sockets
+    assert config.upstreams == upstreams
+    assert config.upstream_timeout == timeout
+    assert config.upstream_sockets == sockets
+
+
+@pytest.mark.parametrize("zone_files", [(), ["local.dev.zone"]])
+def test_config_zone_files(config, zone_files):
+    config.zone_files = zone_files
+    assert config.zone_files == zone_files
+
+
+@pytest.mark.parametrize("rules", [(), ["*.api.dev=10.0.0.5"]])
+def test_config_rules(config, rules):
+    config.rules = rules
+    assert config.rules == rules
+
+
+@pytest.mark.parametrize("state_file", ["/tmp/devns.json", None])
+def test_config_state_file(config, state_file):
+    config.state_file = state_file
+    assert config.state_file == state_file
+
+
+@pytest.mark.parametrize("watch", (True, False))
+def test_config_watch(config, watch):
+    config.watch = watch
+    assert config.watch == watch
+
+
+@pytest.mark.parametrize("discovery", [("netlink", "ifconfig"), ("proc", )])
+def test_config_discovery(config, discovery):
+    config.discovery = discovery
+    assert config.discovery == discovery
+
+
+@pytest.mark.parametrize("listen", [(), ["127.0.0.1", "::"]])
+def test_config_listen(config, listen):
+    config.listen = listen
+    assert config.listen == listen
+
+
+@pytest.mark.parametrize("workers", (1, 4))
+def test_config_workers(config, workers):
+    config.workers = workers
+    assert config.workers == workers
+
+
+@pytest.mark.parametrize("pin_cpus", (True, False))
+def test_config_pin_cpus(config, pin_cpus):
+    config.pin_cpus = pin_cpus
+    assert config.pin_cpus == pin_cpus
+
+
+@pytest.mark.parametrize("pool_size", (0, 16))
+def test_config_pool_size(config, pool_size):
+    config.pool_size = pool_size
+    assert config.pool_size == pool_size
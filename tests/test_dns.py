@@ -1,5 +1,8 @@
 import pytest
-from devns.dns import _intify, Header, Query, Request, Response
+from devns.dns import (
+    CLASSES, OPCODES, RCODES, RRTYPES, DNS, FormatError, _intify, pack_flags, unpack_flags,
+    Header, MessageBuilder, Opt, Query, Record, Request, RequestPool, Response
+)
 
 header = Header(
     id=56235, qr=0, opcode=0, aa=0, tc=0, rd=0, ra=0, z=0, ad=0, cd=1, rcode=0,
@@ -53,3 +56,403 @@ def test_nonstandard_header_attributes():
 ])
 def test_intify(value, expected):
     assert _intify(value) == expected
+
+
+packets = [
+    b"\xdb\xab\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01",  # noqa
+    b"$\x01\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x04test\x05local\x03dev\x00\x00\x01\x00\x01",  # noqa
+    b"\xc8\xdd\x01 \x00\x01\x00\x00\x00\x00\x00\x01\x05local\x03dev\x00\x00\x1c\x00\x01\x00\x00)\x10\x00\x00\x00\x00\x00\x00\x00",  # noqa
+    b"\x00\x00\xff\xff\x00\x01\x00\x00\x00\x00\x00\x00\x00\x00\x0f\x00\x01",  # noqa
+]
+
+
+def _string_flags(flags):
+    # The original, string based decoding, kept as a reference.
+    flags = format(flags, "016b")
+    return (
+        int(flags[0], 2), int(flags[1:5], 2), int(flags[5], 2),
+        int(flags[6], 2), int(flags[7], 2), int(flags[8], 2),
+        int(flags[9], 2), int(flags[10], 2), int(flags[11], 2),
+        int(flags[12:], 2),
+    )
+
+
+def test_flags_round_trip():
+    for flags in range(0x10000):
+        fields = unpack_flags(flags)
+        assert fields == _string_flags(flags)
+        assert pack_flags(*fields) == flags
+
+
+@pytest.mark.parametrize("data", packets)
+def test_header_round_trip(data):
+    assert Header.from_bytes(data).to_bytes() == data[:12]
+    assert Header.from_bytes(memoryview(data)).to_bytes() == data[:12]
+
+
+@pytest.mark.parametrize("data", packets)
+def test_request_round_trip(data):
+    request = Request.from_bytes(data)
+    end = 12 + len(request.query.to_bytes())
+    if request.opt is not None:
+        end += len(request.opt.to_bytes())
+    assert request.to_bytes() == data[:end]
+    assert repr(Request.from_bytes(memoryview(data))) == repr(request)
+
+
+def test_header_from_bytes_fields():
+    header = Header.from_bytes(packets[1])
+    assert header.id == 0x2401
+    assert (header.rd, header.cd, header.query) == (1, 0, 1)
+
+
+def test_response_to_bytes():
+    assert response.to_bytes() == (
+        b"\xdb\xab\x00\x10\x00\x01\x00\x01\x00\x00\x00\x00\x05local\x03dev"
+        b"\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04"
+        b"\x01\x02\x03\x04"
+    )
+
+
+@pytest.mark.parametrize("instance", [header, query, request, response])
+def test_slots(instance):
+    assert not hasattr(instance, "__dict__")
+
+
+def test_query_labels_interned():
+    first = Query.from_bytes(packets[0])
+    second = Query.from_bytes(packets[2])
+    assert first.labels == ("local", "dev")
+    assert first.labels is second.labels
+
+
+def test_request_pool():
+    pool = RequestPool(size=1)
+    first = pool.acquire(packets[0])
+    assert first.header.id == 0xdbab
+    pool.release(first)
+    second = pool.acquire(packets[1])
+    assert second is first
+    assert second.header.id == 0x2401
+    assert second.query.labels == ("test", "local", "dev")
+    pool.release(second)
+    pool.release(Request.from_bytes(packets[0]))
+    assert len(pool) == 1
+
+
+def test_request_pool_disabled():
+    pool = RequestPool(size=0)
+    request = pool.acquire(packets[0])
+    pool.release(request)
+    assert len(pool) == 0
+    assert pool.acquire(packets[0]) is not request
+
+
+def test_request_lazy_query():
+    data = b"\xb8\x8b(\x10\x00\x01\x00\x00\x00\x00\x00\x00\x05local"
+    request = Request.from_bytes(data)
+    assert request.header.opcode == 5
+    with pytest.raises(FormatError):
+        request.query
+
+
+def test_request_pool_failed_decode():
+    pool = RequestPool(size=1)
+    request = pool.acquire(packets[0])
+    assert request.query.labels == ("local", "dev")
+    pool.release(request)
+    truncated = b"\x00\x02\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local"
+    assert pool.acquire(truncated) is request
+    # Failing once doesn't leave the last message's question behind.
+    for _ in range(2):
+        with pytest.raises(FormatError):
+            request.query
+
+
+def test_request_query_decoded_once():
+    request = Request.from_bytes(packets[0])
+    assert request.query is request.query
+    assert request.query.labels == ("local", "dev")
+    request.query = query
+    assert request.query is query
+
+
+@pytest.mark.parametrize("registry, code, mnemonic", [
+    (OPCODES, 0, "Query"),
+    (OPCODES, 5, "Update"),
+    (RCODES, 3, "NXDomain"),
+    (RCODES, 16, "BADVERS"),
+    (RRTYPES, 1, "A"),
+    (RRTYPES, 28, "AAAA"),
+    (RRTYPES, 255, "ANY"),
+    (CLASSES, 1, "IN"),
+    (CLASSES, 3, "CH"),
+    (RRTYPES, 65280, "65280"),
+])
+def test_registry_mnemonic(registry, code, mnemonic):
+    assert registry.mnemonic(code) == mnemonic
+
+
+@pytest.mark.parametrize("registry, mnemonic, code", [
+    (RRTYPES, "aaaa", 28),
+    (RRTYPES, "NSAP-PTR", 23),
+    (RRTYPES, "NSAP_PTR", 23),
+    (RRTYPES, "TYPE65", 65),
+    (RCODES, "BADSIG", 16),
+    (RCODES, "badvers", 16),
+    (CLASSES, "Internet", 1),
+    (CLASSES, "class4", 4),
+])
+def test_registry_code(registry, mnemonic, code):
+    assert registry.code(mnemonic) == code
+
+
+@pytest.mark.parametrize("registry, mnemonic", [
+    (RRTYPES, "BOGUS"),
+    (RRTYPES, "TYPE"),
+    (RRTYPES, "TYPE65536"),
+    (OPCODES, "OPCODE1"),
+])
+def test_registry_code_unknown(registry, mnemonic):
+    with pytest.raises(KeyError):
+        registry.code(mnemonic)
+
+
+def test_registry_covers_table():
+    for name, code in vars(DNS.RRType).items():
+        if not name.startswith("_"):
+            assert code in RRTYPES
+            assert RRTYPES.code(name) == code
+    assert len(RCODES) == len(set(
+        code for name, code in vars(DNS.RCode).items()
+        if not name.startswith("_")
+    ))
+    assert (0, "NoError") in list(RCODES)
+
+
+def _builder(limit=512):
+    builder = MessageBuilder(Header(id=1, qr=1, aa=1), limit)
+    builder.questions.append(Query(rrtype=1, labels=("www", "local", "dev")))
+    return builder
+
+
+def test_builder_compresses_owner_names():
+    builder = _builder()
+    for address in ("10.0.0.1", "10.0.0.2", "10.0.0.3"):
+        builder.answers.append(
+            Record.address(("www", "local", "dev"), address)
+        )
+    data = builder.to_bytes()
+    question = 12 + 15 + 4
+    assert data[4:12] == b"\x00\x01\x00\x03\x00\x00\x00\x00"
+    # Every answer is a two byte pointer to the question name plus 14 bytes.
+    assert len(data) == question + 3 * 16
+    assert data[question:question + 2] == b"\xc0\x0c"
+    assert data.count(b"\x03www") == 1
+
+
+def test_builder_compresses_rdata_names():
+    builder = _builder()
+    builder.answers.append(Record(
+        ("www", "local", "dev"), DNS.RRType.CNAME, (("app", "local", "dev"), )
+    ))
+    builder.authority.append(Record.soa(
+        ("local", "dev"), ("ns", "local", "dev"),
+        ("hostmaster", "local", "dev"), 1, 3600, 600, 86400, 60
+    ))
+    data = builder.to_bytes()
+    assert data[4:12] == b"\x00\x01\x00\x01\x00\x01\x00\x00"
+    # "local.dev" is only ever spelled out once, in the question.
+    assert data.count(b"\x05local") == 1
+    assert data.count(b"\xc0\x10") == 4
+    request = Request.from_bytes(data)
+    assert request.query.labels == ("www", "local", "dev")
+
+
+def test_builder_does_not_compress_srv_targets():
+    builder = _builder()
+    builder.answers.append(Record(
+        ("www", "local", "dev"), DNS.RRType.SRV,
+        (b"\x00\x01\x00\x02\x00\x50", ("www", "local", "dev"))
+    ))
+    data = builder.to_bytes()
+    assert data.endswith(b"\x00\x50\x03www\x05local\x03dev\x00")
+
+
+def test_builder_drops_additional_before_truncating():
+    builder = _builder(limit=12 + 19 + 2 * 16)
+    builder.answers.append(Record.address(("www", "local", "dev"), "10.0.0.1"))
+    builder.additional.append(
+        Record.address(("www", "local", "dev"), "10.0.0.2")
+    )
+    builder.additional.append(
+        Record.address(("www", "local", "dev"), "10.0.0.3")
+    )
+    data = builder.to_bytes()
+    assert len(data) == 12 + 19 + 2 * 16
+    assert data[2:12] == b"\x84\x00\x00\x01\x00\x01\x00\x00\x00\x01"
+
+
+def test_builder_truncates_answers():
+    builder = _builder(limit=12 + 19 + 16)
+    for address in ("10.0.0.1", "10.0.0.2"):
+        builder.answers.append(
+            Record.address(("www", "local", "dev"), address)
+        )
+    builder.authority.append(
+        Record.address(("www", "local", "dev"), "10.0.0.3")
+    )
+    data = builder.to_bytes()
+    assert len(data) == 12 + 19 + 16
+    assert data[2:12] == b"\x86\x00\x00\x01\x00\x01\x00\x00\x00\x00"
+
+
+@pytest.mark.parametrize("record, expected", [
+    (
+        Record.address(("local", "dev"), "10.0.0.1"),
+        "local.dev.\t\t  60\t  IN\t  A\t  10.0.0.1"
+    ),
+    (
+        Record.address(("local", "dev"), "fd00::1", ttl=30),
+        "local.dev.\t\t  30\t  IN\t  AAAA\t  fd00::1"
+    ),
+    (
+        Record.soa(
+            ("dev", ), ("ns", "dev"), ("hostmaster", "dev"), 1, 2, 3, 4, 5
+        ),
+        "dev.\t\t  60\t  IN\t  SOA\t  ns.dev. hostmaster.dev. 1 2 3 4 5"
+    ),
+    (
+        Record(("dev", ), DNS.RRType.MX, (b"\x00\x0a", ("mx", "dev"))),
+        "dev.\t\t  60\t  IN\t  MX\t  10 mx.dev."
+    ),
+    (
+        Record((), 65280, b"\xca\xfe"),
+        ".\t\t  60\t  IN\t  65280\t  \\# 2 cafe"
+    ),
+])
+def test_record_str(record, expected):
+    assert str(record) == expected
+
+
+def test_response_sections():
+    ns = Record.soa(
+        ("dev", ), ("ns", "dev"), ("hostmaster", "dev"), 1, 2, 3, 4, 5
+    )
+    response = Response(header, query, authority=[ns])
+    assert response.records == []
+    assert "AUTHORITY SECTION" in str(response)
+    assert "ANSWER SECTION" not in str(response)
+    assert repr(response).endswith("authority=[%r])" % ns)
+    assert response.to_bytes()[4:12] == (
+        b"\x00\x01\x00\x00\x00\x01\x00\x00"
+    )
+
+
+def test_request_opt():
+    request = Request.from_bytes(packets[2])
+    assert repr(request.opt) == (
+        "Opt(payload=4096, rcode=0, version=0, do=0, options=%r)" % b""
+    )
+    assert str(request).startswith(str(request.header) + "\n\n;; OPT")
+    assert Request.from_bytes(packets[0]).opt is None
+
+
+def test_request_opt_after_other_records():
+    # A query carrying an answer record ahead of its OPT record.
+    data = (
+        b"\x00\x01\x00\x00\x00\x01\x00\x01\x00\x00\x00\x01"
+        b"\x03dev\x00\x00\x01\x00\x01"
+        b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"
+        b"\x00\x00)\x02\x00\x01\x00\x80\x00\x00\x02\xab\xcd"
+    )
+    opt = Request.from_bytes(data).opt
+    assert (opt.payload, opt.rcode, opt.version, opt.do) == (512, 1, 0, 1)
+    assert opt.options == b"\xab\xcd"
+    assert opt.to_bytes() == data[-13:]
+
+
+def test_opt_str():
+    assert str(Opt(1232, do=1)) == (
+        ";; OPT PSEUDOSECTION:\n; EDNS: version: 0, flags: do; udp: 1232"
+    )
+
+
+def test_builder_keeps_opt_when_truncating():
+    builder = _builder(limit=12 + 19 + 16 + 11)
+    builder.opt = Opt(1232)
+    builder.header.rcode = DNS.RCode.BADVERS
+    for address in ("10.0.0.1", "10.0.0.2"):
+        builder.answers.append(
+            Record.address(("www", "local", "dev"), address)
+        )
+    data = builder.to_bytes()
+    assert len(data) == 12 + 19 + 16 + 11
+    assert data[2:12] == b"\x86\x00\x00\x01\x00\x01\x00\x00\x00\x01"
+    assert data[-11:] == b"\x00\x00)\x04\xd0\x01\x00\x00\x00\x00\x00"
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    packets[0][:11],
+])
+def test_header_from_bytes_too_short(data):
+    with pytest.raises(FormatError):
+        Header.from_bytes(data)
+
+
+@pytest.mark.parametrize("data", [
+    packets[0][:12],
+    packets[0][:-1],
+    packets[0][:12] + b"\x41" + b"a" * 65 + b"\x00\x00\x01\x00\x01",
+])
+def test_query_from_bytes_malformed(data):
+    with pytest.raises(FormatError):
+        Query.from_bytes(data)
+
+
+compressed = (
+    b"\x00\x01\x01\x00\x00\x02\x00\x00\x00\x00\x00\x00"
+    b"\x05local\x03dev\x00\x00\x01\x00\x01"   # local.dev A
+    b"\x03www\xc0\x0c\x00\x1c\x00\x01"          # www.local.dev AAAA
+)
+
+
+def test_request_queries_follow_pointers():
+    request = Request.from_bytes(compressed)
+    first, second = request.queries
+    assert first is request.query
+    assert first.labels == ("local", "dev")
+    assert second.labels == ("www", "local", "dev")
+    assert second.rrtype == 28
+    # Compressed names intern to the same tuple as their plain spelling
+    assert second.labels is Query.from_bytes(packets[1][:12] + b"\x03www" + packets[0][12:]).labels  # noqa
+    assert str(request).count("QUESTION SECTION") == 2
+
+
+def test_request_queries_empty():
+    request = Request.from_bytes(packets[0][:4] + b"\x00\x00" + packets[0][6:12])
+    assert request.query is None
+    assert request.queries == ()
+
+
+@pytest.mark.parametrize("data", [
+    # pointer to itself
+    compressed[:-6] + b"\xc0\x1b\x00\x1c\x00\x01",
+    # pointer forwards
+    compressed[:-6] + b"\xc0\x30\x00\x1c\x00\x01",
+    # pointer into the header
+    compressed[:-6] + b"\xc0\x02\x00\x1c\x00\x01",
+    # a pointer to a pointer to itself
+    b"".join((
+        compressed[:4], b"\x00\x03", compressed[6:-10],
+        b"\x03www\xc0\x1f\x00\x1c\x00\x01", b"\xc0\x1b\x00\x01\x00\x01",
+    )),
+    # truncated pointer
+    compressed[:-7] + b"\xc0",
+    # more questions than the message holds
+    compressed[:4] + b"\x00\x03" + compressed[6:],
+])
+def test_request_queries_malformed(data):
+    with pytest.raises(FormatError):
+        Request.from_bytes(data).queries
@@ -0,0 +1,232 @@
+import time
+import socket
+import pytest
+import threading
+
+from mock import patch
+
+from devns.dns import Header, Query, Record, Request, Response
+from devns.forward import Forwarder, SocketPool, parse
+
+
+QUERY = Query(1, ("example", "com"))
+MESSAGE = Request(Header(0x1234, rd=1, query=1), QUERY).to_bytes()
+
+
+def answer(data, address="10.9.8.7", id=None, labels=None, tc=0):
+    request = Request.from_bytes(data)
+    header = request.header
+    query = request.query
+    if labels is not None:
+        query = Query(query.rrtype, labels, query.qclass)
+    if id is not None:
+        header.id = id
+    header.qr = 1
+    header.tc = tc
+    answers = [] if tc else [Record.address(query.labels, address)]
+    return Response(header, query, answers=answers).to_bytes()
+
+
+def silent(data):
+    return []
+
+
+@pytest.mark.parametrize("upstream, expected", [
+    ("10.0.0.1", ("10.0.0.1", 53)),
+    ("10.0.0.1:5353", ("10.0.0.1", 5353)),
+    (" 10.0.0.1 ", ("10.0.0.1", 53)),
+    ("::1", ("::1", 53)),
+    ("[::1]:5353", ("::1", 5353)),
+    ("[0:0::1]", ("::1", 53)),
+])
+def test_forward_parse(upstream, expected):
+    assert parse(upstream) == expected
+
+
+@pytest.mark.parametrize("upstream", [
+    "10.0.0", "10.0.0.1:0", "10.0.0.1:65536", "10.0.0.1:dns", "[::1",
+    "[::1]5353", "resolver.example.com",
+])
+def test_forward_parse_invalid(upstream):
+    with pytest.raises(ValueError):
+        parse(upstream)
+
+
+def test_forward_socket_pool():
+    pool = SocketPool(socket.AF_INET, 4)
+    pool.open()
+    try:
+        assert len(pool) == 4
+        ports = set(sock.getsockname()[1] for sock in pool._free)
+        assert len(ports) == 4
+        assert 0 not in ports
+        sock = pool.acquire()
+        assert len(pool) == 3
+        pool.release(sock)
+        assert pool.acquire() is sock
+        # One that might still get a late response isn't kept.
+        pool.release(sock, reuse=False)
+        assert len(pool) == 3
+        with pytest.raises(socket.error):
+            sock.getsockname()
+    finally:
+        pool.close()
+    assert len(pool) == 0
+
+
+def test_forward_socket_pool_port_taken():
+    taken = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    taken.bind(("0.0.0.0", 0))
+    port = taken.getsockname()[1]
+    pool = SocketPool(socket.AF_INET, 1)
+    try:
+        with patch("devns.forward._random.randint", return_value=port):
+            pool.open()
+        # The kernel picked one instead.
+        assert pool._free[0].getsockname()[1] not in (0, port)
+    finally:
+        pool.close()
+        taken.close()
+
+
+def test_forward(upstream):
+    standin = upstream(lambda data: [answer(data)])
+    forwarder = Forwarder([parse(standin.upstream)], timeout=2)
+    forwarder.open()
+    try:
+        response = forwarder.forward(QUERY, MESSAGE)
+    finally:
+        forwarder.close()
+    assert response[:2] == b"\x12\x34"
+    assert response.endswith(b"\x0a\x09\x08\x07")
+    assert len(standin.queries) == 1
+    # Only the ID is ours.
+    assert standin.queries[0][2:] == MESSAGE[2:]
+
+
+def test_forward_drops_other_responses(upstream):
+    def reply(data):
+        id = Header.from_bytes(data).id
+        return [
+            answer(data, "10.0.0.1", id=id ^ 1),
+            answer(data, "10.0.0.2", labels=("example", "org")),
+            answer(data, "10.0.0.3", labels=("EXAMPLE", "com")),
+        ]
+
+    standin = upstream(reply)
+    # Someone else trying their luck from another port.
+    spoofer = upstream(lambda data: [])
+    forwarder = Forwarder([parse(standin.upstream)], timeout=2)
+    forwarder.open()
+    try:
+        with patch("devns.forward._random.randint", return_value=0x4321):
+            sock = forwarder._pools[socket.AF_INET].acquire()
+            forwarder._pools[socket.AF_INET].release(sock)
+            spoofer.sock.sendto(
+                answer(MESSAGE, "10.6.6.6", id=0x4321), sock.getsockname()
+            )
+            response = forwarder.forward(QUERY, MESSAGE)
+    finally:
+        forwarder.close()
+    assert response.endswith(b"\x0a\x00\x00\x03")
+
+
+def test_forward_next_upstream(upstream):
+    down = upstream(silent)
+    up = upstream(lambda data: [answer(data)])
+    forwarder = Forwarder(
+        [parse(down.upstream), parse(up.upstream)], timeout=0.2
+    )
+    pool = forwarder._pools[socket.AF_INET]
+    forwarder.open()
+    free = list(pool._free)
+    try:
+        assert forwarder.forward(QUERY, MESSAGE).endswith(b"\x0a\x09\x08\x07")
+        assert (len(down.queries), len(up.queries)) == (1, 1)
+        # The one left waiting isn't used again...
+        assert len(pool) == len(free) - 1
+        assert set(pool._free) < set(free)
+        # ...and neither is the upstream that didn't answer, for now.
+        assert forwarder.forward(QUERY, MESSAGE).endswith(b"\x0a\x09\x08\x07")
+        assert (len(down.queries), len(up.queries)) == (1, 2)
+    finally:
+        forwarder.close()
+
+
+def test_forward_no_answer(upstream):
+    down = upstream(silent)
+    forwarder = Forwarder([parse(down.upstream)], timeout=0.1)
+    forwarder.open()
+    try:
+        assert forwarder.forward(QUERY, MESSAGE) is None
+    finally:
+        forwarder.close()
+    assert len(down.queries) == 1
+
+
+def test_forward_not_open(upstream):
+    standin = upstream(lambda data: [answer(data)])
+    forwarder = Forwarder([parse(standin.upstream)], timeout=2)
+    assert forwarder.forward(QUERY, MESSAGE) is None
+    assert not standin.queries
+
+
+def test_forward_concurrent(upstream):
+    # Questions about slow.example.com go unanswered.
+    standin = upstream(lambda data: [] if b"slow" in data else [answer(data)])
+    forwarder = Forwarder([parse(standin.upstream)], timeout=0.5)
+    slow = Query(1, ("slow", "example", "com"))
+    answered = []
+    done = threading.Event()
+
+    def callback(name):
+        def callback(response):
+            answered.append((name, response, time.time()))
+            if len(answered) == 2:
+                done.set()
+        return callback
+
+    forwarder.open()
+    try:
+        started = time.time()
+        forwarder.submit(
+            slow, Request(Header(1, query=1), slow).to_bytes(),
+            callback("slow")
+        )
+        forwarder.submit(QUERY, MESSAGE, callback("fast"))
+        assert done.wait(5)
+    finally:
+        forwarder.close()
+    # The one waiting on the upstream didn't hold up the one after it.
+    assert [name for name, _, _ in answered] == ["fast", "slow"]
+    assert answered[0][1].endswith(b"\x0a\x09\x08\x07")
+    assert answered[0][2] - started < 0.4
+    assert answered[1][1] is None
+
+
+def test_forward_close_pending(upstream):
+    down = upstream(silent)
+    forwarder = Forwarder([parse(down.upstream)], timeout=30)
+    responses = []
+    forwarder.open()
+    forwarder.submit(QUERY, MESSAGE, responses.append)
+    while not down.queries:
+        time.sleep(0.01)
+    forwarder.close()
+    assert responses == [None]
+
+
+@pytest.mark.parametrize("tcp", [False, True])
+def test_forward_truncated(upstream, tcp):
+    def reply(data):
+        return [answer(data, tc=not standin.queries[1:])]
+
+    standin = upstream(reply, tcp=True)
+    forwarder = Forwarder([parse(standin.upstream)], timeout=2)
+    forwarder.open()
+    try:
+        response = forwarder.forward(QUERY, MESSAGE, tcp=tcp)
+    finally:
+        forwarder.close()
+    assert Header.from_bytes(response).tc == int(not tcp)
+    assert response.endswith(b"\x0a\x09\x08\x07") == tcp
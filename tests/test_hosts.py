@@ -0,0 +1,190 @@
+import os
+import mock
+import pytest
+
+from devns.hosts import HostsFile, parse
+
+
+@pytest.fixture
+def path(tmpdir):
+    return tmpdir.join("hosts")
+
+
+def write(path, *lines):
+    path.write("".join(line + "\n" for line in lines))
+    # Make sure the change shows, however coarse the clock.
+    stat = os.stat(str(path))
+    os.utime(str(path), (stat.st_atime, stat.st_mtime + 1))
+
+
+@pytest.mark.parametrize("line, expected", [
+    (b"127.0.0.1 localhost", ("127.0.0.1", (("localhost", ), ))),
+    (
+        b"10.0.0.1\tWeb.Local.Dev. db.local.dev # comment\n",
+        ("10.0.0.1", (("web", "local", "dev"), ("db", "local", "dev")))
+    ),
+    (b"::1 ip6-localhost", ("::1", (("ip6-localhost", ), ))),
+    (b"# 10.0.0.1 commented.dev", None),
+    (b"10.0.0.1", None),
+    (b"", None),
+    (b"not-an-address web.dev", None),
+])
+def test_hosts_parse(line, expected):
+    assert parse(line) == expected
+
+
+def test_hosts_load(path):
+    write(
+        path,
+        "# The first line naming something wins",
+        "127.0.0.1 localhost web.dev",
+        "::1 localhost",
+        "10.0.0.1 web.dev db.dev",
+    )
+    hosts = HostsFile(str(path))
+    assert hosts.load() == (3, 0)
+    assert len(hosts) == 3
+    assert hosts.lookup(("localhost", )) == ("127.0.0.1", "::1")
+    assert hosts.lookup(("web", "dev")) == ("127.0.0.1", None)
+    assert hosts.lookup(("DB", "Dev")) == ("10.0.0.1", None)
+    assert hosts.lookup(("other", "dev")) is None
+    # Nothing changed, so nothing to do.
+    assert hosts.reload() == (0, 0)
+
+
+def test_hosts_contains(path):
+    write(path, "10.0.0.1 a.b.dev a.c.dev", "10.0.0.2 d.b.dev")
+    hosts = HostsFile(str(path))
+    hosts.load()
+    for name in ("a.b.dev", "B.dev", "c.dev", "dev"):
+        assert hosts.contains(tuple(name.split(".")))
+    for name in ("x.a.b.dev", "e.dev", "b.com", ""):
+        assert not hosts.contains(tuple(filter(None, name.split("."))))
+    write(path, "10.0.0.2 d.b.dev")
+    hosts.reload()
+    assert hosts.contains(("b", "dev"))
+    assert not hosts.contains(("c", "dev"))
+    write(path)
+    hosts.reload()
+    assert not hosts.contains(("dev", ))
+    assert not hosts._parents
+
+
+def test_hosts_labels_shared(path):
+    write(path, "10.0.0.1 a.local.dev", "10.0.0.2 b.local.dev")
+    hosts = HostsFile(str(path))
+    hosts.load()
+    a, b = sorted(hosts._names)
+    assert a[1] is b[1]
+    assert a[2] is b[2]
+
+
+def test_hosts_reload_incremental(path):
+    lines = ["10.0.0.%d host%d.dev" % (n, n) for n in range(1, 100)]
+    write(path, *lines)
+    hosts = HostsFile(str(path))
+    assert hosts.load() == (99, 0)
+    lines[10] = "10.0.1.1 host11.dev moved.dev"
+    del lines[50]
+    lines.append("fd00::1 host1.dev")
+    write(path, *lines)
+    assert hosts.reload() == (2, 2)
+    assert hosts.lookup(("host11", "dev")) == ("10.0.1.1", None)
+    assert hosts.lookup(("moved", "dev")) == ("10.0.1.1", None)
+    assert hosts.lookup(("host51", "dev")) is None
+    assert hosts.lookup(("host1", "dev")) == ("10.0.0.1", "fd00::1")
+    assert len(hosts) == 99
+
+
+def test_hosts_reload_falls_back(path):
+    lines = [
+        "10.0.0.1 web.dev",
+        "fd00::1 web.dev",
+        "10.0.0.2 web.dev db.dev",
+        "10.0.0.3 db.dev db.dev",
+    ]
+    write(path, *lines)
+    hosts = HostsFile(str(path))
+    hosts.load()
+    assert hosts.lookup(("web", "dev")) == ("10.0.0.1", "fd00::1")
+    # The line that won is gone, so the next one with the name takes over.
+    write(path, *lines[1:])
+    assert hosts.reload() == (0, 1)
+    assert hosts.lookup(("web", "dev")) == ("10.0.0.2", "fd00::1")
+    write(path, *lines[2:])
+    assert hosts.reload() == (0, 1)
+    assert hosts.lookup(("web", "dev")) == ("10.0.0.2", None)
+    # One named twice on a line goes with it.
+    write(path, lines[2])
+    assert hosts.reload() == (0, 1)
+    assert hosts.lookup(("db", "dev")) == ("10.0.0.2", None)
+    write(path, lines[3])
+    assert hosts.reload() == (1, 1)
+    assert hosts.lookup(("web", "dev")) is None
+    assert hosts.lookup(("db", "dev")) == ("10.0.0.3", None)
+    write(path)
+    assert hosts.reload() == (0, 1)
+    assert len(hosts) == 0
+    assert hosts._sources == {}
+    assert hosts._shared == set()
+
+
+def test_hosts_reload_keeps_file_order(path):
+    write(path, "10.0.0.2 web.dev", "10.0.0.2 web.dev")
+    hosts = HostsFile(str(path))
+    hosts.load()
+    # Added above the line that won, so it wins from now on.
+    write(path, "10.0.0.1 web.dev", "10.0.0.2 web.dev")
+    assert hosts.reload() == (1, 0)
+    assert hosts.lookup(("web", "dev")) == ("10.0.0.1", None)
+    # Just moving lines around counts, too.
+    write(path, "10.0.0.2 web.dev", "10.0.0.1 web.dev")
+    assert hosts.reload() == (0, 0)
+    assert hosts.lookup(("web", "dev")) == ("10.0.0.2", None)
+
+
+def test_hosts_reload_chunks(path):
+    lines = ["10.0.0.%d host%d.dev" % (n, n) for n in range(1, 10)]
+    lines.append("10.0.1.1 host9.dev")
+    write(path, *lines)
+    hosts = HostsFile(str(path))
+    with mock.patch("devns.hosts._CHUNK", 2):
+        hosts.load()
+        # Across chunks a line moved up still wins, and one that's gone is
+        # told apart from the rest.
+        write(path, *([lines[9]] + lines[1:9]))
+        with mock.patch("devns.hosts.time.sleep") as sleep:
+            assert hosts.reload() == (0, 1)
+    assert sleep.call_count > 5
+    assert hosts.lookup(("host9", "dev")) == ("10.0.1.1", None)
+    assert hosts.lookup(("host1", "dev")) is None
+    assert len(hosts) == 8
+
+
+def test_hosts_reload_replaced(path, tmpdir):
+    # How most editors save: write a new file, rename it over the old one.
+    write(path, "10.0.0.1 web.dev")
+    hosts = HostsFile(str(path))
+    hosts.load()
+    replacement = tmpdir.join("hosts.new")
+    write(replacement, "10.0.0.1 web.dev", "10.0.0.2 db.dev")
+    os.rename(str(replacement), str(path))
+    assert hosts.reload() == (1, 0)
+    assert hosts.lookup(("db", "dev")) == ("10.0.0.2", None)
+
+
+def test_hosts_missing(path):
+    hosts = HostsFile(str(path))
+    assert hosts.load() == (0, 0)
+    assert len(hosts) == 0
+    write(path, "10.0.0.1 web.dev")
+    assert hosts.reload() == (1, 0)
+    path.remove()
+    assert hosts.reload() == (0, 1)
+    assert hosts.lookup(("web", "dev")) is None
+
+
+def test_hosts_empty(path):
+    write(path)
+    hosts = HostsFile(str(path))
+    assert hosts.load() == (0, 0)
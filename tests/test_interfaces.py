@@ -0,0 +1,233 @@
+import socket
+import struct
+import pytest
+
+from mock import patch, MagicMock
+
+from devns import interfaces
+from devns.interfaces import (
+    IFA_ADDRESS, IFA_LOCAL, RTM_DELADDR, RTM_NEWADDR, Unavailable
+)
+
+
+def attribute(kind, value):
+    data = struct.pack("=HH", 4 + len(value), kind) + value
+    return data + b"\x00" * (-len(data) % 4)
+
+
+def message(type, family, attributes, flags=0, index=2):
+    body = struct.pack("=BBBBI", family, 24, flags, 0, index)
+    body += b"".join(attribute(kind, value) for kind, value in attributes)
+    return struct.pack("=IHHII", 16 + len(body), type, 0, 1, 0) + body
+
+
+def packed(family, address):
+    return socket.inet_pton(family, address)
+
+
+@pytest.mark.parametrize("data, expected", [
+    (
+        message(RTM_NEWADDR, socket.AF_INET, [
+            (IFA_ADDRESS, packed(socket.AF_INET, "10.0.0.1")),
+        ]),
+        [(RTM_NEWADDR, socket.AF_INET, 2, "10.0.0.1")],
+    ),
+    (
+        # Point-to-point: IFA_LOCAL is ours, IFA_ADDRESS the peer's.
+        message(RTM_NEWADDR, socket.AF_INET, [
+            (IFA_ADDRESS, packed(socket.AF_INET, "10.0.0.2")),
+            (IFA_LOCAL, packed(socket.AF_INET, "10.0.0.1")),
+        ]),
+        [(RTM_NEWADDR, socket.AF_INET, 2, "10.0.0.1")],
+    ),
+    (
+        message(RTM_NEWADDR, socket.AF_INET6, [
+            (IFA_ADDRESS, packed(socket.AF_INET6, "fd00::1")),
+        ]) + message(RTM_DELADDR, socket.AF_INET6, [
+            (IFA_ADDRESS, packed(socket.AF_INET6, "fd00::2")),
+        ], index=3),
+        [
+            (RTM_NEWADDR, socket.AF_INET6, 2, "fd00::1"),
+            (RTM_DELADDR, socket.AF_INET6, 3, "fd00::2"),
+        ],
+    ),
+    (
+        # Still doing duplicate address detection.
+        message(RTM_NEWADDR, socket.AF_INET6, [
+            (IFA_ADDRESS, packed(socket.AF_INET6, "fd00::1")),
+        ], flags=0x40),
+        [],
+    ),
+    (
+        # Not an address message, then a truncated one.
+        struct.pack("=IHHII", 16, 3, 0, 1, 0) + b"\x20\x00\x00\x00",
+        [],
+    ),
+])
+def test_parse_addresses(data, expected):
+    assert list(interfaces.parse_addresses(data)) == expected
+
+
+def test_parse_if_inet6():
+    lines = [
+        "fd000000000000000000000000000002 04 40 00 82     eth0\n",
+        "00000000000000000000000000000001 01 80 10 80       lo\n",
+        "fe8000000000000000fc00fffe000001 04 40 20 40     eth0\n",
+        "garbage\n",
+    ]
+    assert interfaces._parse_if_inet6(lines) == ["fd00::2", "::1"]
+
+
+def test_parse_fib_trie():
+    lines = [
+        "Main:\n",
+        "  +-- 0.0.0.0/0 3 0 5\n",
+        "     |-- 0.0.0.0\n",
+        "        /0 universe UNICAST\n",
+        "     +-- 127.0.0.0/8 2 0 2\n",
+        "        |-- 127.0.0.1\n",
+        "           /32 host LOCAL\n",
+        "     |-- 192.0.2.2\n",
+        "        /32 host LOCAL\n",
+        "     |-- 192.0.2.255\n",
+        "        /32 link BROADCAST\n",
+        "Local:\n",
+        "     |-- 192.0.2.2\n",
+        "        /32 host LOCAL\n",
+    ]
+    assert interfaces._parse_fib_trie(lines) == ["127.0.0.1", "192.0.2.2"]
+
+
+def test_ioctl_ipv6_unavailable():
+    pytest.raises(Unavailable, interfaces.ioctl, socket.AF_INET6)
+
+
+@patch("devns.interfaces.open", side_effect=IOError, create=True)
+def test_proc_unavailable(open_mock):
+    pytest.raises(Unavailable, interfaces.proc, socket.AF_INET)
+
+
+def test_netlink_unavailable():
+    with patch("devns.interfaces.socket.socket", side_effect=OSError):
+        pytest.raises(Unavailable, interfaces.netlink, socket.AF_INET)
+
+
+def test_addresses_first_working_backend():
+    backends = {
+        "broken": MagicMock(side_effect=Unavailable),
+        "empty": MagicMock(return_value=[]),
+        "found": MagicMock(return_value=["10.0.0.1"]),
+    }
+    with patch.dict(interfaces.BACKENDS, backends):
+        assert interfaces.addresses(
+            socket.AF_INET, ("broken", "found", "empty")
+        ) == ["10.0.0.1"]
+        assert interfaces.addresses(
+            socket.AF_INET, ("broken", "empty", "found")
+        ) == []
+        pytest.raises(
+            Unavailable, interfaces.addresses, socket.AF_INET, ("broken", )
+        )
+
+
+@pytest.mark.parametrize("family", (socket.AF_INET, socket.AF_INET6))
+def test_backends_agree(family):
+    # Every backend that works here should see the same addresses.
+    found = {}
+    for name, backend in interfaces.BACKENDS.items():
+        try:
+            found[name] = sorted(backend(family))
+        except Unavailable:
+            continue
+    if not found:
+        pytest.skip("no native backends work here")
+    assert len(set(map(tuple, found.values()))) == 1
+
+
+@pytest.yield_fixture
+def watched():
+    # A datagram socketpair standing in for the netlink subscription.
+    ours, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+    connection = MagicMock(wraps=ours)
+    connection.bind = MagicMock()
+    with patch(
+        "devns.interfaces._netlink_socket", return_value=connection
+    ):
+        yield connection, kernel
+    ours.close()
+    kernel.close()
+
+
+def test_watcher(watched):
+    import threading
+
+    connection, kernel = watched
+    seen = []
+    called = threading.Event()
+
+    def callback(changes):
+        seen.append(changes)
+        called.set()
+
+    watcher = interfaces.Watcher(callback)
+    watcher.start()
+    connection.bind.assert_called_once_with((0, 0x110))
+    # Unrelated messages don't wake anybody up.
+    kernel.send(struct.pack("=IHHII", 16, 16, 0, 0, 0))
+    kernel.send(message(RTM_DELADDR, socket.AF_INET, [
+        (IFA_ADDRESS, packed(socket.AF_INET, "10.0.0.1")),
+    ]))
+    assert called.wait(5)
+    thread = watcher._thread
+    watcher.stop(5)
+    assert not thread.is_alive()
+    assert seen == [[(RTM_DELADDR, socket.AF_INET, 2, "10.0.0.1")]]
+
+
+def test_watcher_overflow(watched):
+    import errno
+    import threading
+
+    connection, kernel = watched
+    called = threading.Event()
+    seen = []
+    connection.recv = MagicMock(side_effect=[
+        socket.error(errno.ENOBUFS, "No buffer space available"),
+        socket.error(errno.EBADF, "Bad file descriptor"),
+    ])
+
+    def callback(changes):
+        seen.append(changes)
+        called.set()
+
+    watcher = interfaces.Watcher(callback)
+    watcher.start()
+    kernel.send(b"x")
+    assert called.wait(5)
+    watcher._thread.join(5)
+    assert not watcher._thread.is_alive()
+    watcher.stop(5)
+    assert seen == [[]]
+
+
+def test_watcher_unavailable():
+    connection = MagicMock()
+    connection.bind.side_effect = socket.error(1, "Operation not permitted")
+    with patch(
+        "devns.interfaces._netlink_socket", return_value=connection
+    ):
+        watcher = interfaces.Watcher(MagicMock())
+        pytest.raises(Unavailable, watcher.start)
+    connection.close.assert_called_once_with()
+    watcher.stop()
+
+
+def test_watcher_live():
+    watcher = interfaces.Watcher(MagicMock())
+    try:
+        watcher.start()
+    except Unavailable as e:
+        pytest.skip(str(e))
+    thread = watcher._thread
+    watcher.stop(5)
+    assert not thread.is_alive()
@@ -0,0 +1,58 @@
+import threading
+
+from mock import MagicMock
+
+from devns.refresh import Refresher, monotonic
+
+
+def test_refresher_interval():
+    called = threading.Event()
+    refresh = MagicMock(side_effect=lambda: called.set())
+    refresher = Refresher(refresh, 0.01)
+    refresher.start()
+    assert called.wait(5)
+    refresher.stop(5)
+    assert not refresher._thread.is_alive()
+
+
+def test_refresher_wake():
+    called = threading.Event()
+    refresh = MagicMock(side_effect=lambda: called.set())
+    refresher = Refresher(refresh, 3600)
+    refresher.start()
+    assert not called.wait(0.05)
+    refresher.wake()
+    assert called.wait(5)
+    refresher.stop(5)
+    assert refresh.call_count == 1
+
+
+def test_refresher_survives_errors():
+    called = threading.Event()
+    results = [ValueError, called.set]
+
+    def refresh():
+        result = results.pop(0) if results else None
+        if result is ValueError:
+            raise result
+        if result:
+            result()
+
+    refresher = Refresher(refresh, 0.01)
+    refresher.start()
+    assert called.wait(5)
+    refresher.stop(5)
+
+
+def test_refresher_stop_before_running():
+    refresh = MagicMock()
+    refresher = Refresher(refresh, 3600)
+    refresher.stop()
+    refresher.start()
+    refresher._thread.join(5)
+    assert not refresher._thread.is_alive()
+    refresh.assert_not_called()
+
+
+def test_monotonic():
+    assert monotonic() <= monotonic()
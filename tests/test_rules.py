@@ -0,0 +1,86 @@
+import pytest
+
+from devns.rules import Rules, parse
+
+
+def labels(name):
+    return tuple(name.split("."))
+
+
+@pytest.fixture
+def rules():
+    return Rules([
+        "*.api.dev=10.0.0.5",
+        "*.api.dev=fd00::5",
+        "x.api.dev=10.0.0.6",
+        "DB.Local.Co.=127.0.0.1",
+        "*.dev=10.0.0.1",
+    ])
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("a.api.dev", ("10.0.0.5", "fd00::5")),
+    ("b.a.api.dev", ("10.0.0.5", "fd00::5")),
+    ("A.API.Dev", ("10.0.0.5", "fd00::5")),
+    # An exact name beats any wildcard...
+    ("x.api.dev", ("10.0.0.6", None)),
+    # ...but wildcards still cover what's below it.
+    ("y.x.api.dev", ("10.0.0.5", "fd00::5")),
+    # A wildcard doesn't cover the name it hangs off.
+    ("api.dev", ("10.0.0.1", None)),
+    ("dev", None),
+    ("db.local.co", ("127.0.0.1", None)),
+    ("local.co", None),
+    ("a.db.local.co", None),
+    ("example.com", None),
+])
+def test_rules_lookup(rules, name, expected):
+    assert rules.lookup(labels(name)) == expected
+
+
+def test_rules_catch_all(rules):
+    rules.add(("*", ), "10.9.9.9")
+    assert rules.lookup(labels("example.com")) == ("10.9.9.9", None)
+    assert rules.lookup(labels("db.local.co")) == ("127.0.0.1", None)
+
+
+def test_rules_len(rules):
+    assert len(rules) == 4
+    assert len(Rules()) == 0
+    assert Rules().lookup(labels("a.dev")) is None
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("x.api.dev", True),
+    ("api.dev", True),
+    ("dev", True),
+    ("Local.Co", True),
+    ("a.api.dev", False),
+    ("a.x.api.dev", False),
+    ("example.com", False),
+])
+def test_rules_contains(rules, name, expected):
+    assert rules.contains(labels(name)) == expected
+
+
+def test_rules_later_wins():
+    rules = Rules(["a.dev=10.0.0.1", "a.dev=10.0.0.2"])
+    assert rules.lookup(labels("a.dev")) == ("10.0.0.2", None)
+
+
+@pytest.mark.parametrize("rule, expected", [
+    ("*.api.dev=10.0.0.5", (("*", "api", "dev"), "10.0.0.5")),
+    (" db.local.co. = ::1", (("db", "local", "co"), "::1")),
+    ("*=10.0.0.1", (("*", ), "10.0.0.1")),
+])
+def test_rules_parse(rule, expected):
+    assert parse(rule) == expected
+
+
+@pytest.mark.parametrize("rule", [
+    "api.dev", "api.dev=", "api.dev=10.0.0", "api.dev=fd00:::1",
+    "=10.0.0.1", "a..dev=10.0.0.1", "a.*.dev=10.0.0.1", "*a.dev=10.0.0.1",
+])
+def test_rules_parse_invalid(rule):
+    with pytest.raises(ValueError):
+        parse(rule)
@@ -1,13 +1,29 @@
 import os
 import sys
+import random
 import pytest
+import logging
 import socket
+import struct
+import threading
 
-from datetime import timedelta
 from mock import patch, MagicMock
 
+from devns.dns import Header, Query, Record
 from devns.server import DevNS
 
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+@pytest.fixture
+def ifconfig_discovery(config):
+    # Keep the native backends from finding this machine's real addresses
+    # when a test fakes ifconfig's.
+    config.discovery = ("ifconfig", )
+
 
 def test_server_init_no_config(config):
     server = DevNS()
@@ -39,7 +55,8 @@ def test_server_bind(config, server, host, port):
         timeout = connection.gettimeout()
         _host, _port = connection.getsockname()
 
-    assert timeout == 3.05
+    # The selector loop never blocks on it.
+    assert timeout is None
     assert _host == host
     assert _port == port or _port
     with pytest.raises(socket.error):
@@ -141,16 +158,19 @@ def test_server_address(server, address, encoded_address):
     ("127.0.0.1", b"\x7f\x00\x00\x01"),
     ("1.2.3.4", b"\x01\x02\x03\x04")
 ])
+@pytest.mark.usefixtures("ifconfig_discovery")
 def test_server_address_ttl(server, address, encoded_address):
     server.address = "1.2.3.4"
-    server._address_last_updated -= timedelta(seconds=server.config.ttl + 5)
-    last_updated = server._address_last_updated
     with patch("devns.server.DevNS._get_address_by_ifconfig") as ifconfig:
         ifconfig.return_value = address
+        # Reading a stale address never blocks on discovery...
+        assert server.address == "1.2.3.4"
+        ifconfig.assert_not_called()
+        # ...the refresher does that from the background.
+        server.refresh()
         assert server.address == address
         assert server._encoded_address == encoded_address
-        assert server._address_last_updated > last_updated
-        ifconfig.assert_called_once()
+        ifconfig.assert_any_call(socket.AF_INET)
 
 
 @pytest.mark.parametrize("address, encoded_address", [
@@ -163,7 +183,6 @@ def test_server_ttl_config_address(server, address, encoded_address):
     with patch("devns.server.DevNS._get_address_by_ifconfig") as ifconfig:
         assert server.address == address
         assert server._encoded_address == encoded_address
-        assert server._address_age == 0
         ifconfig.assert_not_called()
 
 
@@ -188,6 +207,7 @@ def test_server_get_address_by_hostname_error(server):
     assert address is None
 
 
+@pytest.mark.usefixtures("ifconfig_discovery")
 def test_server_address_error(server):
     with patch("devns.server.subprocess") as subprocess:
         with patch("devns.server.socket") as socket_mock:
@@ -220,15 +240,15 @@ def test_server_choose_address(server, addresses, address):
 @pytest.mark.parametrize("query, expected", [
     (
         b"\xdb\xab\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01",  # noqa
-        b"\xdb\xab\x80\x10\x00\x01\x00\x01\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"  # noqa
+        b"\xdb\xab\x85\x90\x00\x01\x00\x01\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"  # noqa
     ),
     (
         b"$\x01\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x04test\x05local\x03dev\x00\x00\x01\x00\x01",  # noqa
-        b"\x02A\x80\x10\x00\x01\x00\x01\x00\x00\x00\x00\x04test\x05local\x03dev\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"  # noqa
+        b"$\x01\x85\x90\x00\x01\x00\x01\x00\x00\x00\x00\x04test\x05local\x03dev\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"  # noqa
     ),
     (
         b"\xc8\xdd\x01 \x00\x01\x00\x00\x00\x00\x00\x01\x05local\x03dev\x00\x00\x01\x00\x01\x00\x00)\x10\x00\x00\x00\x00\x00\x00\x00",  # noqa
-        b"\xc8\xdd\x81\x90\x00\x01\x00\x01\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04"  # noqa
+        b"\xc8\xdd\x85\x90\x00\x01\x00\x01\x00\x00\x00\x01\x05local\x03dev\x00\x00\x01\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00<\x00\x04\x01\x02\x03\x04\x00\x00)\x04\xd0\x00\x00\x00\x00\x00\x00"  # noqa
     ),
     (
         b"\xb8\x8b(\x10\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01",  # noqa
@@ -255,6 +275,7 @@ def test_server_build_response(config, server, query, expected):
         None
     ),
 ])
+@patch("devns.server.selectors", None)
 def test_server_listen(config, server, query, expected, Connection):
     config.address = server.address = "1.2.3.4"
 
@@ -267,6 +288,8 @@ def test_server_listen(config, server, query, expected, Connection):
     ], expected)
 
     assert pytest.raises(KeyboardInterrupt, server._listen)
+    # Without a selector it blocks on the one socket, but not forever.
+    server.connection.settimeout.assert_called_with(3.05)
 
 
 @pytest.mark.parametrize("query, expected", [
@@ -283,8 +306,11 @@ def test_server_listen(config, server, query, expected, Connection):
         None
     ),
 ])
+@patch("devns.server.selectors", None)
 def test_server_run(config, server, query, expected, Connection):
     config.resolver = False
+    config.tcp = False
+    config.watch = False
     config.address = server.address = "1.2.3.4"
     connection = Connection([
         KeyboardInterrupt,
@@ -487,3 +513,1242 @@ def test_server_get_address_by_ifconfig(server, ifconfig, expected):
         address = server._get_address_by_ifconfig()
         subprocess.check_output.assert_called_once_with(("ifconfig", ))
     assert address == expected
+
+
+def test_server_build_response_cached(config, server):
+    config.address = server.address = "1.2.3.4"
+    query = b"\xdb\xab\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01"  # noqa
+    first = server._build_response(query)
+    assert len(server._cache) == 1
+    with patch("devns.server.Response") as response_mock:
+        second = server._build_response(b"\x12\x34\x00" + query[3:])
+        response_mock.assert_not_called()
+    assert second == b"\x12\x34\x84\x10" + first[4:]
+
+
+def test_server_address_clears_cache(config, server):
+    config.address = server.address = "1.2.3.4"
+    query = b"\xdb\xab\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01"  # noqa
+    server._build_response(query)
+    config.address = server.address = "10.10.10.10"
+    assert len(server._cache) == 0
+    assert server._build_response(query).endswith(b"\x0a\x0a\x0a\x0a")
+
+
+@pytest.mark.skipif(
+    not hasattr(tracemalloc, "reset_peak"), reason="Old Python"
+)
+def test_server_build_response_allocations(config, server):
+    config.address = server.address = "1.2.3.4"
+    query = b"\xdb\xab\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x01\x00\x01"  # noqa
+    for _ in range(100):
+        server._build_response(query)
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(1000):
+            server._build_response(query)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Nothing should stick around between queries, and a single query should
+    # only need a handful of short lived objects.
+    assert current - start < 4096
+    assert peak - start < 4096
+
+
+def test_server_build_response_ignored_opcode_skips_question(server):
+    # An Update with a truncated question is dropped on the header alone.
+    query = b"\xb8\x8b(\x10\x00\x01\x00\x00\x00\x00\x00\x00\x05loc"
+    with patch("devns.dns.Query.load") as load:
+        assert server._build_response(query) is None
+        load.assert_not_called()
+
+
+@pytest.mark.parametrize("addresses, address", [
+    ([], None),
+    (["2001:db8::1", "not an address", "10.0.0.1"], None),
+    (["::1"], "::1"),
+    (["::1", "fe80::1", "fe80::dad3:85ff:fe5e:37e6"], "fe80::dad3:85ff:fe5e:37e6"),
+    (["fe80::ffff", "fd12:3456::1", "2001:db8::1"], "fd12:3456::1"),
+    (["fc00::2", "fd00::1", "fe80::1"], "fd00::1"),
+])
+def test_server_choose_address6(server, addresses, address):
+    assert server._choose_address(addresses, socket.AF_INET6) == address
+
+
+@pytest.mark.parametrize("ifconfig, expected", [
+    ("\n".join([
+        "lo0: flags=8049<UP,LOOPBACK,RUNNING,MULTICAST> mtu 16384",
+        "        inet 127.0.0.1 netmask 0xff000000",
+        "        inet6 ::1 prefixlen 128",
+        "        inet6 fe80::1%lo0 prefixlen 64 scopeid 0x1",
+    ]), "fe80::1"),
+    ("\n".join([
+        "docker0   Link encap:Ethernet  HWaddr 02:42:31:08:c9:7a",
+        "          inet addr:172.17.0.1  Bcast:0.0.0.0  Mask:255.255.0.0",
+        "          inet6 addr: fe80::42:31ff:fe08:c97a/64 Scope:Link",
+        "          inet6 addr: fd00:dead:beef::1/64 Scope:Global",
+    ]), "fd00:dead:beef::1"),
+    ("\n".join([
+        "eth0: flags=4163<UP,BROADCAST,RUNNING,MULTICAST>  mtu 1500",
+        "        inet 10.0.0.5  netmask 255.255.255.0  broadcast 10.0.0.255",
+        "        inet6 2001:db8::5  prefixlen 64  scopeid 0x0<global>",
+    ]), None),
+])
+def test_server_get_address6_by_ifconfig(server, ifconfig, expected):
+    with patch("devns.server.subprocess") as subprocess:
+        subprocess.check_output = MagicMock(return_value=ifconfig)
+        address = server._get_address_by_ifconfig(socket.AF_INET6)
+    assert address == expected
+
+
+def test_server_address6_config(config, server):
+    config.address6 = "fd00::1"
+    with patch("devns.server.DevNS._get_address_by_ifconfig") as ifconfig:
+        assert server.address6 == "fd00::1"
+        ifconfig.assert_not_called()
+
+
+@pytest.mark.usefixtures("ifconfig_discovery")
+def test_server_address6_discovery(config, server):
+    with patch("devns.server.DevNS._get_address_by_ifconfig") as ifconfig:
+        ifconfig.return_value = "fd00::2"
+        assert server.address6 == "fd00::2"
+        assert server.address6 == "fd00::2"
+        ifconfig.assert_called_once_with(socket.AF_INET6)
+        server._address6_last_updated -= server.config.ttl + 5
+        assert server.address6 == "fd00::2"
+        assert ifconfig.call_count == 1
+
+
+# The made up SOA record for "dev", following a question for a name in it.
+SOA = (
+    b"\xc0\x12\x00\x06\x00\x01\x00\x00\x00<\x00\x26"
+    b"\x02ns\xc0\x12\x0ahostmaster\xc0\x12"
+    b"\x00\x00\x00\x01\x00\x00\x0e\x10\x00\x00\x02\x58"
+    b"\x00\x01\x51\x80\x00\x00\x00\x3c"
+)
+aaaa_query = b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x05local\x03dev\x00\x00\x1c\x00\x01"  # noqa
+
+
+def test_server_build_response_aaaa(config, server):
+    config.address = server.address = "1.2.3.4"
+    config.address6 = "fd00::1"
+    response = server._build_response(aaaa_query)
+    assert response == (
+        b"\x12\x34\x85\x90\x00\x01\x00\x01\x00\x00\x00\x00"
+        b"\x05local\x03dev\x00\x00\x1c\x00\x01"
+        b"\xc0\x0c\x00\x1c\x00\x01\x00\x00\x00<\x00\x10"
+        b"\xfd\x00" + b"\x00" * 13 + b"\x01"
+    )
+
+
+@pytest.mark.usefixtures("ifconfig_discovery")
+def test_server_build_response_aaaa_nodata(config, server):
+    config.address = server.address = "1.2.3.4"
+    with patch("devns.server.DevNS._get_address_by_ifconfig") as ifconfig:
+        ifconfig.return_value = None
+        response = server._build_response(aaaa_query)
+    # NOERROR with an empty answer section, and the zone's SOA saying how
+    # long that holds.
+    assert response == aaaa_query[:2] + (
+        b"\x85\x90\x00\x01\x00\x00\x00\x01\x00\x00"
+    ) + aaaa_query[12:] + SOA
+
+
+@pytest.mark.parametrize("rrtype, answers", [
+    (b"\x00\x0f", 0),  # MX
+    (b"\x00\x10", 0),  # TXT
+    (b"\x00\xff", 2),  # ANY
+])
+def test_server_build_response_other_types(config, server, rrtype, answers):
+    config.address = server.address = "1.2.3.4"
+    config.address6 = "fd00::1"
+    query = aaaa_query[:-4] + rrtype + b"\x00\x01"
+    response = server._build_response(query)
+    assert response[6:8] == b"\x00" + bytearray([answers])
+    assert response[3:4] == b"\x90"
+
+
+edns_query = b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x01\x05local\x03dev\x00\x00\x01\x00\x01"  # noqa
+
+
+def _opt(payload=b"\x10\x00", version=b"\x00", flags=b"\x00\x00"):
+    return b"\x00\x00)" + payload + b"\x00" + version + flags + b"\x00\x00"
+
+
+def test_server_build_response_edns(config, server):
+    config.address = server.address = "1.2.3.4"
+    config.max_payload = 4096
+    response = server._build_response(edns_query + _opt(flags=b"\x80\x00"))
+    assert response[10:12] == b"\x00\x01"
+    assert response.endswith(_opt(flags=b"\x80\x00"))
+    # The DO bit is part of the cache key
+    response = server._build_response(edns_query + _opt())
+    assert response.endswith(_opt())
+    assert len(server._cache) == 2
+
+
+def test_server_build_response_badvers(config, server):
+    config.address = server.address = "1.2.3.4"
+    response = server._build_response(edns_query + _opt(version=b"\x01"))
+    # BADVERS is 16: 0 in the header, 1 in the OPT record's extended RCODE
+    assert response == (
+        b"\x12\x34\x81\x80\x00\x01\x00\x00\x00\x00\x00\x01"
+        b"\x05local\x03dev\x00\x00\x01\x00\x01"
+        b"\x00\x00)\x04\xd0\x01\x00\x00\x00\x00\x00"
+    )
+    assert len(server._cache) == 0
+
+
+@pytest.mark.parametrize("payload, answers, tc, limit", [
+    (None, 30, 1, 512),             # no EDNS: 512 bytes
+    (b"\x01\x00", 29, 1, 512),      # advertised sizes below 512 mean 512
+    (b"\x04\xd0", 74, 1, 1232),     # 1232 fits more, but not everything
+    (b"\x10\x00", 100, 0, 2048),    # 4096 is capped at max_payload
+])
+def test_server_build_response_payload_limit(config, server, payload, answers,
+                                             tc, limit):
+    config.address = server.address = "1.2.3.4"
+    config.max_payload = 2048
+    records = [
+        Record.address(("local", "dev"), "10.0.%d.%d" % divmod(i, 256))
+        for i in range(100)
+    ]
+    query = edns_query[:11] + b"\x00" + edns_query[12:]
+    if payload:
+        query = edns_query + _opt(payload)
+    with patch.object(server, "_answers", return_value=records):
+        response = server._build_response(query)
+    assert bytearray(response[2:3])[0] & 0x02 == tc << 1
+    assert bytearray(response[6:8]) == bytearray([0, answers])
+    assert len(response) <= limit
+
+
+@pytest.mark.parametrize("max_payload, size", [
+    (4096, 4096),
+    (100, 512),
+    (100000, 65535),
+])
+@patch("devns.server.selectors", None)
+def test_server_recv_size(config, server, Connection, max_payload, size):
+    config.address = server.address = "1.2.3.4"
+    config.max_payload = max_payload
+    server.connection = Connection([KeyboardInterrupt], None)
+    server.connection.recvfrom = MagicMock(side_effect=KeyboardInterrupt)
+    with pytest.raises(KeyboardInterrupt):
+        server._listen()
+    server.connection.recvfrom.assert_called_once_with(size)
+
+
+def test_server_max_payload_fits_opt(config, server):
+    config.address = server.address = "1.2.3.4"
+    config.max_payload = 100000
+    response = server._build_response(edns_query + _opt(b"\xff\xff"))
+    # The OPT record at the end offers what its CLASS can hold.
+    assert bytearray(response[-8:-6]) == bytearray(b"\xff\xff")
+
+
+HEADER = b"\xab\xcd\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+FORMERR = b"\xab\xcd\x80\x01\x00\x00\x00\x00\x00\x00\x00\x00"
+
+malformed = [
+    ("short header", HEADER[:11]),
+    ("no question", HEADER),
+    ("label past the end", HEADER + b"\x05loc"),
+    ("unterminated name", HEADER + b"\x05local\x03dev"),
+    ("label too long", HEADER + b"\x40" + b"a" * 64 + b"\x00\x00\x01\x00\x01"),
+    ("reserved label type", HEADER + b"\x80local\x00\x00\x01\x00\x01"),
+    ("name too long", HEADER + b"\x3f" * 5 + (b"\x3f" + b"a" * 63) * 4 + b"\x00\x00\x01\x00\x01"),  # noqa
+    ("missing type", HEADER + b"\x05local\x03dev\x00"),
+    ("truncated class", HEADER + b"\x05local\x03dev\x00\x00\x01\x00"),
+    (
+        "missing additional record",
+        HEADER[:11] + b"\x01" + b"\x05local\x03dev\x00\x00\x01\x00\x01"
+    ),
+    (
+        "truncated OPT",
+        HEADER[:11] + b"\x01" + b"\x05local\x03dev\x00\x00\x01\x00\x01\x00\x00)"
+    ),
+    (
+        "OPT RDATA past the end",
+        HEADER[:11] + b"\x01" + b"\x05local\x03dev\x00\x00\x01\x00\x01"
+        b"\x00\x00)\x10\x00\x00\x00\x00\x00\x00\x08\x00"
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    "query", [query for _, query in malformed], ids=[n for n, _ in malformed]
+)
+def test_server_build_response_malformed(config, server, query):
+    config.address = server.address = "1.2.3.4"
+    assert server._build_response(query) == FORMERR
+
+
+@pytest.mark.parametrize("query", [b"", b"\xab"])
+def test_server_build_response_malformed_no_id(config, server, query):
+    assert server._build_response(query) is None
+
+
+def test_server_build_response_ignores_responses(config, server):
+    config.address = server.address = "1.2.3.4"
+    query = b"\xab\xcd\x81\x80" + HEADER[4:] + b"\x03dev\x00\x00\x01\x00\x01"
+    assert server._build_response(query) is None
+
+
+def test_server_build_response_fuzz(config, server):
+    config.address = server.address = "1.2.3.4"
+    config.address6 = "fd00::1"
+    valid = HEADER[:11] + b"\x01" + b"\x05local\x03dev\x00\x00\x01\x00\x01" + (
+        b"\x00\x00)\x10\x00\x00\x00\x00\x00\x00\x00"
+    )
+    rand = random.Random(1035)
+    for _ in range(2000):
+        query = bytearray(valid[:rand.randint(0, len(valid))])
+        for _ in range(rand.randint(0, 4)):
+            if query:
+                query[rand.randrange(len(query))] = rand.randint(0, 255)
+        response = server._build_response(bytes(query))
+        assert response is None or isinstance(response, bytes)
+
+
+@patch("devns.server.selectors", None)
+def test_server_listen_survives_errors(config, server, Connection):
+    config.address = server.address = "1.2.3.4"
+    server.connection = Connection([
+        KeyboardInterrupt,
+        (b"\x00", ("127.0.0.1", 5000)),
+        (HEADER, ("127.0.0.1", 5000)),
+    ], None)
+    with patch.object(
+        server, "_build_response", side_effect=[RuntimeError, FORMERR]
+    ):
+        with pytest.raises(KeyboardInterrupt):
+            server._listen()
+
+
+@pytest.mark.parametrize("qdcount", [b"\x00\x00", b"\x00\x02"])
+def test_server_build_response_question_count(config, server, qdcount):
+    config.address = server.address = "1.2.3.4"
+    query = HEADER[:4] + qdcount + HEADER[6:] + (
+        b"\x05local\x03dev\x00\x00\x01\x00\x01"
+        b"\x03www\xc0\x0c\x00\x01\x00\x01"
+    )
+    with patch("devns.dns.Query._read") as read:
+        assert server._build_response(query) == FORMERR
+        read.assert_not_called()
+
+
+@pytest.mark.parametrize("batch_size", (1, 8))
+def test_server_process_batch(server, config, batch_size):
+    from devns.batch import new_batch
+
+    config.address = "10.10.10.10"
+    query = (
+        b"\x00{id}\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04test\x03dev\x00\x00\x01\x00\x01"
+    )
+    connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    connection.bind(("127.0.0.1", 0))
+    connection.settimeout(1)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(1)
+    try:
+        batch = new_batch(connection, batch_size, 512)
+        for id in range(3):
+            client.sendto(
+                query.replace(b"{id}", bytes(bytearray([id]))),
+                connection.getsockname()
+            )
+        answered = 0
+        while answered < 3:
+            answered += server._process_batch(batch)
+        for id in range(3):
+            response = client.recv(512)
+            assert response[:2] == b"\x00" + bytes(bytearray([id]))
+            assert response.endswith(b"\x0a\x0a\x0a\x0a")
+    finally:
+        connection.close()
+        client.close()
+
+
+@pytest.mark.skipif(
+    not hasattr(socket, "SO_REUSEPORT") or not hasattr(os, "fork"),
+    reason="SO_REUSEPORT workers are unsupported here"
+)
+def test_server_run_workers(tmpdir):
+    import signal
+    import subprocess
+    import time
+
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    resolver_dir = str(tmpdir.join("resolver"))
+    process = subprocess.Popen([
+        sys.executable, "-m", "devns.cli", "--workers", "2", "--host",
+        "127.0.0.1", "--port", str(port), "--address", "1.2.3.4",
+        "--resolver-dir", resolver_dir, "--domains", "dev", "test",
+        "--no-state",
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.settimeout(0.1)
+    query = (
+        b"Kj\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04test\x03dev\x00\x00\x01\x00\x01"
+    )
+    try:
+        response = None
+        deadline = time.time() + 10
+        while response is None and time.time() < deadline:
+            client.sendto(query, ("127.0.0.1", port))
+            try:
+                response = client.recv(512)
+            except socket.timeout:
+                continue
+        assert response is not None
+        assert response.endswith(b"\x01\x02\x03\x04")
+        assert sorted(os.listdir(resolver_dir)) == ["dev", "test"]
+    finally:
+        client.close()
+        process.send_signal(signal.SIGTERM)
+        process.communicate()
+    assert process.returncode == 0
+    assert os.listdir(resolver_dir) == []
+    # Every worker let go of the port.
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    probe.bind(("127.0.0.1", port))
+    probe.close()
+
+
+@patch("devns.server.Supervisor")
+def test_server_run_workers_lets_go(Supervisor, config, server):
+    config.resolver = False
+    config.workers = 2
+    config.listen = ["127.0.0.2"]
+    with server.bind() as connection:
+        connections = list(server.connections)
+        assert len(connections) == 2
+        server._run_workers()
+        assert Supervisor.return_value.run.called
+        # None of the parent's sockets are left to take queries.
+        for connection in connections:
+            with pytest.raises(socket.error):
+                connection.getsockname()
+
+
+def test_server_work_lets_go(config, server):
+    config.workers = 2
+    config.listen = ["127.0.0.2"]
+    with server.bind():
+        inherited = list(server.connections)
+        with patch.object(server, "bind") as bind:
+            bind.return_value.__enter__.return_value = socket.error()
+            assert server._work() == 2
+        for connection in inherited:
+            with pytest.raises(socket.error):
+                connection.getsockname()
+
+
+@pytest.mark.parametrize("workers, reuseport", [(1, False), (4, True)])
+def test_server_bind_reuseport(config, server, workers, reuseport):
+    config.workers = workers
+    with patch("devns.server.socket.socket") as socket_mock:
+        with server.bind():
+            pass
+    connection = socket_mock.return_value
+    assert connection.setsockopt.called == reuseport
+
+
+@patch("devns.server._SO_REUSEPORT", None)
+def test_server_bind_reuseport_unsupported(config, server):
+    config.workers = 4
+    with server.bind() as connection:
+        assert isinstance(connection, socket.error)
+
+
+@patch("devns.server.selectors", None)
+def test_server_listen_threaded(config, server, Connection):
+    config.mode = "threaded"
+    config.address = server.address = "1.2.3.4"
+    queries = [
+        b"%s\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04test\x03dev\x00\x00\x01\x00\x01" % bytes(bytearray([0, id]))
+        for id in range(8)
+    ]
+    connection = Connection([KeyboardInterrupt] + [
+        (query, ("127.0.0.1", 5000 + id))
+        for id, query in reversed(list(enumerate(queries)))
+    ] + [socket.error], None)
+    connection.sendto = MagicMock()
+    server.connection = connection
+    pytest.raises(KeyboardInterrupt, server._listen)
+    calls = connection.sendto.call_args_list
+    assert [call[0][1] for call in calls] == [
+        ("127.0.0.1", 5000 + id) for id in range(8)
+    ]
+    assert [call[0][0][:2] for call in calls] == [
+        query[:2] for query in queries
+    ]
+
+
+@pytest.mark.parametrize("payload", (None, b"\x02\x00"))
+def test_server_build_response_tcp(config, server, payload):
+    config.address = server.address = "1.2.3.4"
+    records = [
+        Record.address(("local", "dev"), "10.0.%d.%d" % divmod(i, 256))
+        for i in range(100)
+    ]
+    query = edns_query[:11] + b"\x00" + edns_query[12:]
+    if payload:
+        query = edns_query + _opt(payload)
+    with patch.object(server, "_answers", return_value=records):
+        udp = server._build_response(query)
+        response = server._build_response(query, tcp=True)
+    # Over TCP nothing needs truncating, and the UDP answer cached above
+    # mustn't be handed out instead.
+    assert bytearray(udp[2:3])[0] & 0x02
+    assert not bytearray(response[2:3])[0] & 0x02
+    assert bytearray(response[6:8]) == bytearray([0, 100])
+    assert len(server._cache) == 2
+
+
+def _has_ipv6():
+    try:
+        probe = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        probe.bind(("::1", 0))
+        probe.close()
+        return True
+    except (socket.error, AttributeError):
+        return False
+
+
+def test_server_serve(config, server):
+    import struct
+    import threading
+
+    config.host = "127.0.0.1"
+    config.listen = ["::1"] if _has_ipv6() else ["127.0.0.2"]
+    config.address = server.address = "1.2.3.4"
+    query = (
+        b"Kj\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04test\x03dev\x00\x00\x01\x00\x01"
+    )
+    with server.bind() as connection:
+        assert not isinstance(connection, Exception)
+        addresses = [c.getsockname() for c in server.connections]
+        assert len(addresses) == 2
+        assert addresses[0][1] == addresses[1][1]
+        with server._tcp() as listener:
+            assert len(listener.socks) == 2
+
+            def listen():
+                try:
+                    server._listen()
+                except KeyboardInterrupt:
+                    pass
+
+            thread = threading.Thread(target=listen)
+            thread.daemon = True
+            thread.start()
+            for address in addresses:
+                family = socket.AF_INET6 if ":" in address[0] else \
+                    socket.AF_INET
+                client = socket.socket(family, socket.SOCK_DGRAM)
+                client.settimeout(2)
+                client.sendto(query, address)
+                assert client.recv(512).endswith(b"\x01\x02\x03\x04")
+                client.close()
+                client = socket.create_connection(address[:2], 2)
+                client.sendall(struct.pack("!H", len(query)) + query)
+                length = struct.unpack("!H", client.recv(2))[0]
+                response = b""
+                while len(response) < length:
+                    response += client.recv(length - len(response))
+                assert response.endswith(b"\x01\x02\x03\x04")
+                client.close()
+            # Nothing but Control+C stops the loop.
+            with patch.object(
+                server, "_build_response", side_effect=KeyboardInterrupt
+            ):
+                client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                client.sendto(query, addresses[0])
+                client.close()
+                thread.join(5)
+            assert not thread.is_alive()
+    assert listener.socks == []
+    assert server.connections == []
+
+
+def test_server_tcp_disabled(config, server):
+    config.host = "127.0.0.1"
+    config.tcp = False
+    with server.bind():
+        with server._tcp() as listener:
+            assert listener is None
+
+
+def test_server_tcp_bind_failure(config, server):
+    config.host = "127.0.0.1"
+    blocker = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    blocker.bind(("127.0.0.1", 0))
+    blocker.listen(1)
+    config.port = blocker.getsockname()[1]
+    try:
+        with server.bind() as connection:
+            assert not isinstance(connection, Exception)
+            with server._tcp() as listener:
+                assert listener is None
+    finally:
+        blocker.close()
+
+
+def test_server_bind_listen_failure(config, server):
+    config.host = "127.0.0.1"
+    config.listen = ["8.8.8.8"]
+    with server.bind() as connection:
+        assert isinstance(connection, socket.error)
+    assert server.connections == []
+
+
+@pytest.mark.skipif(not _has_ipv6(), reason="IPv6 is unavailable")
+def test_server_bind_ipv6(config, server):
+    config.host = "::1"
+    with server.bind() as connection:
+        assert connection.family == socket.AF_INET6
+        assert connection.getsockopt(
+            socket.IPPROTO_IPV6, socket.IPV6_V6ONLY
+        ) == 1
+        assert connection.getsockname()[0] == "::1"
+
+
+@pytest.mark.parametrize("ifconfig, hostname, expected", [
+    (["10.0.0.2", None], None, "10.0.0.2"),        # changed
+    (["10.0.0.1", None], None, "10.0.0.1"),        # unchanged
+    ([None, None], None, "10.0.0.1"),              # nothing found, keep it
+    ([OSError, None], "10.0.0.3", "10.0.0.3"),     # no ifconfig, hostname
+    ([OSError, None], None, "10.0.0.1"),           # nothing works, keep it
+])
+@pytest.mark.usefixtures("ifconfig_discovery")
+def test_server_refresh(config, server, ifconfig, hostname, expected):
+    server.address = "10.0.0.1"
+    server._cache.set("key", b"\x00" * 12)
+    with patch.object(server, "_get_address_by_ifconfig") as get_ifconfig:
+        with patch.object(server, "_get_address_by_hostname") as get_hostname:
+            get_ifconfig.side_effect = ifconfig
+            get_hostname.return_value = hostname
+            server.refresh()
+    assert server.address == expected
+    assert len(server._cache) == (0 if expected != "10.0.0.1" else 1)
+
+
+@pytest.mark.parametrize("found, expected", [
+    (["fd00::2"], "fd00::2"),
+    ([None], None),             # the address went away
+    ([OSError], "fd00::1"),     # discovery broke, keep what we had
+])
+@pytest.mark.usefixtures("ifconfig_discovery")
+def test_server_refresh6(config, server, found, expected):
+    config.address = server.address = "10.0.0.1"
+    server.address6 = "fd00::1"
+    with patch.object(server, "_get_address_by_ifconfig") as ifconfig:
+        ifconfig.side_effect = found
+        server.refresh()
+        ifconfig.assert_called_once_with(socket.AF_INET6)
+    assert server.address6 == expected
+
+
+def test_server_refresh_configured(config, server):
+    config.address = server.address = "10.0.0.1"
+    config.address6 = "fd00::1"
+    with patch.object(server, "_get_address_by_ifconfig") as ifconfig:
+        server.refresh()
+        ifconfig.assert_not_called()
+
+
+@pytest.mark.parametrize("address6, started", [
+    (None, True), ("fd00::1", False)
+])
+def test_server_refresher(config, server, address6, started):
+    config.address = "10.0.0.1"
+    config.address6 = address6
+    with patch.object(server, "_get_address_by_ifconfig", return_value=None):
+        with server._refresher() as refresher:
+            assert (refresher is not None) == started
+            assert server._address_refresher is refresher
+            assert server._address == "10.0.0.1"
+            assert server._address6_last_updated is not None
+    assert server._address_refresher is None
+    if refresher is not None:
+        assert not refresher._thread.is_alive()
+
+
+def test_server_answer_never_discovers(config, server):
+    query = (
+        b"Kj\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04test\x03dev\x00\x00\xff\x00\x01"
+    )
+    server.address = "10.0.0.1"
+    server.address6 = "fd00::1"
+    server._address6_last_updated -= config.ttl + 5
+    with patch.object(server, "_get_address_by_ifconfig") as ifconfig:
+        with patch.object(server, "_get_address_by_hostname") as hostname:
+            assert server._build_response(query)
+            ifconfig.assert_not_called()
+            hostname.assert_not_called()
+
+
+def test_server_cache_keyed_on_address(config, server):
+    query = (
+        b"Kj\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+        b"\x04test\x03dev\x00\x00\x01\x00\x01"
+    )
+    server.address = "10.0.0.1"
+    first = server._build_response(query)
+    # Swap the address without clearing the cache, like a refresh racing
+    # a request that's still being answered would.
+    server._address = "10.0.0.2"
+    second = server._build_response(query)
+    assert first.endswith(b"\x0a\x00\x00\x01")
+    assert second.endswith(b"\x0a\x00\x00\x02")
+
+
+@pytest.mark.parametrize("discovery, found, expected", [
+    (("netlink", "ifconfig"), ["10.0.0.1"], "10.0.0.1"),
+    (("netlink", "ifconfig"), [], None),      # the first that works decides
+    (("ifconfig", "netlink"), ["10.0.0.1"], "10.0.0.9"),
+])
+def test_server_discover_address(config, server, discovery, found, expected):
+    from devns import interfaces
+
+    config.discovery = discovery
+    with patch.dict(interfaces.BACKENDS, {"netlink": lambda f: found}):
+        with patch.object(server, "_get_address_by_ifconfig") as ifconfig:
+            ifconfig.return_value = "10.0.0.9"
+            assert server._discover_address() == expected
+
+
+def test_server_discover_address_unavailable(config, server):
+    from devns import interfaces
+
+    config.discovery = ("netlink", "ifconfig")
+    netlink = MagicMock(side_effect=interfaces.Unavailable("nope"))
+    with patch.dict(interfaces.BACKENDS, {"netlink": netlink}):
+        with patch.object(server, "_get_address_by_ifconfig") as ifconfig:
+            ifconfig.side_effect = OSError("no ifconfig")
+            with pytest.raises(interfaces.Unavailable):
+                server._discover_address()
+            assert server._try_discover_address() is None
+
+
+@pytest.mark.parametrize("watch", (True, False))
+def test_server_refresher_watch(config, server, watch):
+    config.address = "10.0.0.1"
+    config.address6 = None
+    config.watch = watch
+    with patch("devns.server.interfaces.Watcher") as Watcher:
+        with patch.object(server, "_discover_address", return_value=None):
+            with server._refresher() as refresher:
+                with patch.object(refresher, "wake") as wake:
+                    if watch:
+                        callback = Watcher.call_args[0][0]
+                        callback([])
+                        wake.assert_called_once_with()
+                    else:
+                        Watcher.assert_not_called()
+    assert Watcher.return_value.stop.called == watch
+
+
+def test_server_refresher_watch_unavailable(config, server):
+    from devns import interfaces
+
+    config.address = "10.0.0.1"
+    config.address6 = None
+    with patch("devns.server.interfaces.Watcher") as Watcher:
+        Watcher.return_value.start.side_effect = interfaces.Unavailable
+        with patch.object(server, "_discover_address", return_value=None):
+            with server._refresher() as refresher:
+                assert refresher is not None
+    Watcher.return_value.stop.assert_not_called()
+
+
+def test_server_state_restored(config, server):
+    from devns import state
+
+    state.save(config.state_file, dict(
+        fingerprint=state.fingerprint(), address="10.0.0.7",
+        address6="fd00::7"
+    ))
+    with patch.object(server, "_discover_address") as discover:
+        with patch.object(server, "_get_address_by_hostname") as hostname:
+            discover.side_effect = ["10.0.0.8", "fd00::7"]
+            with patch("devns.server.Refresher") as Refresher:
+                with server._refresher():
+                    # Answering with the saved addresses straight away...
+                    assert server._address == "10.0.0.7"
+                    assert server._address6 == "fd00::7"
+                    discover.assert_not_called()
+                    hostname.assert_not_called()
+                    # ...while they're checked from the background.
+                    Refresher.return_value.wake.assert_called_once_with()
+            server.refresh()
+    assert server._address == "10.0.0.8"
+    assert state.load(config.state_file)["address"] == "10.0.0.8"
+
+
+@pytest.mark.parametrize("saved", [
+    dict(fingerprint="elsewhere", address="10.0.0.7"),
+    dict(address="not an address"),
+    dict(address6="not an address"),
+    None,
+])
+def test_server_state_not_restored(config, server, saved):
+    from devns import state
+
+    if saved is not None:
+        saved = dict(dict(fingerprint=state.fingerprint()), **saved)
+        state.save(config.state_file, saved)
+    with patch.object(server, "_discover_address") as discover:
+        discover.side_effect = lambda family=socket.AF_INET: (
+            "fd00::8" if family == socket.AF_INET6 else "10.0.0.8"
+        )
+        with patch("devns.server.Refresher") as Refresher:
+            with server._refresher():
+                assert server._address == "10.0.0.8"
+                assert server._address6 == "fd00::8"
+                Refresher.return_value.wake.assert_not_called()
+    # What we found is saved for next time.
+    assert state.load(config.state_file) == dict(
+        fingerprint=state.fingerprint(), address="10.0.0.8",
+        address6="fd00::8", version=state.VERSION
+    )
+
+
+def test_server_state_configured(config, server):
+    from devns import state
+
+    config.address = "10.0.0.1"
+    server._address6 = "fd00::1"
+    server._save_state()
+    assert state.load(config.state_file)["address"] is None
+    assert state.load(config.state_file)["address6"] == "fd00::1"
+    config.state_file = None
+    assert not server._restore_state()
+
+
+@pytest.mark.parametrize("name, rrtype, answer", [
+    (b"\x01x\x03api\x03dev\x00", b"\x00\x01", b"\x00\x04\x0a\x00\x00\x05"),
+    (b"\x01X\x03API\x03dev\x00", b"\x00\x01", b"\x00\x04\x0a\x00\x00\x05"),
+    (
+        b"\x01x\x03api\x03dev\x00", b"\x00\x1c",
+        b"\x00\x10\xfd\x00" + b"\x00" * 13 + b"\x05"
+    ),
+    # No IPv6 rule for this name, so no answer rather than the default.
+    (b"\x02db\x03api\x03dev\x00", b"\x00\x1c", None),
+    (b"\x02db\x03api\x03dev\x00", b"\x00\x01", b"\x00\x04\x7f\x00\x00\x01"),
+    # Nothing matches, so the default address.
+    (b"\x05local\x03dev\x00", b"\x00\x01", b"\x00\x04\x01\x02\x03\x04"),
+])
+def test_server_build_response_rules(config, name, rrtype, answer):
+    config.address = "1.2.3.4"
+    config.address6 = "fd00::1"
+    config.rules = [
+        "*.api.dev=10.0.0.5", "*.api.dev=fd00::5", "db.api.dev=127.0.0.1"
+    ]
+    server = DevNS(config)
+    query = b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00" + name
+    response = server._build_response(query + rrtype + b"\x00\x01")
+    if answer is None:
+        assert response[6:8] == b"\x00\x00"
+    else:
+        assert response[6:8] == b"\x00\x01"
+        assert response.endswith(answer)
+
+
+def _question(name, rrtype=1, opt=False):
+    labels = b"".join(
+        bytes(bytearray([len(label)])) + label.encode("ascii")
+        for label in name.split(".")
+    )
+    return b"".join((
+        b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00",
+        b"\x01" if opt else b"\x00", labels, b"\x00",
+        struct.pack("!HH", rrtype, 1), _opt() if opt else b"",
+    ))
+
+
+@pytest.mark.parametrize((
+    "domains, name, rrtype, rcode, aa, answer, authority"
+), [
+    (("dev", ), "test.local.dev", 1, 0, 1, 1, 0),
+    (("dev", ), "Test.LOCAL.Dev", 1, 0, 1, 1, 0),
+    # Types we have nothing for are NODATA, with the SOA to cache that by.
+    (("dev", ), "test.local.dev", 15, 0, 1, 0, 1),
+    (("dev", ), "test.local.dev", 6, 0, 1, 0, 1),
+    (("dev", ), "dev", 6, 0, 1, 1, 0),
+    (("dev", ), "dev", 255, 0, 1, 3, 0),
+    (("dev", "local.co"), "local.co", 6, 0, 1, 1, 0),
+    (("dev", ), "example.com", 1, 5, 0, 0, 0),
+    (("dev", ), "devx", 1, 5, 0, 0, 0),
+    # No domains is all of them.
+    ((), "example.com", 1, 0, 1, 1, 0),
+])
+def test_server_build_response_zones(config, domains, name, rrtype, rcode,
+                                     aa, answer, authority):
+    config.address = "1.2.3.4"
+    config.address6 = "fd00::1"
+    config.domains = domains
+    server = DevNS(config)
+    for opt in (False, True):
+        response = server._build_response(_question(name, rrtype, opt))
+        header = Header.from_bytes(response)
+        assert (header.rcode, header.aa) == (rcode, aa)
+        assert (header.answer, header.authority) == (answer, authority)
+        assert header.additional == int(opt)
+
+
+def test_server_build_response_longest_zone(config):
+    config.address = "1.2.3.4"
+    config.domains = ("dev", "local.dev")
+    server = DevNS(config)
+    response = server._build_response(_question("test.local.dev", 15))
+    assert Header.from_bytes(response).authority == 1
+    # The SOA is for local.dev, which the question spelled out already.
+    assert response[32:34] == b"\xc0\x11"
+
+
+@pytest.mark.parametrize("domains, name, zone", [
+    (("dev", "local.dev"), "test.LOCAL.dev", ("local", "dev")),
+    (("dev", "local.dev"), "TEST.Local.DEV", ("local", "dev")),
+    (("dev", "sub.dev"), "web.SUB.dev", ("sub", "dev")),
+    (("DEV", "Sub.Dev"), "web.sub.dev", ("sub", "dev")),
+    (("dev", "sub.dev"), "web.Dev", ("dev", )),
+])
+def test_server_build_response_zone_case(config, domains, name, zone):
+    config.address = "1.2.3.4"
+    config.domains = domains
+    server = DevNS(config)
+    query = _question(name, 15)
+    response = server._build_response(query)
+    # NODATA, so the SOA of the zone it's from follows the question.
+    authority = Query.from_bytes(response, len(query))
+    assert (authority.rrtype, authority.labels) == (6, zone)
+
+
+@pytest.mark.parametrize("name, rrtype, rcode, answer, authority", [
+    ("db.api.dev", 1, 0, 1, 0),
+    ("x.db.api.dev", 1, 0, 1, 0),
+    # Nothing but the rules exists...
+    ("web.dev", 1, 3, 0, 1),
+    ("web.api.dev", 28, 3, 0, 1),
+    # ...and the names they're under.
+    ("api.dev", 1, 0, 0, 1),
+    ("dev", 1, 0, 0, 1),
+    ("dev", 6, 0, 1, 0),
+])
+def test_server_build_response_no_wildcard(config, name, rrtype, rcode,
+                                           answer, authority):
+    config.address = "1.2.3.4"
+    config.wildcard = False
+    config.rules = ["db.api.dev=10.0.0.5", "*.db.api.dev=10.0.0.6"]
+    server = DevNS(config)
+    with patch.object(server, "_discover_address") as discover:
+        for _ in range(2):
+            # Cached or not, the rcode and flags stay the same.
+            response = server._build_response(_question(name, rrtype))
+            header = Header.from_bytes(response)
+            assert (header.rcode, header.aa) == (rcode, 1)
+            assert (header.answer, header.authority) == (answer, authority)
+        discover.assert_not_called()
+
+
+@pytest.mark.parametrize("name, rcode, answer", [
+    ("a.b.dev", 0, 1),
+    # Above a name in the file, so it exists, with nothing of its own...
+    ("b.dev", 0, 0),
+    ("B.Dev", 0, 0),
+    # ...unlike the names beside and below it.
+    ("c.dev", 3, 0),
+    ("x.a.b.dev", 3, 0),
+])
+def test_server_hosts_file_no_wildcard(config, tmpdir, name, rcode, answer):
+    hosts = tmpdir.join("hosts")
+    hosts.write("10.0.0.7 a.b.dev\n")
+    config.wildcard = False
+    config.hosts_file = str(hosts)
+    server = DevNS(config)
+    server._hosts.reload()
+    header = Header.from_bytes(server._build_response(_question(name)))
+    assert (header.rcode, header.answer, header.authority) == (
+        rcode, answer, 1 - answer
+    )
+
+
+def test_server_hosts_file(config, tmpdir):
+    import time
+
+    hosts = tmpdir.join("hosts")
+    hosts.write("10.0.0.7 web.dev api.dev\nfd00::7 web.dev\n")
+    config.address = "1.2.3.4"
+    config.hosts_file = str(hosts)
+    config.rules = ["api.dev=10.0.0.5"]
+    server = DevNS(config)
+    with server._watch_hosts() as refresher:
+        assert refresher is not None
+        deadline = time.time() + 5
+        while not len(server._hosts) and time.time() < deadline:
+            time.sleep(0.01)
+    assert not refresher._thread.is_alive()
+    answer = server._build_response(_question("web.dev"))
+    assert answer.endswith(b"\x0a\x00\x00\x07")
+    answer = server._build_response(_question("web.dev", 28))
+    assert answer.endswith(b"\xfd\x00" + b"\x00" * 13 + b"\x07")
+    # Rules come first, then the hosts file, then the default.
+    answer = server._build_response(_question("api.dev"))
+    assert answer.endswith(b"\x0a\x00\x00\x05")
+    answer = server._build_response(_question("other.dev"))
+    assert answer.endswith(b"\x01\x02\x03\x04")
+
+
+@pytest.mark.parametrize("name, rrtype, rcode, answer, authority", [
+    ("db.local.co", 1, 0, 1, 0),
+    ("DB.Local.co", 1, 0, 1, 0),
+    ("web.local.co", 1, 0, 1, 0),
+    # Only the names themselves, with an SOA of their own for NODATA.
+    ("db.local.co", 28, 0, 0, 1),
+    ("db.local.co", 6, 0, 1, 0),
+    ("x.db.local.co", 1, 5, 0, 0),
+    ("local.co", 1, 5, 0, 0),
+])
+def test_server_names_outside_domains(config, tmpdir, name, rrtype, rcode,
+                                      answer, authority):
+    hosts = tmpdir.join("hosts")
+    hosts.write("10.0.0.7 web.local.co\n")
+    config.address = "1.2.3.4"
+    config.domains = ("dev", )
+    config.rules = ["db.local.co=127.0.0.1"]
+    config.hosts_file = str(hosts)
+    server = DevNS(config)
+    server._hosts.reload()
+    for _ in range(2):
+        response = server._build_response(_question(name, rrtype))
+        header = Header.from_bytes(response)
+        assert (header.rcode, header.aa) == (rcode, int(not rcode))
+        assert (header.answer, header.authority) == (answer, authority)
+    if authority:
+        soa = Query.from_bytes(response, len(_question(name, rrtype)))
+        assert soa.labels == ("db", "local", "co")
+
+
+def test_server_rules_outside_domains_warning(config, caplog):
+    config.domains = ("dev", "local.co")
+    config.rules = [
+        "db.local.dev=127.0.0.1", "*.api.local.co=10.0.0.5", "*.co=10.0.0.6",
+        "db.example.com=10.0.0.7",
+    ]
+    server = DevNS(config)
+    caplog.set_level(logging.WARNING, logger="devns.server")
+    server._check_rules()
+    warned = [
+        record.getMessage() for record in caplog.records
+        if record.levelno == logging.WARNING
+    ]
+    assert len(warned) == 2
+    assert warned[0].startswith("*.co=10.0.0.6 is outside")
+    assert warned[1].startswith("db.example.com=10.0.0.7 is outside")
+
+
+def test_server_no_hosts_file(config, server):
+    assert server._hosts is None
+    with server._watch_hosts() as refresher:
+        assert refresher is None
+
+
+ZONE = """\
+$ORIGIN local.dev.
+$TTL 300
+@       SOA ns hostmaster 7 3600 600 86400 30
+        NS  ns
+ns      A   10.0.0.1
+web     A   10.0.0.2
+www     CNAME web
+*.apps  A   10.0.0.3
+"""
+
+
+@pytest.mark.parametrize("name, rrtype, rcode, answer, authority, end", [
+    ("web.local.dev", 1, 0, 1, 0, b"\x0a\x00\x00\x02"),
+    ("www.local.dev", 1, 0, 2, 0, b"\x0a\x00\x00\x02"),
+    ("x.apps.local.dev", 1, 0, 1, 0, b"\x0a\x00\x00\x03"),
+    # The zone's own SOA, not one made up.
+    ("web.local.dev", 28, 0, 0, 1, b"\x00\x00\x00\x1e"),
+    ("nope.local.dev", 1, 3, 0, 1, b"\x00\x00\x00\x1e"),
+    ("local.dev", 6, 0, 1, 0, b"\x00\x00\x00\x1e"),
+    ("local.dev", 2, 0, 1, 0, b"\x02ns\xc0\x0c"),
+    # Rules still win, and the rest of .dev gets the default.
+    ("db.local.dev", 1, 0, 1, 0, b"\x0a\x00\x00\x05"),
+    ("other.dev", 1, 0, 1, 0, b"\x01\x02\x03\x04"),
+])
+def test_server_zone_files(config, tmpdir, name, rrtype, rcode, answer,
+                           authority, end):
+    zone = tmpdir.join("local.dev.zone")
+    zone.write(ZONE)
+    config.address = "1.2.3.4"
+    config.zone_files = [str(zone)]
+    config.rules = ["db.local.dev=10.0.0.5"]
+    server = DevNS(config)
+    assert server._load_zone_files()
+    for _ in range(2):
+        response = server._build_response(_question(name, rrtype))
+        header = Header.from_bytes(response)
+        assert (header.rcode, header.aa) == (rcode, 1)
+        assert (header.answer, header.authority) == (answer, authority)
+        assert response.endswith(end)
+
+
+def test_server_malformed_after_logging(config, caplog):
+
+    config.address = "1.2.3.4"
+    config.rules = ["secret.dev=10.1.1.1"]
+    server = DevNS(config)
+    caplog.set_level(logging.INFO, logger="devns.server")
+    response = server._build_response(_question("secret.dev"))
+    assert response.endswith(b"\x0a\x01\x01\x01")
+    # Logging the request decodes it, and logging swallows the error, but
+    # the pooled request mustn't keep the last one's question.
+    truncated = _question("secret.dev")[:-6]
+    truncated = b"\x00\x02" + truncated[2:]
+    response = server._build_response(truncated)
+    assert response[:4] == b"\x00\x02\x80\x01"
+    assert len(response) == 12
+
+
+def test_server_cached_truncated(config, tmpdir):
+    zone = tmpdir.join("local.dev.zone")
+    zone.write(ZONE + "".join(
+        'big TXT "%s"\n' % (chr(ord("a") + index) * 200)
+        for index in range(3)
+    ))
+    config.zone_files = [str(zone)]
+    server = DevNS(config)
+    assert server._load_zone_files()
+    for rd in (1, 0, 1):
+        query = bytearray(_question("big.local.dev", 16))
+        query[2] = rd
+        response = server._build_response(bytes(query))
+        header = Header.from_bytes(response)
+        # Cached or not, it's still truncated, so clients retry over TCP.
+        assert (header.tc, header.rd, header.ra) == (1, rd, rd)
+        assert len(response) <= 512
+
+
+def test_server_zone_files_outside_domains(config, tmpdir):
+    zone = tmpdir.join("example.test.zone")
+    zone.write(ZONE.replace("local.dev.", "example.test."))
+    config.zone_files = [str(zone)]
+    server = DevNS(config)
+    assert server._load_zone_files()
+    response = server._build_response(_question("web.example.test"))
+    assert Header.from_bytes(response).rcode == 0
+    assert response.endswith(b"\x0a\x00\x00\x02")
+
+
+@pytest.mark.parametrize("text", [None, "web A 10.0.0.1\n"])
+def test_server_zone_files_invalid(config, server, tmpdir, text):
+    zone = tmpdir.join("local.dev.zone")
+    if text is not None:
+        zone.write(text)
+    config.zone_files = [str(zone)]
+    with patch.object(server, "bind") as bind:
+        assert server.run() == 5
+    bind.assert_not_called()
+
+
+def _forwarded(data):
+    from devns.dns import Request, Response
+
+    request = Request.from_bytes(data)
+    request.header.qr = request.header.ra = 1
+    return [Response(
+        request.header, request.query, address="10.9.8.7", opt=request.opt
+    ).to_bytes()]
+
+
+@pytest.mark.parametrize("opt", (False, True))
+def test_server_forward(config, upstream, opt):
+    standin = upstream(_forwarded)
+    config.address = "1.2.3.4"
+    config.upstreams = [standin.upstream]
+    server = DevNS(config)
+    with server._forwarding() as forwarder:
+        assert len(forwarder._pools[socket.AF_INET]) == 8
+        response = server._build_response(_question("example.com", 1, opt))
+        header = Header.from_bytes(response)
+        assert (header.id, header.rcode, header.aa, header.ra) == (
+            0x1234, 0, 0, 1
+        )
+        assert header.additional == int(opt)
+        # Names we answer for never go upstream.
+        response = server._build_response(_question("web.dev"))
+        assert response.endswith(b"\x01\x02\x03\x04")
+    assert len(forwarder._pools[socket.AF_INET]) == 0
+    assert len(standin.queries) == 1
+    # Not the client's ID, and only the EDNS we'd pass on.
+    sent = Header.from_bytes(standin.queries[0])
+    assert (sent.rd, sent.query, sent.additional) == (1, 1, int(opt))
+
+
+def test_server_forward_no_answer(config, upstream):
+    standin = upstream(lambda data: [])
+    config.upstreams = [standin.upstream]
+    config.upstream_timeout = 0.1
+    server = DevNS(config)
+    with server._forwarding():
+        response = server._build_response(_question("example.com", 1, True))
+    header = Header.from_bytes(response)
+    assert (header.id, header.rcode, header.answer) == (0x1234, 2, 0)
+    assert header.additional == 1
+
+
+@pytest.mark.parametrize("answered", [True, False])
+def test_server_forward_reply(config, upstream, answered):
+    standin = upstream(_forwarded if answered else lambda data: [])
+    config.address = "1.2.3.4"
+    config.upstreams = [standin.upstream]
+    config.upstream_timeout = 0.1
+    server = DevNS(config)
+    replies = []
+    done = threading.Event()
+
+    def reply(response):
+        replies.append(response)
+        done.set()
+
+    with server._forwarding():
+        # Nothing to send yet, the response comes later.
+        assert server._build_response(
+            _question("example.com"), reply=reply
+        ) is None
+        assert done.wait(5)
+    header = Header.from_bytes(replies[0])
+    assert (header.id, header.rcode) == (0x1234, 0 if answered else 2)
+    # Answered here, it doesn't wait.
+    response = server._build_response(_question("web.dev"), reply=reply)
+    assert response.endswith(b"\x01\x02\x03\x04")
+    assert len(replies) == 1
+
+
+@patch("devns.server.forward.available", return_value=False)
+def test_server_forward_unavailable(available, config, server):
+    config.upstreams = ["10.0.0.1"]
+    assert DevNS(config)._forwarder is None
+
+
+def test_server_no_forwarding(config, server):
+    assert server._forwarder is None
+    with server._forwarding() as forwarder:
+        assert forwarder is None
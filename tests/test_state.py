@@ -0,0 +1,44 @@
+import os
+import json
+import pytest
+
+from mock import patch
+
+from devns import state
+
+
+def test_state_roundtrip(tmpdir):
+    path = str(tmpdir.join("nested", "state.json"))
+    assert state.save(path, dict(address="10.0.0.1", address6=None))
+    assert state.load(path) == dict(
+        address="10.0.0.1", address6=None, version=state.VERSION
+    )
+    # Nothing half-written is left lying around.
+    assert os.listdir(os.path.dirname(path)) == ["state.json"]
+
+
+@pytest.mark.parametrize("content", [
+    None, "", "{not json", "[1, 2]", json.dumps(dict(version=0)),
+])
+def test_state_load_unusable(tmpdir, content):
+    path = tmpdir.join("state.json")
+    if content is not None:
+        path.write(content)
+    assert state.load(str(path)) is None
+
+
+def test_state_save_failure(tmpdir):
+    path = str(tmpdir.join("state.json"))
+    with patch("devns.state.json.dump", side_effect=TypeError("nope")):
+        assert not state.save(path, dict(address=object()))
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_state_fingerprint():
+    assert state.fingerprint() == state.fingerprint()
+    with patch("devns.state.socket.if_nameindex", create=True) as names:
+        names.return_value = [(2, "eth0"), (1, "lo")]
+        with patch("devns.state.socket.gethostname", return_value="box"):
+            assert state.fingerprint() == "box 1:lo 2:eth0"
+            names.side_effect = OSError
+            assert state.fingerprint() == "box "
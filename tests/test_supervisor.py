@@ -0,0 +1,109 @@
+import signal
+import pytest
+
+from mock import patch, MagicMock
+
+from devns import supervisor as _supervisor
+from devns.supervisor import Supervisor, Shutdown
+
+
+@pytest.fixture
+def server():
+    return MagicMock(**{"_work.return_value": 0})
+
+
+@patch("devns.supervisor.os.fork", side_effect=[101, 102, 103])
+def test_supervisor_start(fork, server):
+    supervisor = Supervisor(server, 3)
+    supervisor.start()
+    assert sorted(supervisor.workers) == [101, 102, 103]
+    assert [supervisor.workers[pid][0] for pid in (101, 102, 103)] == [
+        0, 1, 2
+    ]
+
+
+@pytest.mark.parametrize("code, status", [(0, 0), (2, 2), (None, 0)])
+@patch("devns.supervisor.os._exit", side_effect=SystemExit)
+@patch("devns.supervisor.os.fork", return_value=0)
+def test_supervisor_spawn_child(fork, _exit, server, code, status):
+    server._work.return_value = code
+    with patch("devns.supervisor.signal.signal"):
+        pytest.raises(SystemExit, Supervisor(server, 1).spawn, 0)
+    server._work.assert_called_once_with()
+    _exit.assert_called_once_with(status)
+
+
+@patch("devns.supervisor.os._exit", side_effect=SystemExit)
+@patch("devns.supervisor.os.fork", return_value=0)
+def test_supervisor_spawn_child_crash(fork, _exit, server):
+    server._work.side_effect = ValueError
+    with patch("devns.supervisor.signal.signal"):
+        pytest.raises(SystemExit, Supervisor(server, 1).spawn, 0)
+    _exit.assert_called_once_with(1)
+
+
+@pytest.mark.parametrize("cpus, index, expected", [
+    ([0, 1, 2, 3], 1, 1),
+    ([2, 5], 3, 5),
+])
+@patch("devns.supervisor.signal.signal")
+def test_supervisor_pin(signal_mock, server, cpus, index, expected):
+    with patch.object(_supervisor, "_cpus", return_value=cpus):
+        supervisor = Supervisor(server, 4, pin=True)
+    with patch("devns.supervisor.os.sched_setaffinity", create=True) as pin:
+        assert supervisor._work(index) == 0
+    pin.assert_called_once_with(0, (expected, ))
+
+
+@patch("devns.supervisor.signal.signal")
+def test_supervisor_pin_unsupported(signal_mock, server):
+    with patch.object(_supervisor, "_cpus", return_value=None):
+        supervisor = Supervisor(server, 2, pin=True)
+    with patch("devns.supervisor.os.sched_setaffinity", create=True) as pin:
+        supervisor._work(0)
+    assert not pin.called
+
+
+@pytest.mark.parametrize("interrupt", (KeyboardInterrupt, Shutdown))
+@patch("devns.supervisor.time.sleep")
+@patch("devns.supervisor.os.kill")
+@patch("devns.supervisor.os.fork", side_effect=[101, 102, 103])
+def test_supervisor_run(fork, kill, sleep, server, interrupt):
+    supervisor = Supervisor(server, 2)
+    supervisor.start()
+    waits = [(101, 256), (999, 0), interrupt, (102, 15), (103, 15)]
+
+    def wait():
+        result = waits.pop(0)
+        if not isinstance(result, tuple):
+            raise result
+        return result
+
+    with patch("devns.supervisor.os.wait", side_effect=wait):
+        assert supervisor.run() == 0
+    assert fork.call_count == 3
+    assert sleep.called
+    assert sorted(call[0] for call in kill.call_args_list) == [
+        (102, signal.SIGTERM), (103, signal.SIGTERM)
+    ]
+    assert supervisor.workers == {}
+    assert signal.getsignal(signal.SIGTERM) is not _supervisor._shutdown
+
+
+@pytest.mark.parametrize("status, expected", [
+    (0, "exited with status 0"),
+    (256, "exited with status 1"),
+    (9, "was killed by signal 9"),
+    (15 | 0x80, "was killed by signal 15"),  # and dumped core
+])
+def test_supervisor_exited(status, expected):
+    assert _supervisor._exited(status) == expected
+
+
+@patch("devns.supervisor.os.wait", side_effect=OSError(10, "ECHILD"))
+@patch("devns.supervisor.os.kill", side_effect=OSError(3, "ESRCH"))
+def test_supervisor_stop_gone(kill, wait, server):
+    supervisor = Supervisor(server, 1)
+    supervisor.workers[101] = (0, 0)
+    supervisor.stop()
+    assert supervisor.workers == {}
@@ -0,0 +1,187 @@
+import time
+import socket
+import struct
+import pytest
+import threading
+
+from mock import MagicMock
+
+from devns import tcp
+from devns.tcp import TCPConnection, TCPListener
+
+pytestmark = pytest.mark.skipif(
+    not tcp.available(), reason="selectors is unavailable"
+)
+
+
+def framed(*messages):
+    return b"".join(struct.pack("!H", len(m)) + m for m in messages)
+
+
+def read_message(client):
+    length = struct.unpack("!H", recv_exactly(client, 2))[0]
+    return recv_exactly(client, length)
+
+
+def recv_exactly(client, size):
+    data = b""
+    while len(data) < size:
+        chunk = client.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+@pytest.mark.parametrize("chunks, expected", [
+    ([framed(b"one")], [[b"one"]]),
+    ([framed(b"one", b"two")], [[b"one", b"two"]]),
+    ([b"\x00", b"\x03o", b"ne\x00"], [[], [], [b"one"]]),
+    ([framed(b"one") + b"\x00\x03t", b"wo"], [[b"one"], [b"two"]]),
+    ([framed(b"")], [[b""]]),
+])
+def test_connection_feed(chunks, expected):
+    connection = TCPConnection(None, None)
+    assert [connection.feed(chunk) for chunk in chunks] == expected
+
+
+def test_connection_flush_partial():
+    sock = MagicMock()
+    sock.send.side_effect = [
+        2, socket.error(11, "EAGAIN"), 3, 2
+    ]
+    connection = TCPConnection(sock, None)
+    connection.queue(b"hello")
+    assert connection.pending == 7
+    assert not connection.flush()
+    assert connection.pending == 5
+    assert connection.flush()
+    assert connection.pending == 0
+
+
+@pytest.yield_fixture
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(8)
+    handler = MagicMock(
+        side_effect=lambda message, reply: message[::-1] or None
+    )
+    listener = TCPListener(sock, handler, max_connections=2, idle_timeout=5)
+    listener.start()
+    yield listener
+    listener.stop(5)
+
+
+def connect(listener):
+    client = socket.create_connection(listener.sock.getsockname(), 1)
+    client.settimeout(2)
+    return client
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+def test_listener_pipelined(listener):
+    client = connect(listener)
+    client.sendall(framed(b"abc", b"", b"hello") + b"\x00")
+    assert read_message(client) == b"cba"
+    assert read_message(client) == b"olleh"
+    client.sendall(b"\x02xy")
+    assert read_message(client) == b"yx"
+    client.close()
+
+
+def test_listener_deferred_reply(listener):
+    def handle(message, reply):
+        if message != b"slow":
+            return message[::-1]
+        # Answered from another thread once the fast one went out.
+        timer = threading.Timer(0.1, reply, (b"wols", ))
+        timer.start()
+
+    listener.handler.side_effect = handle
+    client = connect(listener)
+    client.sendall(framed(b"slow", b"fast"))
+    assert read_message(client) == b"tsaf"
+    assert read_message(client) == b"wols"
+    client.close()
+
+
+def test_listener_reply_after_close(listener):
+    replies = []
+    listener.handler.side_effect = lambda message, reply: replies.append(reply)
+    client = connect(listener)
+    client.sendall(framed(b"q"))
+    wait_for(lambda: replies)
+    client.close()
+    wait_for(lambda: len(listener) == 0)
+    replies[0](b"too late")
+    client = connect(listener)
+    listener.handler.side_effect = lambda message, reply: message[::-1]
+    client.sendall(framed(b"ab"))
+    assert read_message(client) == b"ba"
+    client.close()
+
+
+def test_listener_handler_errors(listener):
+    listener.handler.side_effect = [ValueError, b"ok"]
+    client = connect(listener)
+    client.sendall(framed(b"bad", b"good"))
+    assert read_message(client) == b"ok"
+    client.close()
+
+
+def test_listener_large_response(listener):
+    listener.handler.side_effect = lambda message, reply: b"x" * 65535
+    client = connect(listener)
+    client.sendall(framed(*[b"q"] * 8))
+    for _ in range(8):
+        assert read_message(client) == b"x" * 65535
+    client.close()
+
+
+def test_listener_connection_cap(listener):
+    clients = [connect(listener) for _ in range(2)]
+    wait_for(lambda: len(listener) == 2)
+    refused = connect(listener)
+    assert refused.recv(1) == b""
+    for client in clients:
+        client.sendall(framed(b"ab"))
+        assert read_message(client) == b"ba"
+        client.close()
+    refused.close()
+
+
+def test_listener_closed_by_client(listener):
+    client = connect(listener)
+    wait_for(lambda: len(listener) == 1)
+    client.close()
+    wait_for(lambda: len(listener) == 0)
+
+
+def test_listener_idle_timeout(listener):
+    listener.idle_timeout = 0.05
+    client = connect(listener)
+    assert client.recv(1) == b""
+    assert len(listener) == 0
+    client.close()
+
+
+def test_listener_expire_and_timeout():
+    listener = TCPListener(MagicMock(), MagicMock(), idle_timeout=10)
+    listener.selector = MagicMock()
+    assert listener.timeout() is None
+    connection = TCPConnection(MagicMock(), ("127.0.0.1", 5000))
+    connection.last_active = 100
+    listener.connections[connection.sock] = connection
+    assert listener.timeout(now=104) == 6
+    listener.expire(now=105)
+    assert len(listener) == 1
+    listener.expire(now=110)
+    assert len(listener) == 0
+    assert connection.sock.close.called
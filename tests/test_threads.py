@@ -0,0 +1,148 @@
+import time
+import socket
+import threading
+import pytest
+
+from mock import MagicMock
+
+from devns.threads import AdaptiveThreadPool, OrderedWriter
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline
+        time.sleep(0.005)
+
+
+def test_ordered_writer_in_order():
+    send = MagicMock()
+    writer = OrderedWriter(send)
+    writer.write(writer.reserve("a"), b"zero", "a")
+    writer.write(writer.reserve("b"), b"one", "b")
+    assert [call[0] for call in send.call_args_list] == [
+        (b"zero", "a"), (b"one", "b")
+    ]
+    assert not writer._clients
+
+
+def test_ordered_writer_holds_back_until_gap_fills():
+    send = MagicMock()
+    writer = OrderedWriter(send)
+    assert [writer.reserve("a") for _ in range(3)] == [0, 1, 2]
+    writer.write(2, b"two", "a")
+    writer.write(1, None, "a")
+    assert not send.called
+    assert len(writer) == 2
+    writer.write(0, b"zero", "a")
+    assert [call[0] for call in send.call_args_list] == [
+        (b"zero", "a"), (b"two", "a")
+    ]
+    assert len(writer) == 0
+
+
+def test_ordered_writer_clients_dont_wait_on_each_other():
+    send = MagicMock()
+    writer = OrderedWriter(send)
+    slow = writer.reserve("a")
+    writer.write(writer.reserve("b"), b"fast", "b")
+    writer.write(writer.reserve("a"), b"later", "a")
+    assert [call[0] for call in send.call_args_list] == [(b"fast", "b")]
+    writer.write(slow, b"slow", "a")
+    assert [call[0] for call in send.call_args_list] == [
+        (b"fast", "b"), (b"slow", "a"), (b"later", "a")
+    ]
+
+
+def test_ordered_writer_survives_send_errors():
+    send = MagicMock(side_effect=[socket.error, None])
+    writer = OrderedWriter(send)
+    writer.write(writer.reserve("a"), b"zero", "a")
+    writer.write(writer.reserve("a"), b"one", "a")
+    assert send.call_count == 2
+
+
+def test_pool_answers_in_order():
+    sent = []
+    writer = OrderedWriter(lambda response, client: sent.append(response))
+
+    def handler_factory():
+        def handle(data, client):
+            # Later requests finish first.
+            time.sleep(0.001 * (20 - int(data)))
+            return data
+        return handle
+
+    pool = AdaptiveThreadPool(handler_factory, writer, 2, 8)
+    pool.start()
+    for index in range(20):
+        pool.submit(b"%d" % index, None)
+    pool.stop(5)
+    assert sent == [b"%d" % index for index in range(20)]
+
+
+def test_pool_is_lossless_through_errors():
+    sent = []
+    writer = OrderedWriter(lambda response, client: sent.append(response))
+
+    def handle(data, client):
+        if data == b"bad":
+            raise ValueError
+        return data
+
+    pool = AdaptiveThreadPool(lambda: handle, writer, 1, 2, backlog=2)
+    pool.start()
+    for data in (b"a", b"bad", b"b", b"c", b"d", b"e"):
+        pool.submit(data, None)
+    pool.stop(5)
+    assert sent == [b"a", b"b", b"c", b"d", b"e"]
+    assert len(writer) == 0
+
+
+def test_pool_slow_request_holds_up_no_one_else():
+    sent = []
+    release = threading.Event()
+    writer = OrderedWriter(lambda response, client: sent.append(response))
+
+    def handle(data, client):
+        if data == b"slow":
+            release.wait(5)
+        return data
+
+    pool = AdaptiveThreadPool(lambda: handle, writer, 2, 4)
+    pool.start()
+    pool.submit(b"slow", "a")
+    for index, client in enumerate("bcd"):
+        pool.submit(b"%d" % index, client)
+    wait_for(lambda: len(sent) == 3)
+    assert sorted(sent) == [b"0", b"1", b"2"]
+    release.set()
+    pool.stop(5)
+    assert sent[-1] == b"slow"
+
+
+def test_pool_grows_and_shrinks():
+    release = threading.Event()
+    writer = OrderedWriter(MagicMock())
+    factory = MagicMock(return_value=lambda data: release.wait(5))
+    pool = AdaptiveThreadPool(factory, writer, 1, 4, idle_timeout=0.05)
+    pool.start()
+    assert len(pool) == 1
+    for index in range(10):
+        pool.submit(b"%d" % index, None)
+    assert len(pool) == 4
+    release.set()
+    wait_for(lambda: len(pool) == 1)
+    wait_for(lambda: factory.call_count == 4)
+    pool.stop(5)
+    assert len(pool) == 0
+
+
+@pytest.mark.parametrize("min_threads, max_threads, expected", [
+    (0, 0, (1, 1)),
+    (4, 2, (4, 4)),
+    (2, 8, (2, 8)),
+])
+def test_pool_bounds(min_threads, max_threads, expected):
+    pool = AdaptiveThreadPool(MagicMock(), MagicMock(), min_threads, max_threads)
+    assert (pool.min_threads, pool.max_threads) == expected
@@ -0,0 +1,32 @@
+import pytest
+import threading
+
+from devns.wakeup import Waker
+
+selectors = pytest.importorskip("selectors")
+
+
+def test_waker_wakes_selector():
+    waker = Waker()
+    selector = selectors.DefaultSelector()
+    selector.register(waker, selectors.EVENT_READ)
+    try:
+        assert selector.select(0) == []
+        thread = threading.Thread(target=waker.wake)
+        thread.start()
+        assert len(selector.select(5)) == 1
+        thread.join()
+        # However many times it was woken, draining puts it back to sleep.
+        waker.wake()
+        waker.drain()
+        assert selector.select(0) == []
+    finally:
+        selector.close()
+        waker.close()
+
+
+def test_waker_closed():
+    waker = Waker()
+    waker.close()
+    waker.wake()
+    waker.drain()
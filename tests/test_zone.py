@@ -0,0 +1,198 @@
+import pytest
+
+from devns.dns import DNS, Query
+from devns.zone import Zone, ZoneError, _split
+
+
+ZONE = """\
+$ORIGIN local.dev.
+$TTL 1h
+@       IN  SOA ns hostmaster (
+                2024010101 ; serial
+                3600 600 86400 300 )
+        IN  NS  ns
+ns          A   10.0.0.1
+web     300 IN  A   10.0.0.2
+            AAAA    fd00::2
+Alias       CNAME   web
+loop        CNAME   loop
+away        CNAME   example.com.
+*.apps      A   10.0.0.3
+deep.a.b    A   10.0.0.4
+txt         TXT "hello world" "a\\;b" plain
+_sip._tcp   SRV 10 5 5060 sip.local.dev.
+outside.other. A 10.0.0.5
+"""
+
+
+@pytest.fixture
+def path(tmpdir):
+    return tmpdir.join("local.dev.zone")
+
+
+@pytest.fixture
+def zone(path):
+    path.write(ZONE)
+    return Zone.load(str(path))
+
+
+def answers(zone, name, rrtype=DNS.RRType.A):
+    return [
+        (".".join(record.labels), record.rrtype, record.ttl, record.rdata)
+        for record in zone.answers(Query(rrtype, tuple(name.split("."))))
+    ]
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("web 300 IN A 10.0.0.2\n", (["web", "300", "IN", "A", "10.0.0.2"], 0)),
+    ("web A 10.0.0.2 ; comment", (["web", "A", "10.0.0.2"], 0)),
+    ('t TXT "a b" c\\ d', (["t", "TXT", '"a b"', "c\\ d"], 0)),
+    ('t TXT "a;b"', (["t", "TXT", '"a;b"'], 0)),
+    ("@ SOA ns hm ( 1 2", (["@", "SOA", "ns", "hm", "1", "2"], 1)),
+    ("  3 4 5 )", (["3", "4", "5"], -1)),
+    ('t TXT "a \\" (b)" (c)', (["t", "TXT", '"a \\" (b)"', "c"], 0)),
+    ('t TXT x"y"', (["t", "TXT", "x", '"y"'], 0)),
+])
+def test_zone_split(line, expected):
+    assert _split(line) == expected
+
+
+@pytest.mark.parametrize("line", ['t TXT "open', 't TXT "open\\"'])
+def test_zone_split_unterminated(line):
+    with pytest.raises(ValueError):
+        _split(line)
+
+
+def test_zone_load(zone):
+    assert zone.origin == ("local", "dev")
+    assert zone.soa.ttl == 3600
+    # Everything but the record outside the zone.
+    assert len(zone) == 12
+
+
+@pytest.mark.parametrize("name, rrtype, expected", [
+    ("web.local.dev", DNS.RRType.A, [
+        ("web.local.dev", DNS.RRType.A, 300, b"\x0a\x00\x00\x02"),
+    ]),
+    # An owner left out is the last one, and so is the TTL when $TTL is set.
+    ("Web.Local.dev", DNS.RRType.AAAA, [
+        ("Web.Local.dev", DNS.RRType.AAAA, 3600,
+         b"\xfd\x00" + b"\x00" * 13 + b"\x02"),
+    ]),
+    ("alias.local.dev", DNS.RRType.A, [
+        ("alias.local.dev", DNS.RRType.CNAME, 3600,
+         (("web", "local", "dev"), )),
+        ("web.local.dev", DNS.RRType.A, 300, b"\x0a\x00\x00\x02"),
+    ]),
+    ("away.local.dev", DNS.RRType.A, [
+        ("away.local.dev", DNS.RRType.CNAME, 3600, (("example", "com"), )),
+    ]),
+    ("x.y.apps.local.dev", DNS.RRType.A, [
+        ("x.y.apps.local.dev", DNS.RRType.A, 3600, b"\x0a\x00\x00\x03"),
+    ]),
+    ("txt.local.dev", DNS.RRType.TXT, [
+        ("txt.local.dev", DNS.RRType.TXT, 3600,
+         b"\x0bhello world\x03a;b\x05plain"),
+    ]),
+    ("_sip._tcp.local.dev", DNS.RRType.SRV, [
+        ("_sip._tcp.local.dev", DNS.RRType.SRV, 3600,
+         b"\x00\x0a\x00\x05\x13\xc4\x03sip\x05local\x03dev\x00"),
+    ]),
+    ("local.dev", DNS.RRType.NS, [
+        ("local.dev", DNS.RRType.NS, 3600, (("ns", "local", "dev"), )),
+    ]),
+    ("web.local.dev", DNS.RRType.MX, []),
+    ("a.b.local.dev", DNS.RRType.A, []),
+    ("nope.local.dev", DNS.RRType.A, []),
+])
+def test_zone_answers(zone, name, rrtype, expected):
+    assert answers(zone, name, rrtype) == expected
+
+
+def test_zone_answers_cname_loop(zone):
+    found = answers(zone, "loop.local.dev")
+    assert len(found) == 8
+    assert set(record[1] for record in found) == set([DNS.RRType.CNAME])
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("local.dev", True),
+    ("WEB.local.dev", True),
+    # Names with nothing of their own but names below them exist too.
+    ("a.b.local.dev", True),
+    ("apps.local.dev", True),
+    ("anything.apps.local.dev", True),
+    ("nope.local.dev", False),
+    ("outside.other", False),
+])
+def test_zone_exists(zone, name, expected):
+    assert zone.exists(tuple(name.split("."))) is expected
+
+
+def test_zone_shares_names(zone):
+    web = zone._records[("web", "local", "dev")]
+    alias = zone._records[("alias", "local", "dev")][0]
+    assert alias.rdata[0] is web[0].labels
+    assert web[0].labels[1] is zone.origin[0]
+
+
+def test_zone_include(tmpdir):
+    tmpdir.join("main.zone").write(
+        "$TTL 60\n"
+        "local.dev. SOA ns.local.dev. hm.local.dev. 1 2 3 4 5\n"
+        "$INCLUDE more.zone api.local.dev.\n"
+        "web.local.dev. A 10.0.0.1\n"
+    )
+    tmpdir.join("more.zone").write("@ A 10.0.0.2\nv1 A 10.0.0.3\n")
+    zone = Zone.load(str(tmpdir.join("main.zone")))
+    assert answers(zone, "api.local.dev")[0][3] == b"\x0a\x00\x00\x02"
+    assert answers(zone, "v1.api.local.dev")[0][3] == b"\x0a\x00\x00\x03"
+    # The origin $INCLUDE gave doesn't leak back out.
+    assert answers(zone, "web.local.dev")[0][3] == b"\x0a\x00\x00\x01"
+
+
+def test_zone_soa_ttl_default(path):
+    path.write("local.dev. IN SOA ns.local.dev. hm.local.dev. 1 2 3 4 5\n"
+               "web.local.dev. A 10.0.0.1\n")
+    zone = Zone.load(str(path))
+    assert zone.soa.ttl == 5
+    assert answers(zone, "web.local.dev")[0][2] == 5
+
+
+@pytest.mark.parametrize("text, message", [
+    ("web.local.dev. 60 A 10.0.0.1\n", "No SOA record"),
+    ("@ 60 SOA ns hm 1 2 3 4 5\n", ":1: @ without an $ORIGIN"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb 60 A 10.0.0.1.1\n", ":3:"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb 60 MX 10 mail\n",
+     ":3: Unsupported record type MX"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb 60 CH A 10.0.0.1\n",
+     ":3: Only class IN"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb A 10.0.0.1\n"
+     "@ 60 SOA ns hm 1 2 3 4 5\n", ":4: More than one SOA"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm ( 1 2 3\n", ":2: Unbalanced"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3\n", ":2: SOA needs 7 fields, got 5"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5 6\n", ":2: SOA needs 7"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb 60 A 10.0.0.1 junk\n",
+     ":3: A needs 1 field, got 2"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb 60 AAAA ::1 ::2\n",
+     ":3: AAAA needs 1 field"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nweb 60 CNAME a b\n",
+     ":3: CNAME needs 1 field"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\n@ 60 NS\n", ":3: NS needs"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\n_x._tcp 60 SRV 0 0 80 a b\n",
+     ":3: SRV needs 4 fields"),
+    # Types are only looked up among the ones there are.
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nwww 60 NAME foo\n",
+     ":3: Unsupported record type NAME"),
+    ("$ORIGIN dev.\n@ 60 SOA ns hm 1 2 3 4 5\nwww 60 _a 10.0.0.1\n",
+     ":3: Unsupported record type _a"),
+    ('$ORIGIN dev.\nt 60 TXT "open\n', ":2: Unterminated"),
+    ("$ORIGIN dev.\na..b 60 A 10.0.0.1\n", ":2: Bad name"),
+    ("$GENERATE 1-2 $ A 10.0.0.$\n", ":1: Unknown directive"),
+    ("   60 A 10.0.0.1\n", ":1: No owner"),
+])
+def test_zone_invalid(path, text, message):
+    path.write(text)
+    with pytest.raises(ZoneError) as error:
+        Zone.load(str(path))
+    assert message in str(error.value)